@@ -1,16 +1,20 @@
 from flask import Flask
 from CTFd.plugins import register_plugin_assets_directory
 from CTFd.plugins.challenges import CHALLENGE_CLASSES
+from CTFd.plugins.migrations import upgrade
 
 from .challenges import ContainerChallenge
 from .models import ContainerSettingsModel
 from .utils import settings_to_dict
 from .container_manager import ContainerManager
 from .views import containers_bp
+from .solve_counts import register_listeners
 
 def load(app: Flask):
     app.db.create_all()
+    upgrade()
     CHALLENGE_CLASSES["container"] = ContainerChallenge
+    register_listeners()
     register_plugin_assets_directory(app, base_path="/plugins/containers/assets/")
 
     container_settings = settings_to_dict(ContainerSettingsModel.query.all())
@@ -0,0 +1,159 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from CTFd.models import db
+from .models import ContainerInfoModel
+from .nodes import CONNECTION_ERRORS
+from .metrics import timed, IDLE_RECLAIMED
+from .changes import remove_containers
+
+# how often the activity counters of assigned containers are sampled
+ACTIVITY_SAMPLE_INTERVAL = 60  # seconds
+
+# stats requests in flight at once across all nodes
+ACTIVITY_SAMPLE_CONCURRENCY = 16
+
+# counter growth between two samples that counts as use. background noise like arp
+# or an idle shell stays below it.
+ACTIVITY_NET_BYTES = 2048
+ACTIVITY_CPU_SECONDS = 0.05
+
+# how long before an idle container is reclaimed view_info starts warning its owner
+IDLE_WARNING_WINDOW = 300  # seconds
+
+
+def last_active_column():
+    # rows written before activity tracking count from their creation
+    return db.func.coalesce(ContainerInfoModel.last_active, ContainerInfoModel.timestamp)
+
+
+def idle_reclaim_at(container, idle_timeout: int):
+    # unix time an idle container gets reclaimed at, None when idle reclaim is off
+    if not idle_timeout:
+        return None
+    return (container.last_active or container.timestamp or 0) + idle_timeout
+
+
+class ActivityMonitor:
+    # samples network and cpu counters of assigned containers through the stats api
+    # and records the last time each one was used. containers that stay quiet for the
+    # configured idle timeout are reclaimed before they expire, renewing counts as use.
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.samples = {}  # container id -> (network bytes, cpu ns) of the last sample
+        self.executor = ThreadPoolExecutor(
+            max_workers=ACTIVITY_SAMPLE_CONCURRENCY, thread_name_prefix="container-stats"
+        )
+
+    @staticmethod
+    def sample(node, container_id: str):
+        # (network bytes, cpu ns) counters of a container, None if it can't be read.
+        # one_shot skips the second reading docker takes to fill in precpu_stats.
+        try:
+            stats = node.client.api.stats(container_id, stream=False, one_shot=True)
+        except CONNECTION_ERRORS as e:
+            node.report_failure(e)
+            return None
+        except docker.errors.DockerException:
+            return None
+
+        network = sum(
+            (interface.get("rx_bytes") or 0) + (interface.get("tx_bytes") or 0)
+            for interface in (stats.get("networks") or {}).values()
+        )
+        cpu = ((stats.get("cpu_stats") or {}).get("cpu_usage") or {}).get("total_usage") or 0
+        return network, cpu
+
+    @staticmethod
+    def is_active(previous: tuple, current: tuple) -> bool:
+        # counters restart with the container, a drop means it was restarted
+        network = current[0] - previous[0]
+        cpu = current[1] - previous[1]
+        return network < 0 or cpu < 0 or network >= ACTIVITY_NET_BYTES or cpu >= ACTIVITY_CPU_SECONDS * 1e9
+
+    @timed("activity")
+    def run(self):
+        # periodic job, samples every assigned container and reclaims the idle ones
+        idle_timeout = self.manager.get_idle_timeout()
+        if not idle_timeout:
+            with self.lock:
+                self.samples = {}
+            return
+
+        with self.manager.app.app_context():
+            rows = (
+                db.session.query(ContainerInfoModel.container_id, ContainerInfoModel.node)
+                .filter(ContainerInfoModel.port.isnot(None))
+                .all()
+            )
+
+            futures = {}
+            for container_id, name in rows:
+                node = self.manager.get_node(name)
+                if node is None:
+                    continue
+                node.ensure_connected()
+                if node.is_available():
+                    futures[container_id] = self.executor.submit(self.sample, node, container_id)
+
+            samples = {}
+            for container_id, future in futures.items():
+                sample = future.result()
+                if sample is not None:
+                    samples[container_id] = sample
+
+            with self.lock:
+                previous = self.samples
+                self.samples = samples
+
+            # containers seen for the first time get the benefit of the doubt, their
+            # activity before this process started watching is unknown
+            now = int(time.time())
+            active = [
+                container_id for container_id, sample in samples.items()
+                if container_id not in previous or self.is_active(previous[container_id], sample)
+            ]
+            if active:
+                ContainerInfoModel.query.filter(
+                    ContainerInfoModel.container_id.in_(active)
+                ).update({"last_active": now}, synchronize_session=False)
+                db.session.commit()
+
+            # only containers watched over a whole interval can be judged idle, the
+            # others may just be on a node whose stats couldn't be read
+            watched = [container_id for container_id in samples if container_id in previous]
+            self.reclaim(watched, now - idle_timeout)
+
+    def reclaim(self, container_ids: list, cutoff: int):
+        # kill the given containers that weren't used since cutoff and drop their rows
+        if not container_ids:
+            return
+
+        idle = (
+            db.session.query(ContainerInfoModel.container_id, ContainerInfoModel.node)
+            .filter(ContainerInfoModel.container_id.in_(container_ids))
+            .filter(last_active_column() < cutoff)
+            .all()
+        )
+        if not idle:
+            return
+
+        failed = set(self.manager.kill_containers(idle))
+        reclaimed = [container_id for container_id, _ in idle if container_id not in failed]
+        if not reclaimed:
+            return
+
+        remove_containers(ContainerInfoModel.container_id.in_(reclaimed))
+        db.session.commit()
+
+        with self.lock:
+            for container_id in reclaimed:
+                self.samples.pop(container_id, None)
+
+        IDLE_RECLAIMED.inc(len(reclaimed))
+        self.manager.admission.dispatch_async()
+        self.manager.notifier.notify()
@@ -0,0 +1,275 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from CTFd.models import db
+from .models import ContainerInfoModel, ContainerPoolModel
+from .metrics import timed
+
+# how often waiting requests are re-checked even if no container was released, frees
+# made by other workers or by docker itself are only noticed this way
+ADMISSION_RETRY_INTERVAL = 5  # seconds
+
+# how long a request may wait for capacity before it fails
+ADMISSION_TIMEOUT = 900  # seconds
+
+# multiple of a node's memory and cpus the limits of its containers may add up to
+DEFAULT_OVERCOMMIT = 1.0
+
+# workers admit one at a time under a cluster-wide lock, waiting up to this long for it
+ADMISSION_LOCK_KEY = "lock:admission"
+ADMISSION_LOCK_TTL = 30  # seconds
+ADMISSION_LOCK_WAIT = 2  # seconds
+
+# admitted spawns are published as reservations the other workers count, until they
+# are released or (if their worker died) expire
+RESERVATION_PREFIX = "reserve:"
+RESERVATION_TTL = 600  # seconds
+
+
+class Ticket:
+    # one spawn request waiting for (or holding) admission
+    def __init__(self, challenge_id: str, start, moved, owner=None):
+        self.id = uuid.uuid4().hex
+        self.challenge_id = challenge_id
+        self.owner = owner or {}  # container_info filter matching the requester's rows
+        self.start = start  # called with (ticket, error) once admitted or given up on
+        self.moved = moved  # called with the 1-based queue position when it changes
+        self.created = time.time()
+        self.position = None
+        self.node = None
+        self.need = (0, 0)  # (memory MB, cpus) reserved on the node until released
+
+
+class AdmissionController:
+    # admits spawns only while the cluster has room for them. committed memory and
+    # cpu per node are the limits of its live containers (from the database) plus the
+    # spawns any worker admitted that haven't been recorded there yet. requests
+    # that don't fit wait in a fifo queue: one blocked on node capacity holds back
+    # everything behind it so large challenges aren't starved by small ones, one
+    # blocked on its challenge's instance cap only holds back that challenge.
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.waiting = deque()
+        self.admitted = set()  # tickets between admission and release
+        self.dispatching = False
+        self.rerun = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="container-admission")
+
+    def submit(self, challenge_id, start, moved, owner=None) -> Ticket:
+        ticket = Ticket(str(challenge_id), start, moved, owner)
+        with self.lock:
+            self.waiting.append(ticket)
+            ticket.position = len(self.waiting)
+        self.dispatch_async()
+        return ticket
+
+    def release(self, ticket: Ticket):
+        # the admitted spawn finished, its container (if any) is in the database now
+        with self.lock:
+            self.admitted.discard(ticket)
+        try:
+            self.manager.coordinator.release(RESERVATION_PREFIX + ticket.id, self.manager.instance_id)
+        except Exception:
+            pass  # the reservation expires on its own
+        self.dispatch_async()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "waiting": len(self.waiting),
+                "admitted": len(self.admitted),
+                "oldest_wait": time.time() - self.waiting[0].created if self.waiting else 0,
+            }
+
+    def dispatch_async(self):
+        # re-check the queue on the dispatcher thread, calls made while a check is
+        # running fold into one more pass
+        with self.lock:
+            if not self.waiting:
+                return
+            self.rerun = True
+            if self.dispatching:
+                return
+            self.dispatching = True
+        self.executor.submit(self._dispatch_loop)
+
+    def _dispatch_loop(self):
+        while True:
+            with self.lock:
+                if not self.rerun:
+                    self.dispatching = False
+                    return
+                self.rerun = False
+            try:
+                with self.manager.app.app_context():
+                    self.dispatch()
+            except Exception as e:
+                print(f"[container admission] could not dispatch waiting requests: {e}")
+
+    @timed("admission")
+    def dispatch(self):
+        with self.lock:
+            if not self.waiting:
+                return
+
+        # without the lock another worker is admitting, the periodic retry comes back
+        if not self._lock():
+            return
+        try:
+            self._dispatch()
+        finally:
+            self._unlock()
+
+    def _lock(self) -> bool:
+        # take the cluster-wide admission lock. with the coordination backend down every
+        # worker admits on its own view, as a single worker would.
+        coordinator = self.manager.coordinator
+        deadline = time.time() + ADMISSION_LOCK_WAIT
+        while True:
+            try:
+                if coordinator.claim(ADMISSION_LOCK_KEY, self.manager.instance_id, ttl=ADMISSION_LOCK_TTL):
+                    return True
+            except Exception as e:
+                print(f"[container admission] admitting without the cluster lock: {e}")
+                return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def _unlock(self):
+        try:
+            self.manager.coordinator.release(ADMISSION_LOCK_KEY, self.manager.instance_id)
+        except Exception:
+            pass  # the lock expires on its own
+
+    def _shared_reservations(self) -> dict:
+        # reservations published by every worker, reservation key -> (node, memory MB,
+        # cpus, challenge id)
+        try:
+            claims = self.manager.coordinator.scan(RESERVATION_PREFIX)
+        except Exception as e:
+            print(f"[container admission] could not read shared reservations: {e}")
+            return {}
+
+        reservations = {}
+        for key, value in claims.items():
+            try:
+                node, mem, cpu, challenge_id = json.loads(value)
+            except (ValueError, TypeError):
+                continue
+            reservations[key] = (node, mem, cpu, challenge_id)
+        return reservations
+
+    def _publish(self, ticket: Ticket) -> bool:
+        # publish an admitted ticket's reservation for the other workers
+        value = json.dumps([ticket.node, ticket.need[0], ticket.need[1], ticket.challenge_id])
+        try:
+            return self.manager.coordinator.claim(
+                RESERVATION_PREFIX + ticket.id, self.manager.instance_id, value, ttl=RESERVATION_TTL
+            )
+        except Exception as e:
+            print(f"[container admission] could not publish reservation: {e}")
+            return False
+
+    def _dispatch(self):
+        with self.lock:
+            waiting = list(self.waiting)
+            admitted = list(self.admitted)
+
+        reserved = {}  # node -> (memory MB, cpus) of admitted spawns not in the database yet
+        inflight = {}  # challenge id -> admitted spawns
+        shared = self._shared_reservations()
+        for node, mem, cpu, challenge_id in shared.values():
+            inflight[challenge_id] = inflight.get(challenge_id, 0) + 1
+            if node is not None:
+                used = reserved.get(node, (0, 0))
+                reserved[node] = (used[0] + mem, used[1] + cpu)
+        # this worker's own tickets whose reservation couldn't be published
+        for ticket in admitted:
+            if RESERVATION_PREFIX + ticket.id not in shared:
+                self._reserve(ticket, reserved, inflight)
+
+        # with docker unreachable nothing frees up by waiting, the spawns report it
+        connected = any(node.is_available() for node in list(self.manager.nodes.values()))
+
+        blocked = set()  # challenges held back by their instance cap
+        started = []  # (ticket, error)
+        cutoff = time.time() - ADMISSION_TIMEOUT
+        for ticket in waiting:
+            if ticket.created < cutoff:
+                started.append((ticket, "no capacity became available, please try again later"))
+                continue
+            if ticket.challenge_id in blocked:
+                continue
+
+            challenge = self.manager.challenge_cache.get(ticket.challenge_id)
+            if challenge is None or challenge.profile_error or not connected:
+                # the spawn itself reports the problem
+                started.append((ticket, None))
+                continue
+
+            # an owner who already has an instance gets it back right away, it needs no
+            # new capacity and mustn't wait behind the instance cap it counts towards
+            if ticket.owner and db.session.query(ContainerInfoModel.container_id).filter_by(
+                challenge_id=challenge.id, **ticket.owner
+            ).first():
+                started.append((ticket, None))
+                continue
+
+            if challenge.max_instances:
+                instances = ContainerInfoModel.query.filter_by(challenge_id=challenge.id).count()
+                if instances + inflight.get(ticket.challenge_id, 0) >= challenge.max_instances:
+                    blocked.add(ticket.challenge_id)
+                    continue
+
+            # a pooled container is already running and counted, no new capacity needed
+            if challenge.warm_pool_size and db.session.query(ContainerPoolModel.container_id).filter_by(
+                challenge_id=challenge.id
+            ).first():
+                inflight[ticket.challenge_id] = inflight.get(ticket.challenge_id, 0) + 1
+                started.append((ticket, None))
+                continue
+
+            node, need = self.manager.find_node(challenge.id, reserved)
+            if node is None:
+                break
+
+            ticket.node = node
+            ticket.need = need
+            self._reserve(ticket, reserved, inflight)
+            started.append((ticket, None))
+
+        if not started:
+            return
+
+        for ticket, error in started:
+            if error is None:
+                self._publish(ticket)
+
+        moved = []
+        with self.lock:
+            for ticket, error in started:
+                self.waiting.remove(ticket)
+                if error is None:
+                    self.admitted.add(ticket)
+            for position, ticket in enumerate(self.waiting, start=1):
+                if ticket.position != position:
+                    ticket.position = position
+                    moved.append(ticket)
+
+        for ticket, error in started:
+            ticket.start(ticket, error)
+        for ticket in moved:
+            ticket.moved(ticket.position)
+
+    @staticmethod
+    def _reserve(ticket: Ticket, reserved: dict, inflight: dict):
+        inflight[ticket.challenge_id] = inflight.get(ticket.challenge_id, 0) + 1
+        if ticket.node is not None:
+            mem, cpu = reserved.get(ticket.node, (0, 0))
+            reserved[ticket.node] = (mem + ticket.need[0], cpu + ticket.need[1])
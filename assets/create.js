@@ -4,35 +4,73 @@ CTFd.plugin.run(async (_CTFd) => {
 
     const containerImage = document.getElementById("container-image");
     const containerImageDefault = document.getElementById("container-image-default");
+    const containerImageSearch = document.getElementById("container-image-search");
 
-    try {
-        const response = await fetch("/containers/api/images", {
-            method: "GET",
-            headers: {
-                "Accept": "application/json",
-                "CSRF-Token": init.csrfNonce
-            }
-        });
+    // images are filtered and paginated server side, only the first page is listed
+    async function loadImages(query) {
+        try {
+            const params = new URLSearchParams({ q: query, per_page: 50 });
+            const response = await fetch(`/containers/api/images?${params}`, {
+                method: "GET",
+                headers: {
+                    "Accept": "application/json",
+                    "CSRF-Token": init.csrfNonce
+                }
+            });
+
+            if (!response.ok) throw new Error("Error fetching data");
+
+            const data = await response.json();
 
-        if (!response.ok) throw new Error("Error fetching data");
+            if (data.error) {
+                containerImageDefault.textContent = data.error;
+                return;
+            }
 
-        const data = await response.json();
+            const selected = containerImage.value;
+            containerImage.querySelectorAll("option:not(#container-image-default)").forEach(option => option.remove());
 
-        if (data.error) {
-            containerImageDefault.textContent = data.error;
-        } else {
             data.images.forEach(image => {
                 const option = document.createElement("option");
-                option.value = image;
-                option.textContent = image;
+                option.value = image.tag;
+                option.textContent = `${image.tag} (${formatSize(image.size)})`;
                 containerImage.appendChild(option);
             });
 
-            containerImageDefault.textContent = "Choose an image...";
+            if (data.total > data.images.length) {
+                const option = document.createElement("option");
+                option.disabled = true;
+                option.textContent = `${data.total - data.images.length} more, refine the filter...`;
+                containerImage.appendChild(option);
+            }
+
+            containerImageDefault.textContent = data.total ? "Choose an image..." : "No matching images.";
             containerImage.removeAttribute("disabled");
+            if (data.images.some(image => image.tag === selected)) {
+                containerImage.value = selected;
+            }
+        } catch (error) {
+            console.error("Fetch error:", error);
+            containerImageDefault.textContent = "Failed to load images.";
         }
-    } catch (error) {
-        console.error("Fetch error:", error);
-        containerImageDefault.textContent = "Failed to load images.";
     }
+
+    function formatSize(bytes) {
+        if (!bytes) return "unknown size";
+        const units = ["B", "KB", "MB", "GB"];
+        let index = 0;
+        while (bytes >= 1024 && index < units.length - 1) {
+            bytes /= 1024;
+            index++;
+        }
+        return `${bytes.toFixed(index ? 1 : 0)} ${units[index]}`;
+    }
+
+    let searchTimeout;
+    containerImageSearch.addEventListener("input", () => {
+        clearTimeout(searchTimeout);
+        searchTimeout = setTimeout(() => loadImages(containerImageSearch.value.trim()), 300);
+    });
+
+    await loadImages("");
 });
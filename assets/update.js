@@ -28,27 +28,58 @@ async function fetchData(url, method = "GET", headers = {}, body = null) {
     }
 }
 
-async function loadContainerImages() {
+// images are filtered and paginated server side, only the first page is listed
+async function loadContainerImages(query = "") {
     const containerImage = document.getElementById("container-image");
     const containerImageDefault = document.getElementById("container-image-default");
 
-    const data = await fetchData("/containers/api/images");
+    const params = new URLSearchParams({ q: query, per_page: 50 });
+    const data = await fetchData(`/containers/api/images?${params}`);
 
     if (!data) {
         containerImageDefault.innerHTML = "Failed to load images.";
         return;
     }
 
+    const selected = containerImage.value || container_image_selected;
+    containerImage.querySelectorAll("option:not(#container-image-default)").forEach(opt => opt.remove());
+
+    // keep the current image selectable even when it is filtered out or not on any node
+    if (selected && !data.images.some(image => image.tag === selected)) {
+        const opt = document.createElement("option");
+        opt.value = selected;
+        opt.textContent = selected;
+        containerImage.appendChild(opt);
+    }
+
     data.images.forEach(image => {
         const opt = document.createElement("option");
-        opt.value = image;
-        opt.innerHTML = image;
+        opt.value = image.tag;
+        opt.textContent = `${image.tag} (${formatSize(image.size)})`;
         containerImage.appendChild(opt);
     });
 
+    if (data.total > data.images.length) {
+        const opt = document.createElement("option");
+        opt.disabled = true;
+        opt.textContent = `${data.total - data.images.length} more, refine the filter...`;
+        containerImage.appendChild(opt);
+    }
+
     containerImageDefault.innerHTML = "Choose an image...";
     containerImage.removeAttribute("disabled");
-    containerImage.value = container_image_selected;
+    containerImage.value = selected;
+}
+
+function formatSize(bytes) {
+    if (!bytes) return "unknown size";
+    const units = ["B", "KB", "MB", "GB"];
+    let index = 0;
+    while (bytes >= 1024 && index < units.length - 1) {
+        bytes /= 1024;
+        index++;
+    }
+    return `${bytes.toFixed(index ? 1 : 0)} ${units[index]}`;
 }
 
 async function loadConnectType(challengeId) {
@@ -77,6 +108,13 @@ function getChallengeIdFromURL() {
 document.addEventListener("DOMContentLoaded", async () => {
     await loadContainerImages();
 
+    const containerImageSearch = document.getElementById("container-image-search");
+    let searchTimeout;
+    containerImageSearch.addEventListener("input", () => {
+        clearTimeout(searchTimeout);
+        searchTimeout = setTimeout(() => loadContainerImages(containerImageSearch.value.trim()), 300);
+    });
+
     const challengeId = getChallengeIdFromURL();
 
     if (challengeId) {
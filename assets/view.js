@@ -36,22 +36,23 @@ function mergeQueryParams(parameters, queryParameters) {
 
 function resetAlert() {
     const alert = document.getElementById("deployment-info");
+    if (alert.expiryInterval) {
+        clearInterval(alert.expiryInterval);
+        delete alert.expiryInterval;
+    }
     alert.innerHTML = "";
     alert.classList.remove("alert-danger");
 
     return alert;
 }
 
-function toggleChallengeCreate() {
-    const btn = document.getElementById("create-chal");
-    btn.classList.toggle('d-none');
+function showChallengeCreate(show) {
+    document.getElementById("create-chal").classList.toggle('d-none', !show);
 }
 
-function toggleChallengeUpdate() {
-    const btnExtend = document.getElementById("extend-chal");
-    const btnTerminate = document.getElementById("terminate-chal");
-    btnExtend.classList.toggle('d-none');
-    btnTerminate.classList.toggle('d-none');
+function showChallengeUpdate(show) {
+    document.getElementById("extend-chal").classList.toggle('d-none', !show);
+    document.getElementById("terminate-chal").classList.toggle('d-none', !show);
 }
 
 function calculateExpiry(expiresAtTimestamp) {
@@ -94,13 +95,11 @@ function createChallengeLinkElement(data, parent) {
             ? `Instance will expire in ${formatTime(secondsLeft)}` 
             : "Instance has expired";
 
+        // the server pushes an expired event once the container is reaped
         if (secondsLeft <= 0) {
             clearInterval(parent.expiryInterval);
             delete parent.expiryInterval;
 
-            toggleChallengeCreate();
-            toggleChallengeUpdate();
-
             connectionDetails.innerHTML = '';
         }
     }
@@ -108,6 +107,13 @@ function createChallengeLinkElement(data, parent) {
     updateExpiry();
     parent.expiryInterval = setInterval(updateExpiry, 1000);
 
+    if (data.warning) {
+        const warning = document.createElement('small');
+        warning.className = 'text-warning';
+        warning.textContent = data.warning;
+        parent.append(warning);
+    }
+
     if (data.connect === "tcp") {
         const codeElement = document.createElement('code');
         codeElement.textContent = `nc ${data.hostname} ${data.port}`;
@@ -127,35 +133,90 @@ function createChallengeLinkElement(data, parent) {
     }
 }
 
+// container states of the current user or team, pushed over one server-sent events
+// stream shared by every challenge window. it is kept on window since this script is
+// loaded again for each challenge that is opened.
+window.containerStates = window.containerStates || null;
+window.containerSpawning = window.containerSpawning || new Set();
+window.containerOpenChallenge = null;
+
+function subscribeContainerEvents() {
+    if (window.containerEvents) {
+        return;
+    }
+
+    const source = new EventSource("/containers/api/events");
+    const messages = {
+        expired: "Instance has expired",
+        killed: "Instance terminated",
+    };
+
+    source.addEventListener("snapshot", (event) => {
+        window.containerStates = {};
+        JSON.parse(event.data).forEach((state) => {
+            window.containerStates[state.challenge_id] = state;
+        });
+        renderContainerState(window.containerOpenChallenge);
+    });
+    ["created", "ready", "renewed", "updated"].forEach((name) => {
+        source.addEventListener(name, (event) => {
+            const state = JSON.parse(event.data);
+            window.containerStates[state.challenge_id] = state;
+            renderContainerState(state.challenge_id);
+        });
+    });
+    Object.keys(messages).forEach((name) => {
+        source.addEventListener(name, (event) => {
+            const state = JSON.parse(event.data);
+            delete window.containerStates[state.challenge_id];
+            renderContainerState(state.challenge_id, messages[name]);
+        });
+    });
+
+    // the browser reconnects on its own and the server starts over with a snapshot
+    window.containerEvents = source;
+}
+
+function renderContainerState(challengeId, message) {
+    // show the pushed state of a challenge's container if its window is open
+    if (challengeId == null || challengeId !== window.containerOpenChallenge || window.containerStates === null) {
+        return;
+    }
+
+    const state = window.containerStates[challengeId];
+    if (!state && window.containerSpawning.has(challengeId)) {
+        return; // the spawn job reports on the container until it is created
+    }
+
+    const alert = resetAlert();
+    if (!state) {
+        alert.textContent = message || "Instance not started";
+        showChallengeCreate(true);
+        showChallengeUpdate(false);
+        return;
+    }
+
+    showChallengeCreate(false);
+    showChallengeUpdate(true);
+    if (state.status === "starting") {
+        // the container runs but its service isn't up yet, a ready event follows
+        alert.textContent = "Instance starting, waiting for the service to come up...";
+    } else if (state.status === "failed") {
+        alert.textContent = "Your instance did not become ready, please stop it and try again";
+        alert.classList.add('alert-danger');
+    } else {
+        createChallengeLinkElement(state, alert);
+    }
+}
+
 function view_container_info(challengeId) {
     resetAlert();
-    const alert = document.getElementById("deployment-info");
+    showChallengeCreate(false);
+    showChallengeUpdate(false);
 
-    fetch("/containers/api/view_info", {
-        method: "POST",
-        headers: {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "CSRF-Token": init.csrfNonce,
-        },
-        body: JSON.stringify({ chal_id: challengeId }),
-    })
-    .then((response) => response.json())
-    .then((data) => {
-        if (data.status === "instance not started") {
-            alert.textContent = "Instance not started" ;
-            toggleChallengeCreate();
-        } else if (data.status === "already_running") {
-            createChallengeLinkElement(data, alert);
-            toggleChallengeUpdate();
-        } else {
-            resetAlert();
-            alert.textContent = data.message;
-            alert.classList.add('alert-danger');
-            toggleChallengeUpdate();
-        }
-    })
-    .catch((error) => console.error("Fetch error:", error));
+    window.containerOpenChallenge = challengeId;
+    subscribeContainerEvents();
+    renderContainerState(challengeId);
 }
 
 function container_request(challengeId) {
@@ -172,19 +233,73 @@ function container_request(challengeId) {
     })
     .then((response) => response.json())
     .then((data) => {
-        if (data.error || data.message) {
+        if (data.job_id) {
+            // the spawn runs in the background, hide the button until it finishes
+            showChallengeCreate(false);
+            alert.textContent = "Starting instance...";
+            watchSpawnJob(data.job_id, alert, challengeId);
+        } else {
             alert.textContent = data.error || data.message;
             alert.classList.add('alert-danger');
-            toggleChallengeCreate();
-        } else {
-            createChallengeLinkElement(data, alert);
-            toggleChallengeCreate();
-            toggleChallengeUpdate();
         }
     })
     .catch((error) => console.error("Fetch error:", error));
 }
 
+function watchSpawnJob(jobId, alert, challengeId) {
+    // follow the job over server-sent events, the container stream takes over once
+    // it is created
+    window.containerSpawning.add(challengeId);
+
+    const source = new EventSource(`/containers/api/request/${jobId}/events`);
+    source.onmessage = (event) => {
+        const job = JSON.parse(event.data);
+        if (job.status === "done" || job.status === "failed") {
+            source.close();
+            spawnJobFinished(job, alert, challengeId);
+        } else {
+            spawnJobProgress(job, alert);
+        }
+    };
+    source.onerror = () => {
+        // reconnects are handled by the browser, a closed stream means the job is gone
+        if (source.readyState === EventSource.CLOSED) {
+            window.containerSpawning.delete(challengeId);
+            renderContainerState(challengeId);
+        }
+    };
+}
+
+function spawnJobProgress(job, alert) {
+    // spawns wait in a queue while the cluster is out of capacity
+    if (job.status === "waiting" && job.position) {
+        alert.textContent = `Waiting for capacity, position ${job.position} in queue...`;
+    } else {
+        alert.textContent = "Starting instance...";
+    }
+}
+
+function spawnJobFinished(job, alert, challengeId) {
+    const data = job.result || {};
+    window.containerSpawning.delete(challengeId);
+
+    if (job.status === "failed" || data.error || data.message) {
+        resetAlert();
+        alert.textContent = data.error || data.message || "Failed to start instance";
+        alert.classList.add('alert-danger');
+        showChallengeCreate(true);
+    } else {
+        // the created event may still be on its way, start from the job's result
+        if (window.containerStates && !window.containerStates[challengeId]) {
+            window.containerStates[challengeId] = Object.assign({}, data, {
+                challenge_id: challengeId,
+                status: data.status === "starting" ? "starting" : "running",
+            });
+        }
+        renderContainerState(challengeId);
+    }
+}
+
 function container_renew(challengeId) {
     const alert = resetAlert();
 
@@ -202,7 +317,6 @@ function container_renew(challengeId) {
         if (data.error || data.message) {
             alert.textContent = data.error || data.message;
             alert.classList.add('alert-danger');
-            toggleChallengeCreate();
         } else {
             createChallengeLinkElement(data, alert);
         }
@@ -227,11 +341,10 @@ function container_stop(challengeId) {
         if (data.error || data.message) {
             alert.textContent = data.error || data.message;
             alert.classList.add('alert-danger');
-            toggleChallengeCreate();
         } else {
             alert.textContent = "Instance terminated";
-            toggleChallengeCreate();
-            toggleChallengeUpdate();
+            showChallengeCreate(true);
+            showChallengeUpdate(false);
         }
     })
     .catch((error) => console.error("Fetch error:", error));
@@ -0,0 +1,313 @@
+# in-process stand-in for docker.DockerClient, covering the calls the plugin makes.
+# every client built for a FakeDaemon shares its containers, images, published
+# ports and event subscribers, like real clients of one daemon do. each call can be
+# delayed and can fail at a configurable rate, so the plugin's behaviour under a
+# slow or flaky daemon can be measured without docker installed.
+import hashlib
+import queue
+import random
+import threading
+import time
+import uuid
+
+import docker
+
+
+class FakeDaemon:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 conflict_rate: float = 0.0, images=(), seed=None):
+        self.latency = latency  # seconds added to every api call
+        self.jitter = jitter  # +/- seconds of uniform noise on top of the latency
+        self.failure_rate = failure_rate  # share of calls failing with a 500
+        self.conflict_rate = conflict_rate  # share of runs failing with a port conflict
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.containers = {}  # id -> FakeContainer
+        self.ports = set()  # published host ports
+        self.images = {}  # tag -> image summary, as returned by the images api
+        self.subscribers = []
+        self.calls = 0
+
+        for tag in images:
+            self.add_image(tag)
+
+    def call(self, operation: str):
+        # simulate the round trip of one api call
+        with self.lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            failed = self.random.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise docker.errors.APIError(f"500 Server Error: injected failure in {operation}")
+
+    def add_image(self, tag: str) -> dict:
+        digest = "sha256:" + hashlib.sha256(tag.encode()).hexdigest()
+        summary = {
+            "Id": "sha256:" + hashlib.sha256(digest.encode()).hexdigest(),
+            "RepoTags": [tag],
+            "RepoDigests": [f"{tag.rsplit(':', 1)[0]}@{digest}"],
+            "Size": 5 * 1024 * 1024,
+            "Created": int(time.time()),
+        }
+        with self.lock:
+            self.images[tag] = summary
+        self.emit("image", "pull", tag, {})
+        return summary
+
+    def emit(self, event_type: str, action: str, actor_id: str, attributes: dict):
+        event = {
+            "Type": event_type,
+            "Action": action,
+            "status": action,
+            "id": actor_id,
+            "Actor": {"ID": actor_id, "Attributes": dict(attributes)},
+            "time": int(time.time()),
+        }
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+
+class FakeContainer:
+    def __init__(self, daemon: FakeDaemon, image: str, labels: dict, container_port: str, host_port: int, auto_remove: bool):
+        self.daemon = daemon
+        self.id = uuid.uuid4().hex + uuid.uuid4().hex
+        self.image = image
+        self.labels = dict(labels or {})
+        self.container_port = container_port if "/" in container_port else f"{container_port}/tcp"
+        self.host_port = host_port
+        self.auto_remove = auto_remove
+        self.status = "running"
+
+    @property
+    def attrs(self) -> dict:
+        published = self.status == "running" and self.host_port is not None
+        return {
+            "Id": self.id,
+            "State": {"Status": self.status},
+            "Ports": [{
+                "PrivatePort": int(self.container_port.split("/")[0]),
+                "PublicPort": self.host_port,
+                "Type": "tcp",
+            }] if published else [],
+            "NetworkSettings": {
+                "Ports": {
+                    self.container_port: [{"HostIp": "0.0.0.0", "HostPort": str(self.host_port)}] if published else None,
+                },
+            },
+        }
+
+    def kill(self):
+        self.daemon.call("kill")
+        self.daemon.emit("container", "kill", self.id, self.labels)
+        self._exit()
+
+    def stop(self, timeout=None):
+        self.kill()
+
+    def remove(self, force=False):
+        self.daemon.call("remove")
+        self._remove()
+
+    def put_archive(self, path: str, data) -> bool:
+        self.daemon.call("put_archive")
+        return True
+
+    def _exit(self):
+        with self.daemon.lock:
+            if self.status != "running":
+                return
+            self.status = "exited"
+            self.daemon.ports.discard(self.host_port)
+        self.daemon.emit("container", "die", self.id, self.labels)
+        if self.auto_remove:
+            self._remove()
+
+    def _remove(self):
+        with self.daemon.lock:
+            removed = self.daemon.containers.pop(self.id, None)
+            self.daemon.ports.discard(self.host_port)
+        if removed is not None:
+            self.daemon.emit("container", "destroy", self.id, self.labels)
+
+
+class FakeContainerCollection:
+    def __init__(self, daemon: FakeDaemon):
+        self.daemon = daemon
+
+    def run(self, image, command=None, ports=None, detach=False, auto_remove=False,
+            environment=None, labels=None, **kwargs):
+        self.daemon.call("run")
+        if image not in self.daemon.images:
+            raise docker.errors.ImageNotFound(f"No such image: {image}")
+
+        container_port, host_port = next(iter((ports or {}).items()), ("80/tcp", None))
+        host_port = int(host_port) if host_port else None
+
+        with self.daemon.lock:
+            conflict = self.daemon.random.random() < self.daemon.conflict_rate
+            if host_port is not None and (conflict or host_port in self.daemon.ports):
+                raise docker.errors.APIError(
+                    f"500 Server Error: driver failed programming external connectivity: "
+                    f"Bind for 0.0.0.0:{host_port} failed: port is already allocated"
+                )
+            container = FakeContainer(self.daemon, image, labels, str(container_port), host_port, auto_remove)
+            self.daemon.containers[container.id] = container
+            if host_port is not None:
+                self.daemon.ports.add(host_port)
+
+        self.daemon.emit("container", "start", container.id, container.labels)
+        return container
+
+    def get(self, container_id: str) -> FakeContainer:
+        self.daemon.call("inspect")
+        with self.daemon.lock:
+            container = self.daemon.containers.get(container_id)
+        if container is None:
+            raise docker.errors.NotFound(f"No such container: {container_id}")
+        return container
+
+    def list(self, all=False, sparse=False, filters=None, **kwargs) -> list:
+        self.daemon.call("list")
+        filters = filters or {}
+        labels = filters.get("label")
+        labels = [labels] if isinstance(labels, str) else labels or []
+        ids = filters.get("id")
+        ids = [ids] if isinstance(ids, str) else ids
+
+        with self.daemon.lock:
+            containers = list(self.daemon.containers.values())
+
+        return [
+            container for container in containers
+            if (all or container.status == "running")
+            and all_labels_match(container, labels)
+            and (ids is None or any(container.id.startswith(cid) for cid in ids))
+        ]
+
+
+def all_labels_match(container: FakeContainer, labels: list) -> bool:
+    for label in labels:
+        key, _, value = label.partition("=")
+        if key not in container.labels or (value and container.labels[key] != value):
+            return False
+    return True
+
+
+class FakeImage:
+    def __init__(self, summary: dict):
+        self.id = summary["Id"]
+        self.tags = list(summary["RepoTags"])
+        self.attrs = dict(summary)
+
+
+class FakeRegistryData:
+    def __init__(self, digest: str):
+        self.id = digest
+
+
+class FakeImageCollection:
+    def __init__(self, daemon: FakeDaemon):
+        self.daemon = daemon
+
+    def list(self, **kwargs) -> list:
+        self.daemon.call("images")
+        with self.daemon.lock:
+            return [FakeImage(summary) for summary in self.daemon.images.values()]
+
+    def get(self, name: str) -> FakeImage:
+        self.daemon.call("image_inspect")
+        with self.daemon.lock:
+            summary = self.daemon.images.get(name)
+        if summary is None:
+            raise docker.errors.ImageNotFound(f"No such image: {name}")
+        return FakeImage(summary)
+
+    def get_registry_data(self, name: str) -> FakeRegistryData:
+        self.daemon.call("distribution")
+        digest = "sha256:" + hashlib.sha256(name.encode()).hexdigest()
+        return FakeRegistryData(digest)
+
+    def pull(self, repository: str, tag=None, **kwargs) -> FakeImage:
+        self.daemon.call("pull")
+        name = f"{repository}:{tag}" if tag else repository
+        return FakeImage(self.daemon.add_image(name))
+
+
+class FakeAPI:
+    def __init__(self, daemon: FakeDaemon):
+        self.daemon = daemon
+        self.started = time.monotonic()
+
+    def images(self, **kwargs) -> list:
+        self.daemon.call("images")
+        with self.daemon.lock:
+            return [dict(summary) for summary in self.daemon.images.values()]
+
+    def stats(self, container, stream=True, one_shot=None, **kwargs) -> dict:
+        # counters only ever grow while the container runs, like a busy challenge
+        self.daemon.call("stats")
+        with self.daemon.lock:
+            known = container in self.daemon.containers
+        if not known:
+            raise docker.errors.NotFound(f"No such container: {container}")
+        elapsed = int((time.monotonic() - self.started) * 1e9)
+        return {
+            "networks": {"eth0": {"rx_bytes": elapsed // 1000, "tx_bytes": elapsed // 1000}},
+            "cpu_stats": {"cpu_usage": {"total_usage": elapsed // 10}},
+        }
+
+
+class FakeEventStream:
+    # blocking iterator over the daemon's events, ended by close() like the sdk stream
+    def __init__(self, daemon: FakeDaemon, types):
+        self.daemon = daemon
+        self.types = set(types)
+        self.queue = queue.Queue()
+        self.closed = False
+        with daemon.lock:
+            daemon.subscribers.append(self.queue)
+
+    def __iter__(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            if not self.types or event["Type"] in self.types:
+                yield event
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        with self.daemon.lock:
+            if self.queue in self.daemon.subscribers:
+                self.daemon.subscribers.remove(self.queue)
+        self.queue.put(None)
+
+
+class FakeDockerClient:
+    def __init__(self, daemon: FakeDaemon):
+        self.daemon = daemon
+        self.api = FakeAPI(daemon)
+        self.containers = FakeContainerCollection(daemon)
+        self.images = FakeImageCollection(daemon)
+
+    def ping(self) -> bool:
+        self.daemon.call("ping")
+        return True
+
+    def info(self) -> dict:
+        self.daemon.call("info")
+        return {"MemTotal": 64 * 1024 ** 3, "NCPU": 32, "Name": "fake"}
+
+    def events(self, decode=False, filters=None, **kwargs) -> FakeEventStream:
+        types = (filters or {}).get("type") or ()
+        types = [types] if isinstance(types, str) else types
+        return FakeEventStream(self.daemon, types)
+
+    def close(self):
+        pass
@@ -0,0 +1,271 @@
+# load test of the user endpoints against a fake docker daemon, e.g.
+#
+#   python CTFd/plugins/containers/benchmarks/load_test.py --users 500 --concurrency 100 \
+#       --latency 0.05 --failure-rate 0.01 --reaper 1000
+#
+# run it from a CTFd checkout with the plugin installed under CTFd/plugins/. it
+# builds a CTFd app on a throwaway sqlite database (or --database-url), creates
+# one user per simulated player and a container challenge, points the plugin at an
+# in-process FakeDaemon and drives request -> job status -> view_info -> renew ->
+# stop for every player. latency percentiles and throughput are reported per
+# endpoint, and --reaper times one pass of the reaper over that many expired rows.
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_docker import FakeDaemon, FakeDockerClient
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_NAME = os.path.basename(PLUGIN_DIR)
+CTFD_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(PLUGIN_DIR)))
+sys.path.insert(0, CTFD_ROOT)
+
+IMAGE = "bench/challenge:latest"
+PASSWORD = "benchmark"
+
+
+class Timings:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}  # endpoint -> list of seconds
+        self.errors = {}  # endpoint -> count
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def report(timings: Timings, wall: float):
+    print(f"{'endpoint':<14} {'n':>6} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for endpoint, samples in timings.samples.items():
+        samples_ms = [sample * 1000 for sample in samples]
+        print(
+            f"{endpoint:<14} {len(samples):>6} {timings.errors.get(endpoint, 0):>7} "
+            f"{statistics.median(samples_ms):>9.1f} {percentile(samples_ms, 95):>9.1f} "
+            f"{percentile(samples_ms, 99):>9.1f} {len(samples) / wall:>8.1f}"
+        )
+
+
+def create_app(database_url: str):
+    from CTFd import create_app as create_ctfd_app
+    from CTFd.config import TestingConfig
+
+    class BenchmarkConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ENGINE_OPTIONS = (
+            {"connect_args": {"timeout": 30, "check_same_thread": False}}
+            if database_url.startswith("sqlite") else {}
+        )
+        CACHE_TYPE = "simple"
+        SERVER_NAME = "localhost"
+
+    return create_ctfd_app(config=BenchmarkConfig)
+
+
+def setup_ctf(app, players: int) -> tuple:
+    # configure the ctf, insert the players and the challenge, and connect the
+    # plugin to the fake daemon. returns (challenge id, user ids).
+    from CTFd.models import db, Users
+    from CTFd.utils import set_config
+    from CTFd.utils.crypto import hash_password
+
+    models = importlib.import_module(f"CTFd.plugins.{PLUGIN_NAME}.models")
+    utils = importlib.import_module(f"CTFd.plugins.{PLUGIN_NAME}.utils")
+
+    with app.app_context():
+        set_config("setup", True)
+        set_config("ctf_name", "benchmark")
+        set_config("user_mode", utils.USERS_MODE)
+        set_config("verify_emails", False)
+
+        # one hash for everyone, hashing per player would dominate the setup time
+        password = hash_password(PASSWORD)
+        db.session.execute(Users.__table__.insert(), [
+            {"name": f"player{i}", "email": f"player{i}@bench.local", "password": password,
+             "type": "user", "verified": True, "hidden": False, "banned": False}
+            for i in range(players)
+        ])
+
+        challenge = models.ContainerChallengeModel(
+            name="benchmark", category="benchmark", description="benchmark challenge",
+            image=IMAGE, port=80, ctype="tcp", initial=500, minimum=100, decay=50,
+            # nothing listens on the fake daemon's ports, don't wait for readiness
+            ready_check="none",
+            state="visible", type="container",
+        )
+        db.session.add(challenge)
+
+        for key, value in {
+            "docker_base_url": "unix://fake/docker.sock",
+            "docker_hostname": "127.0.0.1",
+            "container_expiration": "45",
+            "container_port_min": "20000",
+            "container_port_max": "60000",
+        }.items():
+            db.session.merge(models.ContainerSettingsModel(key=key, value=value))
+        db.session.commit()
+
+        container_manager = app.container_manager
+        container_manager.settings = utils.settings_to_dict(models.ContainerSettingsModel.query.all())
+        container_manager.initialize_connection()
+
+        user_ids = [user_id for (user_id,) in db.session.query(Users.id).order_by(Users.id)]
+        return challenge.id, user_ids
+
+
+def login(app, user_id: int, address: str):
+    # a test client with a logged in session for one player, its own address keeps
+    # the per-ip rate limits apart
+    from flask import session
+    from CTFd.models import Users
+    from CTFd.utils.security.auth import login_user
+
+    client = app.test_client()
+    client.environ_base["REMOTE_ADDR"] = address
+
+    with app.test_request_context():
+        login_user(Users.query.filter_by(id=user_id).first())
+        state = dict(session)
+
+    with client.session_transaction() as client_session:
+        client_session.update(state)
+
+    return client, state["nonce"]
+
+
+def play(client, nonce: str, challenge_id: int, poll_interval: float, timings: Timings):
+    headers = {"CSRF-Token": nonce, "Accept": "application/json"}
+    body = {"chal_id": challenge_id}
+
+    def timed_post(endpoint, path):
+        start = time.perf_counter()
+        response = client.post(path, json=body, headers=headers)
+        data = response.get_json(silent=True) or {}
+        timings.record(endpoint, time.perf_counter() - start, response.status_code < 400 and "error" not in data)
+        return data
+
+    spawn_start = time.perf_counter()
+    job = timed_post("request", "/containers/api/request")
+
+    while job.get("job_id") and job.get("status") not in ("done", "failed"):
+        time.sleep(poll_interval)
+        start = time.perf_counter()
+        response = client.get(f"/containers/api/request/{job['job_id']}", headers=headers)
+        timings.record("job_status", time.perf_counter() - start, response.status_code < 400)
+        job = response.get_json(silent=True) or {"status": "failed"}
+
+    timings.record("spawn", time.perf_counter() - spawn_start, job.get("status") == "done")
+
+    timed_post("view_info", "/containers/api/view_info")
+    timed_post("renew", "/containers/api/renew")
+    timed_post("stop", "/containers/api/stop")
+
+
+def bench_reaper(app, daemon: FakeDaemon, challenge_id: int, user_ids: list, count: int):
+    # insert `count` expired rows backed by running fake containers and time one reap
+    from CTFd.models import db
+
+    models = importlib.import_module(f"CTFd.plugins.{PLUGIN_NAME}.models")
+    nodes = importlib.import_module(f"CTFd.plugins.{PLUGIN_NAME}.nodes")
+    client = FakeDockerClient(daemon)
+    expired = int(time.time()) - 60
+
+    rows = []
+    for i in range(count):
+        container = client.containers.run(
+            IMAGE, ports={"80/tcp": None}, detach=True, auto_remove=True,
+            labels={nodes.PLUGIN_LABEL: "true"},
+        )
+        # one row per player and challenge is allowed, rows past the player count
+        # are left without a challenge so they don't collide
+        rows.append({
+            "container_id": container.id,
+            "challenge_id": challenge_id if i < len(user_ids) else None,
+            "user_id": user_ids[i % len(user_ids)],
+            "team_id": None,
+            "node": nodes.DEFAULT_NODE,
+            "port": None,
+            "timestamp": expired,
+            "expires": expired,
+        })
+
+    with app.app_context():
+        db.session.execute(models.ContainerInfoModel.__table__.insert(), rows)
+        db.session.commit()
+
+    start = time.perf_counter()
+    app.container_manager.kill_expired_containers(app)
+    elapsed = time.perf_counter() - start
+    print(f"reaper: {count} expired containers in {elapsed * 1000:.1f}ms "
+          f"({elapsed / max(count, 1) * 1000:.2f}ms per container)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test the container plugin against a fake docker daemon")
+    parser.add_argument("--users", type=int, default=100, help="simulated players, one spawn each")
+    parser.add_argument("--concurrency", type=int, default=50, help="players running at the same time")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds added to every docker call")
+    parser.add_argument("--jitter", type=float, default=0.005, help="uniform +/- noise on the latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of docker calls failing")
+    parser.add_argument("--conflict-rate", type=float, default=0.0, help="share of runs hitting a port conflict")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="seconds between job status polls")
+    parser.add_argument("--reaper", type=int, default=0, help="expired containers for the reaper benchmark")
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary sqlite database")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    daemon = FakeDaemon(
+        latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+        conflict_rate=args.conflict_rate, images=[IMAGE], seed=args.seed,
+    )
+
+    # every docker client the plugin builds talks to the fake daemon
+    nodes = importlib.import_module(f"CTFd.plugins.{PLUGIN_NAME}.nodes")
+    nodes.build_client = lambda *args, **kwargs: FakeDockerClient(daemon)
+
+    database_dir = tempfile.mkdtemp(prefix="ctfd-bench-")
+    database_url = args.database_url or f"sqlite:///{os.path.join(database_dir, 'ctfd.db')}"
+    app = create_app(database_url)
+    challenge_id, user_ids = setup_ctf(app, args.users)
+
+    players = [
+        login(app, user_id, f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}")
+        for i, user_id in enumerate(user_ids)
+    ]
+
+    timings = Timings()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(play, client, nonce, challenge_id, args.poll_interval, timings)
+            for client, nonce in players
+        ]
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - start
+
+    print(f"{args.users} players, concurrency {args.concurrency}, docker latency "
+          f"{args.latency * 1000:.0f}ms, {daemon.calls} docker calls in {wall:.2f}s "
+          f"({args.users / wall:.1f} players/s)")
+    report(timings, wall)
+
+    if args.reaper:
+        bench_reaper(app, daemon, challenge_id, user_ids, args.reaper)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# compares spawn and kill latency over different docker transports, e.g.
+#
+#   python benchmarks/transport_latency.py unix://var/run/docker.sock \
+#       tcp://10.0.1.8:2375 ssh://root@10.0.1.9 --iterations 20
+#
+# every transport is measured twice: with one pooled client reused for all calls
+# (what the plugin does) and with a fresh client per call (what it used to do
+# after every reconnect), so the cost of re-establishing ssh sessions shows up.
+import argparse
+import importlib.util
+import os
+import statistics
+import time
+
+# load clients.py directly, importing the plugin package would require CTFd
+_spec = importlib.util.spec_from_file_location(
+    "clients", os.path.join(os.path.dirname(__file__), "..", "clients.py")
+)
+clients = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(clients)
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(samples: list) -> str:
+    samples_ms = [sample * 1000 for sample in samples]
+    return (
+        f"p50 {statistics.median(samples_ms):8.1f}ms  "
+        f"p95 {percentile(samples_ms, 95):8.1f}ms  "
+        f"max {max(samples_ms):8.1f}ms"
+    )
+
+
+def spawn_and_kill(client, image: str, port: str):
+    start = time.perf_counter()
+    container = client.containers.run(
+        image,
+        command="sleep 300",
+        ports={port: None},
+        detach=True,
+        auto_remove=True,
+        labels={"ctfd.containers.benchmark": "true"},
+    )
+    spawned = time.perf_counter()
+    container.kill()
+    killed = time.perf_counter()
+    return spawned - start, killed - spawned
+
+
+def run(base_url: str, image: str, port: str, iterations: int, pool_size: int, fresh: bool):
+    connects, spawns, kills = [], [], []
+    client = None
+
+    for _ in range(iterations):
+        if fresh or client is None:
+            clients.close_client(client)
+            start = time.perf_counter()
+            client = clients.build_client(base_url, pool_size)
+            client.ping()
+            connects.append(time.perf_counter() - start)
+
+        spawn, kill = spawn_and_kill(client, image, port)
+        spawns.append(spawn)
+        kills.append(kill)
+
+    clients.close_client(client)
+    return connects, spawns, kills
+
+
+def main():
+    parser = argparse.ArgumentParser(description="docker transport spawn/kill latency")
+    parser.add_argument("base_urls", nargs="+", help="docker base urls to compare")
+    parser.add_argument("--image", default="alpine:latest")
+    parser.add_argument("--port", default="80/tcp", help="container port to publish")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=clients.DEFAULT_POOL_SIZE)
+    args = parser.parse_args()
+
+    for base_url in args.base_urls:
+        for fresh in (False, True):
+            mode = "fresh client" if fresh else "pooled client"
+            try:
+                connects, spawns, kills = run(
+                    base_url, args.image, args.port, args.iterations, args.pool_size, fresh
+                )
+            except Exception as e:
+                print(f"{base_url} [{mode}]: failed: {e}")
+                break
+
+            print(f"{base_url} [{mode}]")
+            print(f"  connect  {summarize(connects)}  (n={len(connects)})")
+            print(f"  spawn    {summarize(spawns)}")
+            print(f"  kill     {summarize(kills)}")
+
+
+if __name__ == "__main__":
+    main()
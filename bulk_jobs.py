@@ -0,0 +1,139 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from CTFd.models import db
+from .models import ContainerInfoModel
+from .changes import filter_containers, remove_containers
+from .spawn_jobs import QUEUED, RUNNING, DONE, FAILED, JOB_TTL, PENDING_JOB_TTL
+from .coordination import JobBoard
+from .metrics import timed
+
+# containers handed to kill_containers at once, progress is reported after each chunk
+BULK_KILL_CHUNK = 64
+
+# filters a bulk kill accepts, all optional and combined with AND
+BULK_KILL_FILTERS = ("challenge_id", "team_id", "user_id", "node", "older_than")
+
+
+class BulkKillJob:
+    def __init__(self, filters: dict):
+        self.id = uuid.uuid4().hex
+        self.filters = filters
+        self.status = QUEUED
+        self.total = 0
+        self.killed = 0
+        self.failed = 0
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+
+    @classmethod
+    def from_dict(cls, state: dict) -> "BulkKillJob":
+        # read-only copy of a job running on another worker
+        job = cls(state["filters"])
+        for name in ("status", "total", "killed", "failed", "error", "created", "updated"):
+            setattr(job, name, state[name])
+        job.id = state["job_id"]
+        return job
+
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "filters": self.filters,
+            "total": self.total,
+            "killed": self.killed,
+            "failed": self.failed,
+            "error": self.error,
+            "created": self.created,
+            "updated": self.updated,
+        }
+
+
+class BulkKiller:
+    # runs admin mass-kills off the request thread. the matching containers are killed
+    # in parallel through kill_containers and their rows dropped in one statement.
+    # jobs run one after another so two purges don't fight over the same rows. their
+    # progress is published on the board so any worker can report it.
+    def __init__(self, manager):
+        self.manager = manager
+        self.jobs = {}  # job id -> job
+        self.lock = threading.Lock()
+        self.publish_lock = threading.Lock()
+        self.board = JobBoard(manager, "bulk_kill:")
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="container-bulk-kill")
+
+    def submit(self, filters: dict) -> BulkKillJob:
+        job = BulkKillJob(filters)
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+        self._publish(job)
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            state = self.board.get(job_id)
+            if state is not None:
+                job = BulkKillJob.from_dict(state)
+        return job
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id, job in list(self.jobs.items()):
+            if job.is_finished() and job.updated < cutoff:
+                del self.jobs[job_id]
+
+    def _update(self, job: BulkKillJob, **fields):
+        with self.lock:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated = time.time()
+        self._publish(job)
+
+    def _publish(self, job: BulkKillJob):
+        # jobs run one at a time, a single lock keeps the published states in order
+        with self.publish_lock:
+            with self.lock:
+                state = job.to_dict()
+            self.board.publish(job.id, state, JOB_TTL if job.is_finished() else PENDING_JOB_TTL)
+
+    def query(self, filters: dict):
+        # (container id, node) pairs of the rows matching the filters
+        query = db.session.query(ContainerInfoModel.container_id, ContainerInfoModel.node)
+        return filter_containers(query, ContainerInfoModel, filters)
+
+    @timed("bulk_kill")
+    def _run(self, job: BulkKillJob):
+        self._update(job, status=RUNNING)
+        try:
+            with self.manager.app.app_context():
+                containers = self.query(job.filters).all()
+                self._update(job, total=len(containers))
+
+                killed = []
+                for start in range(0, len(containers), BULK_KILL_CHUNK):
+                    chunk = containers[start:start + BULK_KILL_CHUNK]
+                    failed = set(self.manager.kill_containers(chunk))
+                    killed.extend(cid for cid, _ in chunk if cid not in failed)
+                    self._update(job, killed=len(killed), failed=job.failed + len(failed))
+
+                # rows of containers that could not be killed stay visible on the dashboard
+                if killed:
+                    remove_containers(ContainerInfoModel.container_id.in_(killed))
+                    db.session.commit()
+                    self.manager.admission.dispatch_async()
+                    self.manager.notifier.notify()
+        except Exception as e:
+            self._update(job, status=FAILED, error=str(e))
+            return
+
+        self._update(job, status=DONE)
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+
+from .models import ContainerChallengeModel
+from .profiles import load_run_kwargs
+
+# how long a cached challenge stays valid. updates made through the admin panel
+# invalidate their entry right away and clear the other workers' caches through the
+# coordination broadcast, the ttl bounds staleness if that can't be reached.
+CHALLENGE_CACHE_TTL = 60  # seconds
+
+# number of challenges kept, least recently used ones are evicted first
+CHALLENGE_CACHE_SIZE = 512
+
+# columns of a container challenge the user endpoints need to spawn and connect
+CHALLENGE_FIELDS = (
+    "id",
+    "image",
+    "port",
+    "command",
+    "volumes",
+    "ctype",
+    "ssh_username",
+    "ssh_password",
+    "warm_pool_size",
+    "fast_start",
+    "ready_check",
+    "ready_target",
+    "ready_timeout",
+    "mem_limit",
+    "cpu_limit",
+    "max_instances",
+)
+
+
+class ChallengeInfo:
+    # detached, read-only snapshot of a container challenge's spawn metadata
+    __slots__ = CHALLENGE_FIELDS + ("run_kwargs", "profile_error")
+
+    def __init__(self, challenge):
+        for field in CHALLENGE_FIELDS:
+            setattr(self, field, getattr(challenge, field))
+
+        # docker run kwargs compiled from the resource profile when it was saved
+        self.profile_error = None
+        try:
+            self.run_kwargs = load_run_kwargs(challenge)
+        except ValueError as e:
+            self.run_kwargs = {}
+            self.profile_error = str(e)
+
+
+class ChallengeCache:
+    # process-level ttl/lru cache of challenge metadata, with a request-scoped layer on
+    # top so every lookup within one request sees the same snapshot
+    def __init__(self, ttl: int = CHALLENGE_CACHE_TTL, size: int = CHALLENGE_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()  # challenge id -> (loaded at, ChallengeInfo or None)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, challenge_id):
+        # the challenge's metadata, or None if it isn't a container challenge
+        try:
+            challenge_id = int(challenge_id)
+        except (ValueError, TypeError):
+            return None
+
+        scoped = g.setdefault("container_challenges", {}) if has_request_context() else {}
+        if challenge_id in scoped:
+            return scoped[challenge_id]
+
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(challenge_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self.entries.move_to_end(challenge_id)
+                self.hits += 1
+                scoped[challenge_id] = entry[1]
+                return entry[1]
+            self.misses += 1
+
+        challenge = ContainerChallengeModel.query.filter_by(id=challenge_id).first()
+        info = ChallengeInfo(challenge) if challenge is not None else None
+
+        with self.lock:
+            self.entries[challenge_id] = (now, info)
+            self.entries.move_to_end(challenge_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+        scoped[challenge_id] = info
+        return info
+
+    def invalidate(self, challenge_id):
+        with self.lock:
+            self.entries.pop(int(challenge_id), None)
+        if has_request_context():
+            g.setdefault("container_challenges", {}).pop(int(challenge_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "capacity": self.size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
@@ -1,16 +1,25 @@
 import math
 import json
 
-from CTFd.models import db, Solves
+from flask import current_app, abort
+from CTFd.models import db, Teams
 from CTFd.plugins.challenges import BaseChallenge
 from CTFd.utils.modes import get_model
 
-from .models import ContainerChallengeModel
+from .models import ContainerChallengeModel, ContainerInfoModel
 from .utils import get_settings_path
+from . import solve_counts
+from .profiles import PROFILE_FIELDS, normalize_profile, compile_run_kwargs
+from .readiness import READY_FIELDS, normalize_ready_check
+from .changes import remove_containers
 
 with open(get_settings_path(), 'r') as f:
     settings = json.load(f)
 
+# form values that switch a flag on, selects send "1" and json sends booleans
+def is_enabled(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "on", "yes")
+
 class ContainerChallenge(BaseChallenge):
     id = settings["plugin-info"]["id"]
     name = settings["plugin-info"]["name"]
@@ -32,6 +41,17 @@ class ContainerChallenge(BaseChallenge):
             "ctype": challenge.ctype,
             "ssh_username": challenge.ssh_username,
             "ssh_password": challenge.ssh_password,
+            "warm_pool_size": challenge.warm_pool_size,
+            "fast_start": bool(challenge.fast_start),
+            "ready_check": challenge.ready_check,
+            "ready_target": challenge.ready_target,
+            "ready_timeout": challenge.ready_timeout,
+            "mem_limit": challenge.mem_limit,
+            "cpu_limit": challenge.cpu_limit,
+            "pids_limit": challenge.pids_limit,
+            "tmpfs": challenge.tmpfs,
+            "network_mode": challenge.network_mode,
+            "max_instances": challenge.max_instances,
             "initial": challenge.initial,
             "decay": challenge.decay,
             "minimum": challenge.minimum,
@@ -51,21 +71,7 @@ class ContainerChallenge(BaseChallenge):
         return data
 
     @classmethod
-    def calculate_value(cls, challenge):
-        # get the current user or team model
-        Model = get_model()
-
-        # count the number of valid solves for the challenge
-        solve_count = (
-            Solves.query.join(Model, Solves.account_id == Model.id)
-            .filter(
-                Solves.challenge_id == challenge.id,
-                Model.hidden == False,
-                Model.banned == False,
-            )
-            .count()
-        )
-
+    def decayed_value(cls, challenge, solve_count):
         # adjust solve count for calculation
         adjusted_solve_count = max(solve_count - 1, 0)
 
@@ -80,15 +86,75 @@ class ContainerChallenge(BaseChallenge):
         if value < challenge.minimum:
             value = challenge.minimum
 
+        return value
+
+    @classmethod
+    def calculate_value(cls, challenge):
+        # read the maintained solve counter, rebuilding it with a full count only
+        # after it was invalidated (e.g. an account was hidden or banned)
+        solve_count = challenge.solve_count
+        if solve_count is None:
+            solve_count = solve_counts.count_solves([challenge.id]).get(challenge.id, 0)
+            solve_counts.store(challenge.id, solve_count)
+
         # update the challenge value in the database
-        challenge.value = value
+        challenge.value = cls.decayed_value(challenge, solve_count)
+        db.session.commit()
+
+        return challenge
+
+    @classmethod
+    def recalculate_all(cls):
+        # rebuild the counters and values of every container challenge with one
+        # grouped count and a single commit
+        counts = solve_counts.count_solves()
+        challenges = ContainerChallengeModel.query.all()
+        for challenge in challenges:
+            challenge.solve_count = counts.get(challenge.id, 0)
+            challenge.value = cls.decayed_value(challenge, challenge.solve_count)
+        db.session.commit()
+        return challenges
+
+    @classmethod
+    def compile_profile(cls, data):
+        # validate the resource profile and readiness check in submitted data and
+        # compile the run kwargs, rejecting the request instead of failing on every
+        # spawn later
+        try:
+            profile = normalize_profile(data)
+            run_kwargs = compile_run_kwargs(profile, data.get("volumes"))
+            profile.update(normalize_ready_check(data))
+        except ValueError as e:
+            db.session.rollback()
+            abort(400, description=str(e))
+
+        profile["run_kwargs"] = json.dumps(run_kwargs)
+        return profile
+
+    @classmethod
+    def create(cls, request):
+        data = dict(request.form or request.get_json() or {})
+        data.update(cls.compile_profile(data))
+        data["fast_start"] = is_enabled(data.get("fast_start"))
+
+        challenge = cls.challenge_model(**data)
+        db.session.add(challenge)
         db.session.commit()
+        current_app.container_manager.invalidate_challenge(challenge.id)
+
+        # pull the image onto every node before the first spawn needs it
+        current_app.container_manager.images.pull_async(challenge.image)
+
+        # start filling the warm pool right away
+        if challenge.warm_pool_size:
+            current_app.container_manager.warm_pool.refill_async(challenge.id)
 
         return challenge
 
     @classmethod
     def update(cls, challenge, request):
         data = request.form or request.get_json() or {}
+        spawn_config = (challenge.image, challenge.port, challenge.command, challenge.run_kwargs)
 
         # update challenge attributes with provided data
         for attr, value in data.items():
@@ -98,14 +164,61 @@ class ContainerChallenge(BaseChallenge):
                     value = float(value)
                 except (ValueError, TypeError):
                     continue  # skip invalid numeric values
+            elif attr == "warm_pool_size":
+                try:
+                    value = max(int(value or 0), 0)
+                except (ValueError, TypeError):
+                    continue
+            elif attr == "fast_start":
+                value = is_enabled(value)
+            elif attr in PROFILE_FIELDS + READY_FIELDS:
+                continue  # validated and set together below
+            setattr(challenge, attr, value)
+
+        # resource profile and readiness fields missing from the request keep their
+        # current value
+        fields = PROFILE_FIELDS + READY_FIELDS
+        profile_data = {field: getattr(challenge, field) for field in fields}
+        profile_data.update({field: data[field] for field in fields if field in data})
+        profile_data["volumes"] = challenge.volumes
+        for attr, value in cls.compile_profile(profile_data).items():
             setattr(challenge, attr, value)
 
         # recalculate the challenge value after update
-        return cls.calculate_value(challenge)
+        challenge = cls.calculate_value(challenge)
+        current_app.container_manager.invalidate_challenge(challenge.id)
+
+        # pooled containers were started from the old config, replace them
+        warm_pool = current_app.container_manager.warm_pool
+        if spawn_config[0] != challenge.image:
+            current_app.container_manager.images.pull_async(challenge.image)
+        if spawn_config != (challenge.image, challenge.port, challenge.command, challenge.run_kwargs):
+            warm_pool.reset(challenge.id)
+        else:
+            warm_pool.refill_async(challenge.id)
+
+        return challenge
+
+    @classmethod
+    def delete(cls, challenge):
+        # pool rows cascade with the challenge, their containers have to be killed first
+        current_app.container_manager.warm_pool.reset(challenge.id)
+        current_app.container_manager.invalidate_challenge(challenge.id)
+        # drop the assigned rows here instead of through the cascade, so clients
+        # following the change sequence get tombstones for them
+        remove_containers(ContainerInfoModel.challenge_id == challenge.id)
+        super().delete(challenge)
 
     @classmethod
     def solve(cls, user, team, challenge, request):
         # call the parent solve method to register the solve
         super().solve(user, team, challenge, request)
+
+        # solves of hidden or banned accounts don't count towards the decay
+        account = team if get_model() is Teams else user
+        if not (account.hidden or account.banned):
+            solve_counts.increment(challenge.id)
+            db.session.expire(challenge, ["solve_count"])
+
         # recalculate the challenge value after a solve
         cls.calculate_value(challenge)
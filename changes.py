@@ -0,0 +1,209 @@
+import time
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from CTFd.models import db
+from .models import ContainerInfoModel, ContainerTombstoneModel, ContainerSequenceModel
+from .nodes import DEFAULT_NODE
+
+# how long removed rows are remembered for clients catching up with a since cursor.
+# a cursor older than the pruned tombstones gets a full snapshot instead.
+TOMBSTONE_TTL = 3600  # seconds
+
+# how often old tombstones are pruned
+TOMBSTONE_PRUNE_INTERVAL = 600  # seconds
+
+# changes returned per page of the running containers api
+CHANGES_PER_PAGE = 500
+MAX_CHANGES_PER_PAGE = 5000
+
+# filters the running containers api accepts. older_than is left out since rows
+# would start matching it without changing.
+CHANGE_FILTERS = ("challenge_id", "team_id", "user_id", "node")
+
+
+def filter_containers(query, model, filters: dict):
+    # narrow a query on container_info (or a model with the same owner columns) to
+    # the rows matching the given challenge, owner, node and age filters
+    for column in ("challenge_id", "team_id", "user_id"):
+        if filters.get(column) is not None:
+            query = query.filter(getattr(model, column) == filters[column])
+
+    node = filters.get("node")
+    if node == DEFAULT_NODE:
+        query = query.filter(or_(model.node == node, model.node.is_(None)))
+    elif node:
+        query = query.filter(model.node == node)
+
+    if filters.get("older_than"):
+        cutoff = int(time.time()) - filters["older_than"] * 60
+        query = query.filter(model.timestamp < cutoff)
+
+    return query
+
+
+def next_version() -> int:
+    # bump the change sequence inside the caller's transaction. the sequence row stays
+    # locked until that commits, so versions become visible in order and a client
+    # reading up to the current value never skips a write committed later.
+    bump = {"value": ContainerSequenceModel.value + 1}
+    updated = ContainerSequenceModel.query.filter_by(id=1).update(bump, synchronize_session=False)
+    if not updated:
+        # the row the migration seeds is missing, create it in a savepoint so that
+        # losing the race to a concurrent first writer doesn't fail the caller
+        try:
+            with db.session.begin_nested():
+                db.session.add(ContainerSequenceModel(id=1, value=1, pruned=0))
+        except IntegrityError:
+            ContainerSequenceModel.query.filter_by(id=1).update(bump, synchronize_session=False)
+    return db.session.query(ContainerSequenceModel.value).filter_by(id=1).scalar()
+
+
+def remove_containers(*criteria) -> int:
+    # delete the container_info rows matching criteria and leave a tombstone for each,
+    # in the caller's transaction. returns the number of rows deleted.
+    version = next_version()
+    rows = (
+        db.session.query(
+            ContainerInfoModel.container_id,
+            ContainerInfoModel.challenge_id,
+            ContainerInfoModel.team_id,
+            ContainerInfoModel.user_id,
+            ContainerInfoModel.node,
+        )
+        .filter(*criteria)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    now = int(time.time())
+    db.session.execute(
+        ContainerTombstoneModel.__table__.insert(),
+        [
+            {
+                "container_id": container_id,
+                "challenge_id": challenge_id,
+                "team_id": team_id,
+                "user_id": user_id,
+                "node": node,
+                "version": version,
+                "removed": now,
+            }
+            for container_id, challenge_id, team_id, user_id, node in rows
+        ],
+    )
+    return ContainerInfoModel.query.filter(*criteria).delete(synchronize_session=False)
+
+
+def prune_tombstones(app):
+    # periodic job, drops tombstones older than TOMBSTONE_TTL and records up to which
+    # version they are gone
+    with app.app_context():
+        cutoff = int(time.time()) - TOMBSTONE_TTL
+        pruned = (
+            db.session.query(db.func.max(ContainerTombstoneModel.version))
+            .filter(ContainerTombstoneModel.removed < cutoff)
+            .scalar()
+        )
+        if pruned is None:
+            return
+
+        ContainerSequenceModel.query.filter(
+            ContainerSequenceModel.id == 1, ContainerSequenceModel.pruned < pruned
+        ).update({"pruned": pruned}, synchronize_session=False)
+        ContainerTombstoneModel.query.filter(
+            ContainerTombstoneModel.version <= pruned
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def container_changes(since: int, filters: dict, limit: int = CHANGES_PER_PAGE) -> dict:
+    # assigned containers written and ids of containers removed after version since,
+    # oldest first. a since of 0, or one older than the pruned tombstones, resets the
+    # client to a full snapshot. version is the cursor for the next call.
+    current, pruned = (
+        db.session.query(ContainerSequenceModel.value, ContainerSequenceModel.pruned)
+        .filter_by(id=1)
+        .first()
+    ) or (0, 0)
+
+    reset = since <= 0 or since < (pruned or 0)
+    if reset:
+        since = 0
+
+    # reservations have no port yet, they show up once swapped for their container
+    rows = filter_containers(
+        ContainerInfoModel.query.options(
+            joinedload(ContainerInfoModel.challenge),
+            joinedload(ContainerInfoModel.team),
+            joinedload(ContainerInfoModel.user),
+        ).filter(ContainerInfoModel.port.isnot(None)),
+        ContainerInfoModel,
+        filters,
+    )
+    tombstones = filter_containers(
+        db.session.query(ContainerTombstoneModel.version, ContainerTombstoneModel.container_id),
+        ContainerTombstoneModel,
+        filters,
+    )
+
+    changed = rows.filter(ContainerInfoModel.version > since).order_by(ContainerInfoModel.version).limit(limit + 1).all()
+    removed = []
+    if not reset:
+        removed = tombstones.filter(ContainerTombstoneModel.version > since).order_by(
+            ContainerTombstoneModel.version
+        ).limit(limit + 1).all()
+
+    items = sorted(
+        [(row.version, row, None) for row in changed] + [(version, None, cid) for version, cid in removed],
+        key=lambda item: item[0],
+    )
+
+    has_more = len(items) > limit
+    if has_more:
+        # one write can touch many rows under a single version, a page never ends
+        # halfway through one or the cursor would skip the rest
+        version = items[limit - 1][0]
+        items = [item for item in items if item[0] < version]
+        changed = [item[1] for item in items if item[1] is not None]
+        changed += rows.filter(ContainerInfoModel.version == version).all()
+        removed = [item[2] for item in items if item[2] is not None]
+        if not reset:
+            removed += [cid for _, cid in tombstones.filter(ContainerTombstoneModel.version == version).all()]
+    else:
+        version = max([current or 0] + [item[0] for item in items])
+        changed = [item[1] for item in items if item[1] is not None]
+        removed = [item[2] for item in items if item[2] is not None]
+
+    return {
+        "version": version,
+        "reset": reset,
+        "has_more": has_more,
+        "containers": changed,
+        "removed": removed,
+    }
+
+
+class ChangeFeed:
+    # follows the change sequence for a client that keeps the full state, e.g. a push
+    # stream. every load only reads what changed since the previous one.
+    def __init__(self, filters: dict, serialize):
+        self.filters = filters
+        self.serialize = serialize  # list of rows -> {container id: state}
+        self.version = 0
+        self.rows = {}
+
+    def load(self) -> dict:
+        while True:
+            changes = container_changes(self.version, self.filters, MAX_CHANGES_PER_PAGE)
+            if changes["reset"]:
+                self.rows = {}
+            for container_id in changes["removed"]:
+                self.rows.pop(container_id, None)
+            self.rows.update(self.serialize(changes["containers"]))
+            self.version = changes["version"]
+            if not changes["has_more"]:
+                return dict(self.rows)
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from .nodes import PLUGIN_LABEL
+from .readiness import wait_for_port
+from .coordination import SharedState
+
+# where checkpoints are written on the docker hosts, one directory per challenge config
+DEFAULT_CHECKPOINT_DIR = "/var/lib/ctfd-containers/checkpoints"
+
+# how long a template container may take to become ready before it is checkpointed
+CHECKPOINT_READY_TIMEOUT = 180  # seconds
+
+# how long a node that failed to checkpoint or restore is left on cold starts
+CHECKPOINT_RETRY_INTERVAL = 3600  # seconds
+
+# templates started and checkpointed concurrently in the background
+CHECKPOINT_WORKERS = 2
+
+# a build is claimed through the coordination backend so one worker builds each
+# checkpoint, and the result is published there for the others
+CHECKPOINT_BUILD_TTL = CHECKPOINT_READY_TIMEOUT + 60  # seconds
+CHECKPOINT_TTL = 7 * 24 * 3600  # seconds, an expired checkpoint is built again
+
+
+def checkpoint_key(image: str, port: int, command: str, run_kwargs: dict) -> str:
+    # identifies the spawn config a checkpoint was taken from, any change needs a new one
+    config = json.dumps([image, port, command, run_kwargs], sort_keys=True, default=str)
+    return hashlib.sha1(config.encode()).hexdigest()[:12]
+
+
+def shared_key(node_name: str, chal_id, key: str) -> str:
+    return f"checkpoint:{node_name}:{chal_id}:{key}"
+
+
+class Checkpoint:
+    def __init__(self, name: str, directory: str, key: str, created: float = None):
+        self.name = name
+        self.directory = directory
+        self.key = key
+        self.created = created or time.time()
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "directory": self.directory, "key": self.key, "created": self.created}
+
+
+class CheckpointManager:
+    # fast starts for challenges whose services take long to come up. a template
+    # container is started once per challenge and node, checkpointed (criu, through
+    # docker's experimental checkpoint api) once it accepts connections, and user
+    # instances are restored from that checkpoint already listening. nodes without
+    # checkpoint support, and spawns before the checkpoint exists, start cold.
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.checkpoints = {}  # (node name, challenge id) -> Checkpoint
+        self.building = set()  # (node name, challenge id) of templates in progress
+        self.unsupported = {}  # node name -> time until which it starts cold
+        self.shared = SharedState(manager, "checkpoints:")
+        self.executor = ThreadPoolExecutor(
+            max_workers=CHECKPOINT_WORKERS, thread_name_prefix="container-checkpoint"
+        )
+
+    def get_directory(self) -> str:
+        return (self.manager.settings.get("checkpoint_dir") or DEFAULT_CHECKPOINT_DIR).rstrip("/")
+
+    def is_supported(self, node) -> bool:
+        # checkpoints need an experimental daemon, criu itself only shows on first use
+        if not node.info.get("ExperimentalBuild"):
+            return False
+        with self.lock:
+            return self.unsupported.get(node.name, 0) <= time.time()
+
+    def mark_unsupported(self, node, reason):
+        print(f"[container checkpoints] node {node.name} falls back to cold starts: {reason}")
+        with self.lock:
+            self.unsupported[node.name] = time.time() + CHECKPOINT_RETRY_INTERVAL
+            for key in [key for key in self.checkpoints if key[0] == node.name]:
+                del self.checkpoints[key]
+
+    def invalidate(self, challenge_id):
+        with self.lock:
+            for key in [key for key in self.checkpoints if str(key[1]) == str(challenge_id)]:
+                del self.checkpoints[key]
+
+    def lookup(self, node, chal_id: str, image: str, port: int, command: str, run_kwargs: dict):
+        # the checkpoint to restore a new instance from, None for a cold start. a
+        # missing or outdated checkpoint is built in the background for later spawns.
+        if not self.is_supported(node):
+            return None
+
+        key = checkpoint_key(image, port, command, run_kwargs)
+        entry = (node.name, str(chal_id))
+        with self.lock:
+            checkpoint = self.checkpoints.get(entry)
+            if checkpoint is not None and checkpoint.key == key:
+                return checkpoint
+            if entry in self.building:
+                return None
+
+        # built by another worker
+        checkpoint = self._shared(node.name, chal_id, key)
+        if checkpoint is not None:
+            with self.lock:
+                self.checkpoints[entry] = checkpoint
+            return checkpoint
+
+        with self.lock:
+            if entry in self.building:
+                return None
+            self.building.add(entry)
+        if not self._claim_build(node.name, chal_id, key):
+            with self.lock:
+                self.building.discard(entry)
+            return None
+
+        self.executor.submit(self._build_task, node, chal_id, image, port, command, run_kwargs, key)
+        return None
+
+    def _shared(self, node_name: str, chal_id, key: str):
+        try:
+            value = self.manager.coordinator.get(shared_key(node_name, chal_id, key))
+        except Exception as e:
+            print(f"[container checkpoints] could not look up shared checkpoints: {e}")
+            return None
+        if not value:
+            return None
+        try:
+            state = json.loads(value)
+            return Checkpoint(state["name"], state["directory"], state["key"], state["created"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def _claim_build(self, node_name: str, chal_id, key: str) -> bool:
+        # false while another worker builds the same checkpoint. without a reachable
+        # backend each worker builds its own, their names don't collide.
+        try:
+            return self.manager.coordinator.claim(
+                f"checkpoint_build:{node_name}:{chal_id}:{key}",
+                self.manager.instance_id,
+                ttl=CHECKPOINT_BUILD_TTL,
+            )
+        except Exception as e:
+            print(f"[container checkpoints] could not claim checkpoint build: {e}")
+            return True
+
+    def _publish(self, node_name: str, chal_id, checkpoint: Checkpoint):
+        coordinator = self.manager.coordinator
+        try:
+            coordinator.claim(
+                shared_key(node_name, chal_id, checkpoint.key),
+                self.manager.instance_id,
+                json.dumps(checkpoint.to_dict()),
+                ttl=CHECKPOINT_TTL,
+            )
+            coordinator.release(f"checkpoint_build:{node_name}:{chal_id}:{checkpoint.key}", self.manager.instance_id)
+        except Exception as e:
+            print(f"[container checkpoints] could not publish checkpoint {checkpoint.name}: {e}")
+
+    def shared_state(self) -> dict:
+        # builds in progress and nodes on cold starts, as seen by this worker
+        with self.lock:
+            return {
+                "building": len(self.building),
+                "unsupported": sorted(name for name, until in self.unsupported.items() if until > time.time()),
+            }
+
+    def publish(self):
+        self.shared.publish(self.shared_state())
+
+    def snapshot(self) -> dict:
+        # checkpoints published by every worker, and the builds and unsupported nodes
+        # of every worker
+        checkpoints = {}
+        with self.lock:
+            for (node, challenge_id), checkpoint in self.checkpoints.items():
+                checkpoints[checkpoint.name] = {
+                    "node": node, "challenge_id": challenge_id, "name": checkpoint.name, "created": checkpoint.created,
+                }
+        try:
+            published = self.manager.coordinator.scan("checkpoint:")
+        except Exception as e:
+            print(f"[container checkpoints] could not read shared checkpoints: {e}")
+            published = {}
+        for key, value in published.items():
+            try:
+                node, challenge_id, _ = key[len("checkpoint:"):].rsplit(":", 2)
+                state = json.loads(value)
+                checkpoints.setdefault(state["name"], {
+                    "node": node, "challenge_id": challenge_id, "name": state["name"], "created": state["created"],
+                })
+            except (ValueError, KeyError, TypeError):
+                continue
+
+        states = self.shared.collect(self.shared_state())
+        return {
+            "checkpoints": list(checkpoints.values()),
+            "building": sum(state.get("building") or 0 for state in states),
+            "unsupported": sorted({name for state in states for name in state.get("unsupported") or []}),
+        }
+
+    def _build_task(self, node, chal_id, image, port, command, run_kwargs, key):
+        entry = (node.name, str(chal_id))
+        try:
+            checkpoint = self.build(node, chal_id, image, port, command, run_kwargs, key)
+            if checkpoint is not None:
+                with self.lock:
+                    self.checkpoints[entry] = checkpoint
+                self._publish(node.name, chal_id, checkpoint)
+        except Exception as e:
+            print(f"[container checkpoints] could not checkpoint challenge {chal_id} on {node.name}: {e}")
+        finally:
+            with self.lock:
+                self.building.discard(entry)
+
+    def build(self, node, chal_id, image, port, command, run_kwargs, key):
+        # start a template, wait until it listens and checkpoint it. the checkpoint
+        # outlives the template since it is written to its own directory. every build
+        # gets a name of its own, so it never collides with one built before.
+        build = uuid.uuid4().hex[:8]
+        name = f"ctfd-{chal_id}-{key}-{build}"
+        directory = f"{self.get_directory()}/{chal_id}-{key}-{build}"
+
+        template = self.manager._run_container(
+            node,
+            image,
+            port,
+            command,
+            run_kwargs,
+            environment={"CHALLENGE_ID": str(chal_id)},
+            labels={
+                f"{PLUGIN_LABEL}.challenge_id": str(chal_id),
+                f"{PLUGIN_LABEL}.template": "true",
+            },
+        )
+        try:
+            if not wait_for_port(node.hostname, node.port_allocator.port_of(template.id), CHECKPOINT_READY_TIMEOUT):
+                print(f"[container checkpoints] template of challenge {chal_id} never became ready")
+                return None
+
+            api = node.client.api
+            try:
+                response = api._post_json(
+                    api._url("/containers/{0}/checkpoints", template.id),
+                    data={"CheckpointID": name, "CheckpointDir": directory, "Exit": True},
+                )
+                api._raise_for_status(response)
+            except docker.errors.DockerException as e:
+                self.mark_unsupported(node, e)
+                return None
+        finally:
+            try:
+                template.remove(force=True)
+            except docker.errors.DockerException:
+                pass  # already gone, checkpointing with Exit stops it
+            node.port_allocator.release_container(template.id)
+
+        return Checkpoint(name, directory, key)
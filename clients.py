@@ -0,0 +1,42 @@
+import docker
+
+# connections kept per docker client, the sdk default is 10
+DEFAULT_POOL_SIZE = 10
+
+# timeout for docker api calls
+DEFAULT_TIMEOUT = 60  # seconds
+
+# interval of the ssh keepalive packets sent on idle ssh:// transports, so
+# firewalls and sshd don't drop the session between requests
+SSH_KEEPALIVE_INTERVAL = 30  # seconds
+
+
+def build_client(base_url: str, pool_size: int = DEFAULT_POOL_SIZE, timeout: int = DEFAULT_TIMEOUT):
+    # create a docker client with a bounded connection pool. for ssh:// urls the sdk
+    # multiplexes pooled connections as channels over a single paramiko session,
+    # which is opened here and kept alive so it can be reused for the client's lifetime.
+    client = docker.DockerClient(base_url=base_url, max_pool_size=pool_size, timeout=timeout)
+    keep_alive(client)
+    return client
+
+
+def keep_alive(client, interval: int = SSH_KEEPALIVE_INTERVAL):
+    # enable keepalives on the paramiko session of an ssh client, no-op otherwise
+    adapter = getattr(client.api, "_custom_adapter", None)
+    ssh_client = getattr(adapter, "ssh_client", None)
+    if ssh_client is None:
+        return
+
+    transport = ssh_client.get_transport()
+    if transport is not None:
+        transport.set_keepalive(interval)
+
+
+def close_client(client):
+    # release pooled connections and the ssh session, ignoring already broken ones
+    if client is None:
+        return
+    try:
+        client.close()
+    except Exception:
+        pass
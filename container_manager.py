@@ -1,18 +1,88 @@
 import atexit
-import time
+import io
 import json
-import random
+import os
+import time
+import uuid
 import socket
+import tarfile
+import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import Flask
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.schedulers import SchedulerNotRunningError
 import docker
-import paramiko
-import requests
 
 from CTFd.models import db
-from .models import ContainerInfoModel
+from .models import ContainerInfoModel, ContainerPoolModel, ContainerChallengeModel, ContainerSettingsModel
+from .port_allocator import DEFAULT_PORT_RANGE
+from .health import HEALTHY
+from .nodes import DockerNode, parse_nodes, PLUGIN_LABEL, DEFAULT_NODE, CONNECTION_ERRORS
+from .placement import choose_node, fits, STRATEGIES, DEFAULT_STRATEGY
+from .clients import DEFAULT_POOL_SIZE
+from .warm_pool import WarmPool
+from .spawn_jobs import SpawnQueue
+from .admission import AdmissionController, ADMISSION_RETRY_INTERVAL, DEFAULT_OVERCOMMIT
+from .activity import ActivityMonitor, ACTIVITY_SAMPLE_INTERVAL
+from .checkpoints import CheckpointManager
+from .readiness import ReadinessTracker, READY_RESUME_INTERVAL
+from .push import StateNotifier
+from .bulk_jobs import BulkKiller
+from .challenge_cache import ChallengeCache
+from .metrics import timed, REAPER_BATCH_SIZE
+from .images import ImageManager, DEFAULT_PULL_CONCURRENCY, IMAGE_CHECK_INTERVAL
+from .profiles import default_run_kwargs
+from .changes import remove_containers, prune_tombstones, TOMBSTONE_PRUNE_INTERVAL
+from .challenges import ContainerChallenge
+from .solve_counts import SOLVE_COUNT_REBUILD_INTERVAL
+from .coordination import (
+    LocalCoordination,
+    build_coordination,
+    JobBoard,
+    port_key,
+    COORDINATION_INTERVAL,
+    LEADER_KEY,
+    LEADER_TTL,
+    SETTINGS_CHANNEL,
+    CHALLENGES_CHANNEL,
+)
+from .utils import settings_to_dict
+
+# how many times a spawn retries with a fresh port when docker reports a conflict
+PORT_CONFLICT_RETRIES = 5
+
+# how long a worker's claim on a host port keeps the other workers off it. it has to
+# outlast their port reconciliation, which picks the port up from docker after that.
+PORT_CLAIM_TTL = 120  # seconds
+
+# number of containers killed concurrently by bulk operations such as the reaper
+KILL_CONCURRENCY = 16
+
+# setting the owner index migration records the containers of dropped duplicate rows
+# in, as [container id, node] pairs. they are killed once their node is reachable.
+ORPHANS_SETTING = "orphaned_containers"
+ORPHAN_KILL_INTERVAL = 60  # seconds
+
+# upper bound on how long the reaper sleeps, even when nothing is about to expire
+REAPER_MAX_INTERVAL = 60  # seconds
+
+# how soon the reaper retries expired containers it could not kill, e.g. on a node
+# that is down
+REAPER_RETRY_INTERVAL = 30  # seconds
+
+# file inside a pooled container that receives the owner ids once it is assigned
+ASSIGNMENT_ENV_PATH = "/etc/ctfd.env"
+
+# how often the warm pools are topped up in the background
+POOL_REFILL_INTERVAL = 30  # seconds
+
+# how often the background heartbeat pings the daemon
+HEARTBEAT_INTERVAL = 5  # seconds
+
+# page size of the admin image picker, and the largest page a client may ask for
+IMAGES_PER_PAGE = 50
+MAX_IMAGES_PER_PAGE = 500
 
 
 class ContainerException(Exception):
@@ -24,45 +94,150 @@ class ContainerException(Exception):
         return self.message
 
 
+class CheckpointRestoreError(ContainerException):
+    # the daemon could not start a container from its checkpoint
+    pass
+
+
+def _is_port_conflict(error: docker.errors.APIError) -> bool:
+    # docker reports host port collisions as a generic 500 with one of these messages
+    message = str(error).lower()
+    return "port is already allocated" in message or "address already in use" in message
+
+
 class ContainerManager:
     def __init__(self, settings, app):
         self.settings = settings
         self.app = app
-        self.client = None
+        self.nodes = {}  # node name -> DockerNode
+        self.expiration_seconds = 0
+        self.scheduler = None
+        # workers share leadership of the background jobs, settings broadcasts and port
+        # and capacity claims through the coordination backend
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.coordinator = LocalCoordination()
+        self.coordination_config = None
+        self.leader = False
+        self.settings_generation = None
+        self.challenges_generation = None
+        self.warm_pool = WarmPool(self)
+        self.admission = AdmissionController(self)
+        self.spawn_queue = SpawnQueue(app, admission=self.admission, board=JobBoard(self, "spawn:"))
+        self.bulk_killer = BulkKiller(self)
+        self.challenge_cache = ChallengeCache()
+        self.images = ImageManager(self)
+        self.activity = ActivityMonitor(self)
+        self.checkpoints = CheckpointManager(self)
+        self.notifier = StateNotifier()
+        self.readiness = ReadinessTracker(self)
+        self.default_run_kwargs = {}  # run kwargs of the global limits
+        self.kill_executor = ThreadPoolExecutor(
+            max_workers=KILL_CONCURRENCY, thread_name_prefix="container-kill"
+        )
+
+        try:
+            self.configure_coordination()
+        except ContainerException as e:
+            print(f"[container coordination] {e}, coordinating within this worker only")
+
+        # nodes connect lazily, on the first heartbeat or the first call routed to them
+        if settings.get("docker_base_url") or settings.get("docker_nodes"):
+            try:
+                self.initialize_connection(connect=False)
+            except ContainerException:
+                print("docker could not initialize or connect.")
 
-        docker_base_url = settings.get("docker_base_url", "")
-        if not docker_base_url:
+        # unconfigured workers still follow settings broadcasts from the others
+        self.setup_scheduler()
+
+    def configure_coordination(self):
+        # (re)build the coordination backend if its settings changed
+        config = (self.settings.get("coordination_backend") or "", self.settings.get("coordination_dir") or "")
+        if config == self.coordination_config:
             return
+        try:
+            self.coordinator = build_coordination(*config, self.app)
+        except (ValueError, OSError) as e:
+            raise ContainerException(f"invalid coordination settings: {e}")
+        self.coordination_config = config
+        self.leader = False
 
-        # initialize docker client
+    @timed("coordination")
+    def coordinate(self):
+        # periodic job on every worker: hold or contend for leadership of the shared
+        # background jobs and pick up settings saved by another worker
         try:
-            self.initialize_connection()
-        except ContainerException:
-            print("docker could not initialize or connect.")
+            self.leader = self.coordinator.claim(LEADER_KEY, self.instance_id, ttl=LEADER_TTL)
+            generation = self.coordinator.generation(SETTINGS_CHANNEL)
+            challenges_generation = self.coordinator.generation(CHALLENGES_CHANNEL)
+        except Exception as e:
+            # without the backend nobody can tell who leads, stand down until it's back
+            self.leader = False
+            print(f"[container coordination] backend unavailable: {e}")
+            return
+
+        if self.settings_generation is None:
+            self.settings_generation = generation
+        elif generation != self.settings_generation:
+            self.settings_generation = generation
+            self.reload_settings()
+
+        # a challenge was edited on another worker, which one isn't broadcast
+        if self.challenges_generation is None:
+            self.challenges_generation = challenges_generation
+        elif challenges_generation != self.challenges_generation:
+            self.challenges_generation = challenges_generation
+            self.challenge_cache.clear()
 
-    def initialize_connection(self):
-        # shut down existing scheduler if running
+        # the status views on every worker merge what each one tracks
+        self.images.publish()
+        self.warm_pool.publish()
+        self.checkpoints.publish()
+
+    def reload_settings(self):
+        # re-read the settings from the database and apply them to this worker
+        with self.app.app_context():
+            self.settings = settings_to_dict(ContainerSettingsModel.query.all())
         try:
-            self.expiration_scheduler.shutdown()
-        except (SchedulerNotRunningError, AttributeError):
-            pass  # scheduler was never running
+            self.configure_coordination()
+            if self.settings.get("docker_base_url") or self.settings.get("docker_nodes"):
+                self.initialize_connection()
+        except ContainerException as e:
+            print(f"[container coordination] could not apply new settings: {e}")
 
-        docker_base_url = self.settings.get("docker_base_url", "")
-        if not docker_base_url:
-            self.client = None
-            return
+    def publish_settings(self):
+        # tell the other workers to reload the settings this worker just saved
+        try:
+            self.settings_generation = self.coordinator.bump(SETTINGS_CHANNEL)
+        except Exception as e:
+            print(f"[container coordination] could not broadcast settings: {e}")
+
+    def invalidate_challenge(self, challenge_id):
+        # drop a created, edited or deleted challenge here and tell the other workers
+        self.challenge_cache.invalidate(challenge_id)
+        self.checkpoints.invalidate(challenge_id)
+        try:
+            self.challenges_generation = self.coordinator.bump(CHALLENGES_CHANNEL)
+        except Exception as e:
+            print(f"[container coordination] could not broadcast challenge change: {e}")
+
+    def leader_only(self, func):
+        # background jobs acting on shared state run on the leading worker only
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.leader:
+                return func(*args, **kwargs)
+        return wrapper
 
-        # initialize docker client
+    @timed("initialize_connection")
+    def initialize_connection(self, connect: bool = True):
+        # apply the current settings. nodes whose connection settings are unchanged keep
+        # their client and pooled connections, changed nodes are rebuilt and removed
+        # ones closed. the scheduler is started once and survives settings changes.
         try:
-            self.client = docker.DockerClient(base_url=docker_base_url)
-            self.client.ping()
-        except (
-            docker.errors.DockerException,
-            paramiko.ssh_exception.SSHException,
-            requests.exceptions.RequestException,
-        ) as e:
-            self.client = None
-            raise ContainerException(f"could not connect to docker: {e}")
+            node_specs = parse_nodes(self.settings)
+        except ValueError as e:
+            raise ContainerException(str(e))
 
         # set up container expiration scheduler
         try:
@@ -70,81 +245,512 @@ class ContainerManager:
         except (ValueError, TypeError):
             self.expiration_seconds = 0
 
+        self.configure_coordination()
+        port_range = self.get_port_range()
+        pool_size = self.get_pool_size()
+        self.images.configure(self.get_pull_concurrency())
+        self.default_run_kwargs = default_run_kwargs(*self.get_resource_limits())
+        self.get_overcommit()
+        self.get_idle_timeout()
+
+        nodes = {}
+        rebuilt = []
+        for name, base_url, hostname in node_specs:
+            node = self.nodes.get(name)
+            if node is None or node.base_url != base_url or node.pool_size != pool_size:
+                if node is not None:
+                    node.disconnect()
+                node = DockerNode(
+                    name, base_url, hostname, self.app,
+                    on_failure=self.on_node_failure, on_exit=self.on_container_exit,
+                    pool_size=pool_size,
+                )
+                rebuilt.append(node)
+            node.hostname = hostname
+
+            if port_range != (node.port_allocator.start, node.port_allocator.end):
+                node.port_allocator.configure(*port_range)
+                node.reconcile_ports()
+            nodes[name] = node
+
+        for name, node in self.nodes.items():
+            if name not in nodes:
+                node.disconnect()
+        self.nodes = nodes
+
+        if not self.nodes:
+            return
+
+        self.setup_scheduler()
+
+        if not connect:
+            return
+
+        errors = []
+        for node in rebuilt:
+            try:
+                node.connect()
+            except (docker.errors.DockerException,) + CONNECTION_ERRORS as e:
+                errors.append(f"{node.name}: {e}")
+
+        if errors:
+            raise ContainerException(f"could not connect to docker: {'; '.join(errors)}")
+
+    @timed("heartbeat")
+    def heartbeat(self):
+        # refresh the cached health state of every node
+        for node in list(self.nodes.values()):
+            node.heartbeat()
+
+    def on_container_exit(self, container_id: str):
+        # a container died or was removed behind our back, drop its rows
+        self.readiness.cancel(container_id)
+        with self.app.app_context():
+            assigned = remove_containers(ContainerInfoModel.container_id == container_id)
+            ContainerPoolModel.query.filter_by(container_id=container_id).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+
+        if assigned:
+            self.notifier.notify()
+
+    def on_node_failure(self, node):
+        # a real call failed on a node, check it again right away
+        try:
+            self.scheduler.modify_job("docker_heartbeat", next_run_time=datetime.datetime.now())
+        except Exception:
+            pass  # scheduler is not running or is being rebuilt
+
+    def setup_scheduler(self):
+        port_reconcile_interval = 60  # seconds
+
+        if self.scheduler is None:
+            # initialize the background scheduler
+            self.scheduler = BackgroundScheduler()
+            self.scheduler.add_job(
+                func=self.coordinate,
+                trigger="interval",
+                seconds=COORDINATION_INTERVAL,
+                id="container_coordination",
+                next_run_time=datetime.datetime.now(),
+            )
+            self.scheduler.add_job(
+                func=self.leader_only(self.rebuild_solve_counts),
+                trigger="interval",
+                seconds=SOLVE_COUNT_REBUILD_INTERVAL,
+            )
+            self.scheduler.start()
+
+            # ensure scheduler shuts down when app exits
+            atexit.register(lambda: self.scheduler.shutdown(wait=False))
+
+        if not self.nodes:
+            return
+
+        # the docker jobs are added once the first node is configured. heartbeats, port
+        # reconciliation and admission act on this worker's own view and run everywhere,
+        # the jobs changing shared state only run on the leader.
+        if self.scheduler.get_job("docker_heartbeat") is None:
+            self.scheduler.add_job(
+                func=self.heartbeat,
+                trigger="interval",
+                seconds=HEARTBEAT_INTERVAL,
+                id="docker_heartbeat",
+                next_run_time=datetime.datetime.now(),
+            )
+            self.scheduler.add_job(
+                func=self.reconcile_ports,
+                trigger="interval",
+                seconds=port_reconcile_interval,
+            )
+            self.scheduler.add_job(
+                func=self.leader_only(self.warm_pool.refill_all),
+                trigger="interval",
+                seconds=POOL_REFILL_INTERVAL,
+            )
+            self.scheduler.add_job(
+                func=self.leader_only(self.activity.run),
+                trigger="interval",
+                seconds=ACTIVITY_SAMPLE_INTERVAL,
+            )
+            self.scheduler.add_job(
+                func=self.leader_only(self.prune_shared_state),
+                trigger="interval",
+                seconds=TOMBSTONE_PRUNE_INTERVAL,
+            )
+            self.scheduler.add_job(
+                func=self.leader_only(self.kill_orphans),
+                trigger="interval",
+                seconds=ORPHAN_KILL_INTERVAL,
+                next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=2 * HEARTBEAT_INTERVAL),
+            )
+            # starting containers whose watch died with its worker
+            self.scheduler.add_job(
+                func=self.leader_only(self.readiness.resume),
+                trigger="interval",
+                seconds=READY_RESUME_INTERVAL,
+                next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=2 * COORDINATION_INTERVAL),
+            )
+            # waiting spawns also get admitted when capacity is freed elsewhere
+            self.scheduler.add_job(
+                func=self.admission.dispatch_async,
+                trigger="interval",
+                seconds=ADMISSION_RETRY_INTERVAL,
+            )
+            # first check once the lazily connected nodes had a heartbeat to connect
+            self.scheduler.add_job(
+                func=self.leader_only(self.images.pull_all),
+                trigger="interval",
+                seconds=IMAGE_CHECK_INTERVAL,
+                next_run_time=datetime.datetime.now() + datetime.timedelta(seconds=2 * HEARTBEAT_INTERVAL),
+            )
+
+        # the expiration setting may have changed, (re)arm or drop the reaper
         if self.expiration_seconds > 0:
-            self.setup_expiration_scheduler()
-
-    def setup_expiration_scheduler(self):
-        expiration_check_interval = 5  # seconds
-
-        # initialize the background scheduler
-        self.expiration_scheduler = BackgroundScheduler()
-        self.expiration_scheduler.add_job(
-            func=self.kill_expired_containers,
-            args=(self.app,),
-            trigger="interval",
-            seconds=expiration_check_interval,
-        )
-        self.expiration_scheduler.start()
+            self.schedule_reaper(time.time())
+        elif self.scheduler.get_job("container_reaper"):
+            self.scheduler.remove_job("container_reaper")
+
+    def kill_orphans(self):
+        # kill the containers whose rows the owner index migration dropped, keeping
+        # the ones on unreachable nodes for the next run
+        with self.app.app_context():
+            setting = ContainerSettingsModel.query.filter_by(key=ORPHANS_SETTING).first()
+            if setting is None:
+                return
+            try:
+                orphans = [tuple(orphan) for orphan in json.loads(setting.value or "[]")]
+            except (ValueError, TypeError):
+                orphans = []
+
+            failed = set(self.kill_containers(orphans)) if orphans else set()
+            remaining = [[container_id, node] for container_id, node in orphans if container_id in failed]
+            if remaining:
+                setting.value = json.dumps(remaining)
+            else:
+                db.session.delete(setting)
+            db.session.commit()
+
+    def rebuild_solve_counts(self):
+        # recount the solves of every container challenge and update their values
+        with self.app.app_context():
+            ContainerChallenge.recalculate_all()
 
-        # ensure scheduler shuts down when app exits
-        atexit.register(lambda: self.expiration_scheduler.shutdown())
+    def prune_shared_state(self):
+        # drop tombstones and coordination claims nobody needs anymore
+        prune_tombstones(self.app)
+        self.coordinator.prune()
 
-    def _is_port_available(self, port: int) -> bool:
-        # check if a given port is available for binding
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(1)
+    def get_port_range(self) -> tuple:
+        # the configured host port range, falling back to the full unprivileged range
+        try:
+            start = int(self.settings.get("container_port_min") or DEFAULT_PORT_RANGE[0])
+            end = int(self.settings.get("container_port_max") or DEFAULT_PORT_RANGE[1])
+        except (ValueError, TypeError):
+            raise ContainerException("configured container port range must be integers")
+
+        if not (0 < start <= end <= 65535):
+            raise ContainerException(f"invalid port range {start}-{end}")
+        return start, end
+
+    def get_pool_size(self) -> int:
+        # connections kept per docker node
+        try:
+            pool_size = int(self.settings.get("docker_pool_size") or DEFAULT_POOL_SIZE)
+        except (ValueError, TypeError):
+            raise ContainerException("configured docker connection pool size must be an integer")
+
+        if pool_size < 1:
+            raise ContainerException("configured docker connection pool size must be positive")
+        return pool_size
+
+    def get_pull_concurrency(self) -> int:
+        # images pulled at the same time by the image manager
+        try:
+            concurrency = int(self.settings.get("image_pull_concurrency") or DEFAULT_PULL_CONCURRENCY)
+        except (ValueError, TypeError):
+            raise ContainerException("configured image pull concurrency must be an integer")
+
+        if concurrency < 1:
+            raise ContainerException("configured image pull concurrency must be positive")
+        return concurrency
+
+    def get_idle_timeout(self) -> int:
+        # seconds without activity after which a container is reclaimed, 0 when off
+        try:
+            idle_timeout = int(self.settings.get("idle_timeout") or 0) * 60
+        except (ValueError, TypeError):
+            raise ContainerException("configured idle timeout must be an integer")
+
+        if idle_timeout < 0:
+            raise ContainerException("configured idle timeout can't be negative")
+        return idle_timeout
+
+    def get_overcommit(self) -> float:
+        # multiple of a node's memory and cpus the container limits on it may add up to
+        try:
+            overcommit = float(self.settings.get("capacity_overcommit") or DEFAULT_OVERCOMMIT)
+        except (ValueError, TypeError):
+            raise ContainerException("configured capacity overcommit must be a number")
+
+        if overcommit <= 0:
+            raise ContainerException("configured capacity overcommit must be positive")
+        return overcommit
+
+    def get_resource_limits(self) -> tuple:
+        # global per-container memory (MB) and cpu limits, 0 when unset
+        mem_limit = 0
+        cpu_limit = 0.0
+
+        # set memory limit if specified
+        if self.settings.get("container_maxmemory"):
             try:
-                s.bind(("0.0.0.0", port))
-                return True
-            except OSError:
-                return False
+                mem_limit = max(int(self.settings["container_maxmemory"]), 0)
+            except ValueError:
+                raise ContainerException("configured container memory limit must be an integer")
+
+        # set cpu limit if specified
+        if self.settings.get("container_maxcpu"):
+            try:
+                cpu_limit = float(self.settings["container_maxcpu"])
+                if cpu_limit <= 0:
+                    raise ValueError
+            except ValueError:
+                raise ContainerException("configured container cpu limit must be a positive number")
+
+        return mem_limit, cpu_limit
+
+    @timed("reconcile_ports")
+    def reconcile_ports(self):
+        for node in list(self.nodes.values()):
+            node.reconcile_ports()
+
+    def get_node(self, name=None):
+        # a node by name, the default node (or the only one) when no name is given
+        if name is None:
+            name = DEFAULT_NODE if DEFAULT_NODE in self.nodes else next(iter(self.nodes), None)
+        return self.nodes.get(name)
+
+    def get_hostname(self, node=None) -> str:
+        # the address users connect to for containers on a node
+        docker_node = self.get_node(node)
+        if docker_node is None:
+            return self.settings.get("docker_hostname", "")
+        return docker_node.hostname
+
+    def release_port(self, container_id: str, node=None):
+        # return the host port of a container that is known to be gone
+        docker_node = self.get_node(node)
+        if docker_node is not None:
+            docker_node.port_allocator.release_container(container_id)
+
+    def get_health(self) -> dict:
+        return {name: node.health.snapshot() for name, node in self.nodes.items()}
+
+    @timed("choose_node")
+    def choose_node(self, challenge_id: int):
+        # pick the node a new container for a challenge should be placed on
+        if not any(node.is_available() for node in self.nodes.values()):
+            return None
+
+        node, _ = self.find_node(challenge_id)
+        if node is None:
+            raise ContainerException("no docker node has capacity left for this challenge")
+        return node
+
+    def find_node(self, challenge_id: int, reserved: dict = None) -> tuple:
+        # (node name, (memory MB, cpus) the container needs) for a new container of a
+        # challenge, the name is None if no available node has room for it. reserved
+        # maps node names to resources promised to spawns not in the database yet.
+        reserved = reserved or {}
+        available = [node for node in self.nodes.values() if node.is_available()]
+
+        strategy = self.settings.get("docker_scheduler") or DEFAULT_STRATEGY
+        if strategy not in STRATEGIES:
+            strategy = DEFAULT_STRATEGY
+
+        # live instances per node, rows without a node belong to the default node.
+        # reservations of spawns still in flight have no port and aren't placed yet.
+        running = {}
+        challenge_running = {}
+        instances = {}  # (node, challenge id) -> live instances
+        with self.app.app_context():
+            for model in (ContainerInfoModel, ContainerPoolModel):
+                rows = (
+                    db.session.query(model.node, model.challenge_id, db.func.count())
+                    .filter(model.port.isnot(None))
+                    .group_by(model.node, model.challenge_id)
+                    .all()
+                )
+                for name, row_challenge_id, count in rows:
+                    name = name or DEFAULT_NODE
+                    running[name] = running.get(name, 0) + count
+                    key = (name, str(row_challenge_id))
+                    instances[key] = instances.get(key, 0) + count
+                    if str(row_challenge_id) == str(challenge_id):
+                        challenge_running[name] = challenge_running.get(name, 0) + count
+
+            # capacity accounting with each challenge's own limits, the global limits
+            # stand in for challenges without a profile
+            challenge_ids = {row_challenge_id for _, row_challenge_id in instances} | {str(challenge_id)}
+            limits = {
+                str(row_id): (mem_limit, cpu_limit)
+                for row_id, mem_limit, cpu_limit in db.session.query(
+                    ContainerChallengeModel.id, ContainerChallengeModel.mem_limit, ContainerChallengeModel.cpu_limit,
+                ).filter(ContainerChallengeModel.id.in_([cid for cid in challenge_ids if cid.isdigit()]))
+            }
+
+        default_mem, default_cpu = self.get_resource_limits()
+
+        def limits_of(row_challenge_id):
+            mem_limit, cpu_limit = limits.get(row_challenge_id, (None, None))
+            return mem_limit or default_mem, cpu_limit or default_cpu
+
+        used = dict(reserved)
+        for (name, row_challenge_id), count in instances.items():
+            mem_limit, cpu_limit = limits_of(row_challenge_id)
+            used_mem, used_cpu = used.get(name, (0, 0))
+            used[name] = (used_mem + count * mem_limit, used_cpu + count * cpu_limit)
+
+        # admission control, never promise more than the nodes have
+        need = limits_of(str(challenge_id))
+        overcommit = self.get_overcommit()
+        candidates = [node for node in available if fits(node, used.get(node.name, (0, 0)), need, overcommit)]
+        if not candidates:
+            return None, need
+
+        node = choose_node(candidates, strategy, running, challenge_running, used, need)
+        return node.name, need
 
     def run_command(func):
-        # decorator to ensure docker client is connected before running a command
-        def wrapper(self, *args, **kwargs):
-            if self.client is None:
-                try:
-                    self.initialize_connection()
-                except ContainerException:
-                    raise ContainerException("docker is not connected")
+        # decorator that routes a call to a docker node and fails fast from its cached
+        # health state instead of pinging docker first. the node name passed as node=
+        # (or the default node) is resolved to a DockerNode before the method runs,
+        # and a call that fails to reach the daemon demotes that node.
+        @functools.wraps(func)
+        def wrapper(self, *args, node=None, **kwargs):
+            docker_node = self.get_node(node)
+            if docker_node is not None:
+                docker_node.ensure_connected()
+            if docker_node is None or not docker_node.is_available():
+                raise ContainerException("docker is not connected")
 
             try:
-                self.client.ping()
-            except (docker.errors.DockerException, requests.exceptions.RequestException):
-                try:
-                    self.initialize_connection()
-                except ContainerException:
-                    pass
+                return func(self, *args, node=docker_node, **kwargs)
+            except CONNECTION_ERRORS as e:
+                docker_node.report_failure(e)
                 raise ContainerException("docker connection was lost. please try your request again later.")
-
-            return func(self, *args, **kwargs)
         return wrapper
 
-    @run_command
+    def schedule_reaper(self, run_at: float):
+        # (re)schedule the single expiry job to fire at the given unix time
+        self.scheduler.add_job(
+            func=self.run_reaper,
+            trigger="date",
+            run_date=datetime.datetime.fromtimestamp(run_at),
+            id="container_reaper",
+            replace_existing=True,
+        )
+
+    def run_reaper(self):
+        # reap once, then sleep until the next-earliest expiry instead of polling.
+        # other workers only check back often enough to take over from a dead leader.
+        if not self.leader:
+            self.schedule_reaper(time.time() + LEADER_TTL)
+            return
+
+        next_run = time.time() + REAPER_MAX_INTERVAL
+        try:
+            next_expiry = self.kill_expired_containers(self.app)
+            if next_expiry is not None:
+                # rows are reaped once expires < now, i.e. a second after they expire
+                next_run = min(next_run, next_expiry + 1)
+        except ContainerException:
+            print("[container expiry job] docker is not initialized. please check your settings.")
+        finally:
+            self.schedule_reaper(max(next_run, time.time()))
+
+    @timed("reaper")
     def kill_expired_containers(self, app: Flask):
-        # kill containers that have expired
+        # kill containers that have expired, returns the next-earliest expiry
+        if not self.nodes:
+            raise ContainerException("docker is not connected")
+
+        now = int(time.time())
         with app.app_context():
-            containers = ContainerInfoModel.query.all()
-            for container in containers:
-                if container.expires < int(time.time()):
-                    try:
-                        self.kill_container(container.container_id)
-                    except ContainerException:
-                        print("[container expiry job] docker is not initialized. please check your settings.")
-                    db.session.delete(container)
+            expired = (
+                db.session.query(ContainerInfoModel.container_id, ContainerInfoModel.node)
+                .filter(ContainerInfoModel.expires < now)
+                .all()
+            )
+
+            REAPER_BATCH_SIZE.observe(len(expired))
+            failed = set()
+            if expired:
+                failed = set(self.kill_containers(expired))
+                if failed:
+                    print(f"[container expiry job] failed to kill {len(failed)} expired containers, retrying later.")
+
+                # drop the rows of the killed containers in one transaction. the others
+                # keep theirs so they stay tracked and are retried on the next reap.
+                killed = [cid for cid, _ in expired if cid not in failed]
+                if killed:
+                    remove_containers(ContainerInfoModel.container_id.in_(killed))
                     db.session.commit()
+                    self.admission.dispatch_async()
+                    self.notifier.notify()
+
+            next_expiry = (
+                db.session.query(db.func.min(ContainerInfoModel.expires))
+                .filter(ContainerInfoModel.expires >= now)
+                .scalar()
+            )
+            if failed:
+                retry = now + REAPER_RETRY_INTERVAL
+                next_expiry = retry if next_expiry is None else min(next_expiry, retry)
+            return next_expiry
 
+    @timed("is_container_running")
     @run_command
-    def is_container_running(self, container_id: str) -> bool:
-        # check if a container is currently running
+    def is_container_running(self, container_id: str, node: DockerNode) -> bool:
+        # check if a container is currently running, from the event cache when synced
+        cached = node.event_listener.cache.get(container_id)
+        if cached is not None:
+            return cached["status"] == "running"
+
         try:
-            container = self.client.containers.get(container_id)
+            container = node.client.containers.get(container_id)
             return container.status == "running"
         except docker.errors.NotFound:
             return False
         except docker.errors.DockerException as e:
             raise ContainerException(f"docker error: {e}")
 
+    @timed("get_containers_status")
+    def get_containers_status(self, container_ids=None) -> dict:
+        # status of every plugin container across all reachable nodes, a dict of
+        # container id -> {"status", "port", "node"}. unreachable nodes are skipped.
+        available = [node for node in self.nodes.values() if node.is_available()]
+        if not available:
+            raise ContainerException("docker is not connected")
+
+        statuses = {}
+        for node in available:
+            try:
+                node_statuses = node.get_containers_status(container_ids)
+            except CONNECTION_ERRORS as e:
+                node.report_failure(e)
+                continue
+            except docker.errors.DockerException as e:
+                raise ContainerException(f"docker error: {e}")
+
+            for container_id, status in node_statuses.items():
+                statuses[container_id] = dict(status, node=node.name)
+
+        return statuses
+
+    @timed("create_container")
     @run_command
     def create_container(
         self,
@@ -154,77 +760,221 @@ class ContainerManager:
         image: str,
         port: int,
         command: str,
-        volumes: str,
+        run_kwargs: dict,
+        node: DockerNode,
+        fast_start: bool = False,
     ):
-        # create and start a new container
-        kwargs = {}
+        # create and start a new container, restored from the challenge's checkpoint
+        # when fast start is on and the node has one, cold started otherwise
+        environment = {
+            "CHALLENGE_ID": chal_id,
+            "TEAM_ID": team_id,
+            "USER_ID": user_id,
+        }
+        labels = {f"{PLUGIN_LABEL}.challenge_id": str(chal_id)}
 
-        # set memory limit if specified
-        mem_limit = self.settings.get("container_maxmemory")
-        if mem_limit:
-            try:
-                mem_limit = int(mem_limit)
-                if mem_limit > 0:
-                    kwargs["mem_limit"] = f"{mem_limit}m"
-            except ValueError:
-                raise ContainerException("configured container memory limit must be an integer")
+        checkpoint = None
+        if fast_start:
+            checkpoint = self.checkpoints.lookup(node, chal_id, image, port, command, run_kwargs)
 
-        # set cpu limit if specified
-        cpu_limit = self.settings.get("container_maxcpu")
-        if cpu_limit:
+        if checkpoint is not None:
             try:
-                cpu_quota = float(cpu_limit)
-                if cpu_quota > 0:
-                    kwargs["cpu_quota"] = int(cpu_quota * 100000)
-                    kwargs["cpu_period"] = 100000
-                else:
-                    raise ValueError
-            except ValueError:
-                raise ContainerException("configured container cpu limit must be a positive number")
+                container = self._restore_container(
+                    node, checkpoint, image, port, command, run_kwargs, environment, labels
+                )
+            except CheckpointRestoreError as e:
+                self.checkpoints.mark_unsupported(node, e)
+            except ContainerException:
+                pass  # no port, no image or another docker error, the cold start handles it
+            else:
+                try:
+                    # the restored processes kept the template's environment
+                    self._write_assignment(node, container.id, chal_id, team_id, user_id)
+                    self.readiness.record_path(container.id, "restore")
+                    return container
+                except ContainerException:
+                    try:
+                        self._kill_container(container.id, node)
+                    except ContainerException:
+                        pass
+
+        container = self._run_container(node, image, port, command, run_kwargs, environment, labels)
+        self.readiness.record_path(container.id, "cold")
+        return container
+
+    @timed("create_pool_container")
+    @run_command
+    def create_pool_container(self, chal_id: str, image: str, port: int, command: str, run_kwargs: dict, node: DockerNode):
+        # create and start an unassigned container for a challenge's warm pool,
+        # the owner is delivered later through assign_container
+        return self._run_container(
+            node,
+            image,
+            port,
+            command,
+            run_kwargs,
+            environment={"CHALLENGE_ID": chal_id},
+            labels={
+                f"{PLUGIN_LABEL}.challenge_id": str(chal_id),
+                f"{PLUGIN_LABEL}.pool": "true",
+            },
+        )
+
+    @timed("assign_container")
+    @run_command
+    def assign_container(self, container_id: str, chal_id: str, team_id: str, user_id: str, node: DockerNode):
+        # hand a pooled container to its owner
+        self._write_assignment(node, container_id, chal_id, team_id, user_id)
+
+    def _write_assignment(self, node: DockerNode, container_id: str, chal_id: str, team_id: str, user_id: str):
+        # environment variables can't change on a running container (or one restored
+        # from a checkpoint), so the owner ids are written to ASSIGNMENT_ENV_PATH
+        env = f"CHALLENGE_ID={chal_id}\nTEAM_ID={team_id}\nUSER_ID={user_id}\n".encode()
+
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            info = tarfile.TarInfo(os.path.basename(ASSIGNMENT_ENV_PATH))
+            info.size = len(env)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(env))
+
+        try:
+            container = node.client.containers.get(container_id)
+            container.put_archive(os.path.dirname(ASSIGNMENT_ENV_PATH), archive.getvalue())
+        except docker.errors.NotFound:
+            raise ContainerException("container is gone")
+        except docker.errors.DockerException as e:
+            raise ContainerException(f"docker error: {e}")
 
-        # set volumes if specified
-        if volumes:
+    def lease_port(self, node: DockerNode):
+        # lease a free host port of a node and claim it for this worker, so the other
+        # workers (whose allocators don't know about it yet) pass it over. None when
+        # the range is exhausted.
+        for _ in range(PORT_CONFLICT_RETRIES):
+            external_port = node.port_allocator.lease()
+            if external_port is None:
+                return None
             try:
-                volumes_dict = json.loads(volumes)
-                kwargs["volumes"] = volumes_dict
-            except json.decoder.JSONDecodeError:
-                raise ContainerException("volumes json string is invalid")
-
-        # find an available external port
-        selectable_port_range = list(range(1024, 65536))
-        random.shuffle(selectable_port_range)
-    
-        for external_port in selectable_port_range:
-            if self._is_port_available(external_port):
-                break
-        else:
+                claimed = self.coordinator.claim(
+                    port_key(node.name, external_port), self.instance_id, ttl=PORT_CLAIM_TTL
+                )
+            except Exception as e:
+                # docker still rejects a port that really is taken
+                print(f"[container coordination] could not claim port {external_port}: {e}")
+                return external_port
+            if claimed:
+                return external_port
+            node.port_allocator.mark_used(external_port)
+        return None
+
+    def return_port(self, node: DockerNode, port: int):
+        # give back a leased port whose container never started
+        node.port_allocator.release(port)
+        try:
+            self.coordinator.release(port_key(node.name, port), self.instance_id)
+        except Exception:
+            pass  # the claim expires on its own
+
+    @timed("docker_restore")
+    def _restore_container(self, node: DockerNode, checkpoint, image: str, port: int, command: str, run_kwargs: dict, environment: dict, labels: dict):
+        # create a container with the template's config and start it from the checkpoint
+        kwargs = dict(self.default_run_kwargs, **(run_kwargs or {}))
+
+        external_port = self.lease_port(node)
+        if external_port is None:
             raise ContainerException("no available port found")
 
-        # create the container
         try:
-            return self.client.containers.run(
+            container = node.client.containers.create(
                 image,
                 ports={str(port): str(external_port)},
                 command=command,
-                detach=True,
                 auto_remove=True,
-                environment={
-                    "CHALLENGE_ID": chal_id,
-                    "TEAM_ID": team_id,
-                    "USER_ID": user_id,
-                },
+                environment=environment,
+                labels={PLUGIN_LABEL: "true", **labels},
                 **kwargs,
             )
-        except docker.errors.ImageNotFound:
-            raise ContainerException("docker image not found")
         except docker.errors.DockerException as e:
+            self.return_port(node, external_port)
             raise ContainerException(f"docker error: {e}")
 
+        try:
+            api = node.client.api
+            response = api._post(
+                api._url("/containers/{0}/start", container.id),
+                params={"checkpoint": checkpoint.name, "checkpoint-dir": checkpoint.directory},
+            )
+            api._raise_for_status(response)
+        except docker.errors.DockerException as e:
+            try:
+                container.remove(force=True)
+            except docker.errors.DockerException:
+                pass
+            # only a failed restore says anything about the node's checkpoint support
+            if isinstance(e, docker.errors.APIError) and _is_port_conflict(e):
+                node.port_allocator.mark_used(external_port)
+                raise ContainerException(f"docker error: {e}")
+            self.return_port(node, external_port)
+            raise CheckpointRestoreError(f"could not restore checkpoint: {e}")
+
+        node.port_allocator.bind(container.id, external_port)
+        node.event_listener.cache.set_status(container.id, "running", external_port)
+        return container
+
+    @timed("docker_run")
+    def _run_container(self, node: DockerNode, image: str, port: int, command: str, run_kwargs: dict, environment: dict, labels: dict):
+        # run_kwargs were compiled from the challenge's resource profile when it was
+        # saved, the global limits fill in whatever the profile leaves unset
+        kwargs = dict(self.default_run_kwargs, **(run_kwargs or {}))
+
+        # create the container on a leased external port, retrying with a new
+        # port if something outside of the allocator grabbed it first
+        pulled = False
+        for _ in range(PORT_CONFLICT_RETRIES):
+            external_port = self.lease_port(node)
+            if external_port is None:
+                raise ContainerException("no available port found")
+
+            try:
+                container = node.client.containers.run(
+                    image,
+                    ports={str(port): str(external_port)},
+                    command=command,
+                    detach=True,
+                    auto_remove=True,
+                    environment=environment,
+                    labels={PLUGIN_LABEL: "true", **labels},
+                    **kwargs,
+                )
+            except docker.errors.ImageNotFound:
+                self.return_port(node, external_port)
+                # the pre-pull hasn't reached this node yet, pull it now and retry once
+                if not pulled and self.images.pull(image, node):
+                    pulled = True
+                    continue
+                raise ContainerException("docker image not found")
+            except docker.errors.APIError as e:
+                if _is_port_conflict(e):
+                    node.port_allocator.mark_used(external_port)
+                    continue
+                self.return_port(node, external_port)
+                raise ContainerException(f"docker error: {e}")
+            except docker.errors.DockerException as e:
+                self.return_port(node, external_port)
+                raise ContainerException(f"docker error: {e}")
+
+            node.port_allocator.bind(container.id, external_port)
+            node.event_listener.cache.set_status(container.id, "running", external_port)
+            return container
+
+        raise ContainerException("no available port found")
+
+    @timed("port_lookup")
     @run_command
-    def get_container_port(self, container_id: str) -> str:
+    def get_container_port(self, container_id: str, node: DockerNode) -> str:
         # get the host port mapped to the container's exposed port
         try:
-            container = self.client.containers.get(container_id)
+            container = node.client.containers.get(container_id)
             ports = container.attrs["NetworkSettings"]["Ports"]
             for port_mappings in ports.values():
                 if port_mappings:
@@ -235,35 +985,99 @@ class ContainerManager:
             raise ContainerException(f"docker error: {e}")
         return None
 
-    @run_command
-    def get_images(self) -> list:
-        # retrieve a list of available docker images
-        try:
-            images = self.client.images.list()
-            images_list = [tag for image in images for tag in image.tags if tag]
-            return sorted(images_list)
-        except docker.errors.DockerException as e:
-            raise ContainerException(f"docker error: {e}")
-        return []
+    @timed("get_images")
+    def get_images(self, query: str = "", page: int = 1, per_page: int = IMAGES_PER_PAGE) -> dict:
+        # one page of the image tags available on any reachable node, optionally
+        # filtered by a substring, with their digest, size and creation time
+        available = [node for node in self.nodes.values() if node.is_available()]
+        if not available:
+            raise ContainerException("docker is not connected")
+
+        tags = {}
+        for node in available:
+            try:
+                images = node.list_images()
+            except CONNECTION_ERRORS as e:
+                node.report_failure(e)
+                continue
+            except docker.errors.DockerException as e:
+                raise ContainerException(f"docker error: {e}")
+
+            for image in images:
+                for tag in image.get("RepoTags") or []:
+                    if not tag or tag == "<none>:<none>":
+                        continue
+                    if query and query.lower() not in tag.lower():
+                        continue
 
+                    entry = tags.setdefault(tag, {
+                        "tag": tag,
+                        "id": image.get("Id"),
+                        "digest": next(iter(image.get("RepoDigests") or []), None),
+                        "size": image.get("Size"),
+                        "created": image.get("Created"),
+                        "nodes": [],
+                    })
+                    entry["nodes"].append(node.name)
+
+        page = max(page, 1)
+        per_page = min(max(per_page, 1), MAX_IMAGES_PER_PAGE)
+        ordered = [tags[tag] for tag in sorted(tags)]
+        start = (page - 1) * per_page
+
+        return {
+            "images": ordered[start:start + per_page],
+            "total": len(ordered),
+            "page": page,
+            "per_page": per_page,
+        }
+
+    @timed("kill_container")
     @run_command
-    def kill_container(self, container_id: str):
+    def kill_container(self, container_id: str, node: DockerNode):
         # kill and remove a container by its id
+        self._kill_container(container_id, node)
+
+    @timed("kill_containers")
+    def kill_containers(self, containers: list) -> list:
+        # kill many (container id, node name) pairs concurrently, returns the ids
+        # that could not be killed
+        failed = []
+        futures = {}
+        for container_id, node_name in containers:
+            node = self.get_node(node_name)
+            if node is None or not node.is_available():
+                failed.append(container_id)
+                continue
+            futures[container_id] = (node, self.kill_executor.submit(self._kill_container, container_id, node))
+
+        for container_id, (node, future) in futures.items():
+            try:
+                future.result()
+            except ContainerException:
+                failed.append(container_id)
+            except CONNECTION_ERRORS as e:
+                node.report_failure(e)
+                failed.append(container_id)
+        return failed
+
+    @timed("kill")
+    def _kill_container(self, container_id: str, node: DockerNode):
+        # undecorated kill, callers are responsible for checking the connection
         try:
-            container = self.client.containers.get(container_id)
+            container = node.client.containers.get(container_id)
             container.kill()
         except docker.errors.NotFound:
             pass  # container already removed
         except docker.errors.DockerException as e:
             raise ContainerException(f"docker error: {e}")
 
-    def is_connected(self) -> bool:
-        # check if docker client is connected
-        if not self.client:
-            return False
+        node.port_allocator.release_container(container_id)
+        self.readiness.cancel(container_id)
 
-        try:
-            self.client.ping()
-            return True
-        except docker.errors.DockerException:
-            return False
+    def is_connected(self) -> bool:
+        # check if any docker node is connected, answered from the cached health state
+        return any(
+            node.client is not None and node.health.state == HEALTHY
+            for node in self.nodes.values()
+        )
@@ -0,0 +1,326 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+try:
+    import fcntl
+except ImportError:  # not available on windows, the file backend can't be used there
+    fcntl = None
+
+from CTFd.models import db
+from .models import ContainerCoordinationModel
+
+# backends the workers can coordinate through. sql works for every worker sharing
+# the ctfd database, file for workers on one host, local for a single worker.
+COORDINATION_BACKENDS = ("sql", "file", "local")
+DEFAULT_COORDINATION_BACKEND = "sql"
+DEFAULT_COORDINATION_DIR = "/tmp/ctfd-containers"
+
+# how often each worker renews or contends for leadership and checks for broadcasts
+COORDINATION_INTERVAL = 5  # seconds
+
+# how long leadership outlives its last renewal, a dead leader is replaced after this
+LEADER_TTL = 15  # seconds
+
+# how long the state a worker published (e.g. its pull status) lasts without being
+# republished, unchanged state is republished halfway through
+STATE_TTL = 60  # seconds
+
+# shared keys
+LEADER_KEY = "leader"
+SETTINGS_CHANNEL = "settings"
+CHALLENGES_CHANNEL = "challenges"
+
+
+def port_key(node: str, port: int) -> str:
+    return f"port:{node}:{port}"
+
+
+def build_coordination(backend: str, directory: str, app):
+    # the backend configured in the settings, raises ValueError for unknown ones
+    backend = backend or DEFAULT_COORDINATION_BACKEND
+    if backend == "sql":
+        return SQLCoordination(app)
+    if backend == "file":
+        return FileCoordination(directory or DEFAULT_COORDINATION_DIR)
+    if backend == "local":
+        return LocalCoordination()
+    raise ValueError(f"coordination backend must be one of {', '.join(COORDINATION_BACKENDS)}")
+
+
+class LocalCoordination:
+    # state of a single worker, every claim only competes with this process. also the
+    # base of the file backend, which keeps the same state in a locked file.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = {"claims": {}, "counters": {}}
+
+    @contextmanager
+    def _state(self, write: bool = True):
+        with self.lock:
+            yield self.state
+
+    @staticmethod
+    def _prune(state: dict, now: float):
+        for key in [key for key, claim in state["claims"].items() if claim["expires"] < now]:
+            del state["claims"][key]
+
+    def claim(self, key: str, owner: str, value: str = "", ttl: int = LEADER_TTL) -> bool:
+        # take or renew key for owner until ttl seconds from now, False if another
+        # owner holds it
+        now = time.time()
+        with self._state() as state:
+            current = state["claims"].get(key)
+            if current is not None and current["owner"] != owner and current["expires"] >= now:
+                return False
+            state["claims"][key] = {"owner": owner, "value": value, "expires": now + ttl}
+            return True
+
+    def release(self, key: str, owner: str):
+        with self._state() as state:
+            current = state["claims"].get(key)
+            if current is not None and current["owner"] == owner:
+                del state["claims"][key]
+
+    def get(self, key: str):
+        # value of a live claim, None if nobody holds key
+        with self._state(write=False) as state:
+            claim = state["claims"].get(key)
+            if claim is None or claim["expires"] < time.time():
+                return None
+            return claim["value"]
+
+    def scan(self, prefix: str) -> dict:
+        # values of the live claims whose key starts with prefix
+        now = time.time()
+        with self._state(write=False) as state:
+            return {
+                key: claim["value"] for key, claim in state["claims"].items()
+                if key.startswith(prefix) and claim["expires"] >= now
+            }
+
+    def bump(self, channel: str) -> int:
+        # broadcast a change on channel, returns its new generation
+        with self._state() as state:
+            state["counters"][channel] = state["counters"].get(channel, 0) + 1
+            return state["counters"][channel]
+
+    def generation(self, channel: str) -> int:
+        with self._state(write=False) as state:
+            return state["counters"].get(channel, 0)
+
+    def prune(self):
+        # drop expired claims, claims that are never released wait for this
+        with self._state() as state:
+            self._prune(state, time.time())
+
+
+class FileCoordination(LocalCoordination):
+    # stand-in for workers on a single host without a shared lock service: the state
+    # lives in a json file that every access holds an exclusive flock on
+    def __init__(self, directory: str):
+        if fcntl is None:
+            raise ValueError("the file coordination backend needs fcntl, use sql instead")
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.lock_path = os.path.join(directory, "coordination.lock")
+        self.state_path = os.path.join(directory, "coordination.json")
+
+    @contextmanager
+    def _state(self, write: bool = True):
+        with self.lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.state_path) as f:
+                        state = json.load(f)
+                except (OSError, ValueError):
+                    state = {"claims": {}, "counters": {}}
+
+                yield state
+
+                if write:
+                    self._prune(state, time.time())
+                    # written aside and renamed so a crash never leaves a torn file
+                    temporary = f"{self.state_path}.{os.getpid()}"
+                    with open(temporary, "w") as f:
+                        json.dump(state, f)
+                    os.replace(temporary, self.state_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SQLCoordination:
+    # state in the container_coordination table of the ctfd database. a claim is a
+    # row taken with a conditional update (or insert), which works as an advisory
+    # lock on every database ctfd supports and expires on its own if its owner dies.
+    # every call runs in its own short transaction, apart from the request session.
+    def __init__(self, app):
+        self.app = app
+        self.table = ContainerCoordinationModel.__table__
+
+    def _execute(self, statement, read=None):
+        # run statement in a transaction of its own, read picks what to return from the
+        # result before the connection goes back to the pool (the rowcount by default)
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                result = connection.execute(statement)
+                return read(result) if read else result.rowcount
+
+    def claim(self, key: str, owner: str, value: str = "", ttl: int = LEADER_TTL) -> bool:
+        table = self.table
+        now = int(time.time())
+        values = {"owner": owner, "value": value, "expires": now + ttl}
+
+        updated = self._execute(
+            table.update()
+            .where(table.c.key == key)
+            .where(or_(table.c.owner == owner, table.c.expires < now, table.c.expires.is_(None)))
+            .values(**values)
+        )
+        if updated:
+            return True
+
+        try:
+            self._execute(table.insert().values(key=key, counter=0, **values))
+        except IntegrityError:
+            return False  # held by another owner, or taken between the two statements
+        return True
+
+    def release(self, key: str, owner: str):
+        table = self.table
+        self._execute(table.delete().where(table.c.key == key).where(table.c.owner == owner))
+
+    def get(self, key: str):
+        table = self.table
+        return self._execute(
+            db.select(table.c.value)
+            .where(table.c.key == key)
+            .where(table.c.expires >= int(time.time())),
+            lambda result: result.scalar(),
+        )
+
+    def scan(self, prefix: str) -> dict:
+        table = self.table
+        rows = self._execute(
+            db.select(table.c.key, table.c.value)
+            .where(table.c.key.startswith(prefix))
+            .where(table.c.expires >= int(time.time())),
+            lambda result: result.fetchall(),
+        )
+        return {key: value for key, value in rows}
+
+    def bump(self, channel: str) -> int:
+        table = self.table
+        key = f"channel:{channel}"
+        for _ in range(2):
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    updated = connection.execute(
+                        table.update().where(table.c.key == key).values(counter=table.c.counter + 1)
+                    ).rowcount
+                    if updated:
+                        return connection.execute(
+                            db.select(table.c.counter).where(table.c.key == key)
+                        ).scalar()
+            try:
+                self._execute(table.insert().values(key=key, counter=1))
+                return 1
+            except IntegrityError:
+                continue  # another worker created it first, bump theirs
+        return self.generation(channel)
+
+    def generation(self, channel: str) -> int:
+        table = self.table
+        return self._execute(
+            db.select(table.c.counter).where(table.c.key == f"channel:{channel}"),
+            lambda result: result.scalar(),
+        ) or 0
+
+    def prune(self):
+        table = self.table
+        self._execute(table.delete().where(table.c.expires < int(time.time())))
+
+
+class JobBoard:
+    # states of background jobs published under prefix, so that a job started on one
+    # worker can be looked up from any other. publishing is best effort, the worker
+    # running a job always has it in memory.
+    def __init__(self, manager, prefix: str):
+        self.manager = manager
+        self.prefix = prefix
+
+    def publish(self, job_id: str, state: dict, ttl: int):
+        try:
+            self.manager.coordinator.claim(
+                self.prefix + job_id, self.manager.instance_id, json.dumps(state), ttl=ttl
+            )
+        except Exception as e:
+            print(f"[container coordination] could not publish job {job_id}: {e}")
+
+    def get(self, job_id: str):
+        # published state of a job, None if unknown or expired
+        try:
+            value = self.manager.coordinator.get(self.prefix + job_id)
+        except Exception as e:
+            print(f"[container coordination] could not look up job {job_id}: {e}")
+            return None
+        if not value:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+
+class SharedState:
+    # state every worker keeps for itself (pull status, pool hit counters), published
+    # under prefix:<instance id> so views on any worker can merge all of them
+    def __init__(self, manager, prefix: str):
+        self.manager = manager
+        self.prefix = prefix
+        self.last = None
+        self.published = 0
+
+    def publish(self, state):
+        # called from the coordination job, skips unchanged state until it needs renewing
+        now = time.time()
+        if state == self.last and now < self.published + STATE_TTL / 2:
+            return
+        try:
+            self.manager.coordinator.claim(
+                self.prefix + self.manager.instance_id,
+                self.manager.instance_id,
+                json.dumps(state),
+                ttl=STATE_TTL,
+            )
+        except Exception as e:
+            print(f"[container coordination] could not publish {self.prefix.rstrip(':')} state: {e}")
+            return
+        self.last = state
+        self.published = now
+
+    def collect(self, local) -> list:
+        # the states of every live worker, this worker's current one instead of the
+        # copy it published last
+        states = [local]
+        try:
+            claims = self.manager.coordinator.scan(self.prefix)
+        except Exception as e:
+            print(f"[container coordination] could not read {self.prefix.rstrip(':')} state: {e}")
+            return states
+
+        own = self.prefix + self.manager.instance_id
+        for key, value in claims.items():
+            if key == own:
+                continue
+            try:
+                states.append(json.loads(value))
+            except (ValueError, TypeError):
+                continue
+        return states
@@ -0,0 +1,161 @@
+import threading
+
+import docker
+import paramiko
+import requests
+
+# container events the listener subscribes to, and the status each one implies.
+# kill and oom are left out: a signal (e.g. SIGHUP) or an oom-killed child doesn't
+# have to end the container, when it does docker follows up with die.
+EVENT_STATUS = {
+    "start": "running",
+    "die": "exited",
+    "destroy": None,  # container is gone
+}
+
+# image events that change what the daemon's image list returns
+IMAGE_EVENTS = ("pull", "tag", "untag", "delete", "import", "load")
+
+
+class ContainerStateCache:
+    # in-process view of plugin container states, kept in sync by the event listener.
+    # only trusted while synced, i.e. while the event stream is connected.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}  # container id -> {"status", "port"}
+        self.synced = False
+
+    def replace(self, states: dict):
+        with self.lock:
+            self.states = dict(states)
+            self.synced = True
+
+    def invalidate(self):
+        with self.lock:
+            self.synced = False
+
+    def set_status(self, container_id: str, status: str, port=None):
+        with self.lock:
+            state = self.states.setdefault(container_id, {"status": status, "port": port})
+            state["status"] = status
+            if port is not None:
+                state["port"] = port
+
+    def remove(self, container_id: str):
+        with self.lock:
+            self.states.pop(container_id, None)
+
+    def get(self, container_id: str):
+        # cached state of a container, or None if unknown or the cache is not synced
+        with self.lock:
+            if not self.synced:
+                return None
+            state = self.states.get(container_id)
+            return dict(state) if state else None
+
+    def snapshot(self):
+        # copy of every cached state, or None if the cache is not synced
+        with self.lock:
+            if not self.synced:
+                return None
+            return {container_id: dict(state) for container_id, state in self.states.items()}
+
+
+class DockerEventListener:
+    # consumes client.events() of one docker node for plugin-labelled containers on a
+    # daemon thread, updating the state cache and reporting containers that died
+    def __init__(self, node, label: str):
+        self.node = node
+        self.label = label
+        self.cache = ContainerStateCache()
+        self.thread = None
+        self.stream = None
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self.thread = threading.Thread(
+            target=self.run, name="container-events", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        # closing the stream unblocks the iterator and ends the thread
+        self.cache.invalidate()
+        stream, self.stream = self.stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=5)
+
+    def run(self):
+        client = self.node.client
+        if client is None:
+            return
+
+        try:
+            # images carry no plugin label, so containers are matched on their
+            # label attribute in handle() instead of a label filter
+            self.stream = client.events(
+                decode=True,
+                filters={
+                    "type": ["container", "image"],
+                    "event": list(EVENT_STATUS) + list(IMAGE_EVENTS),
+                },
+            )
+
+            # seed the cache after subscribing so no event is missed in between
+            self.cache.replace(self.node.get_containers_status())
+
+            for event in self.stream:
+                self.handle(event)
+        except (
+            docker.errors.DockerException,
+            paramiko.ssh_exception.SSHException,
+            requests.exceptions.RequestException,
+        ) as e:
+            if self.stream is not None:
+                self.node.report_failure(e)
+        except Exception as e:
+            # ContainerException from the seeding lookup, or the stream closing under us
+            print(f"[container events] listener stopped: {e}")
+        finally:
+            self.cache.invalidate()
+            self.stream = None
+
+    def handle(self, event: dict):
+        action = event.get("Action") or event.get("status")
+        if event.get("Type") == "image":
+            if action in IMAGE_EVENTS:
+                self.node.invalidate_images()
+            return
+
+        actor = event.get("Actor") or {}
+        if self.label not in (actor.get("Attributes") or {}):
+            return
+
+        container_id = event.get("id") or actor.get("ID")
+        if not container_id or action not in EVENT_STATUS:
+            return
+
+        status = EVENT_STATUS[action]
+        if status == "running":
+            self.cache.set_status(container_id, status)
+            return
+
+        if status is None:
+            self.cache.remove(container_id)
+        else:
+            self.cache.set_status(container_id, status)
+
+        # the container is no longer serving, drop its port lease and (through the
+        # node's callback) its rows
+        self.node.port_allocator.release_container(container_id)
+        if self.node.on_exit is not None:
+            self.node.on_exit(container_id)
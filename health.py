@@ -0,0 +1,81 @@
+import threading
+import time
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+DOWN = "down"
+
+# consecutive failures before a degraded connection is considered down
+FAILURE_THRESHOLD = 3
+
+# reconnect backoff bounds
+BACKOFF_MIN = 1  # seconds
+BACKOFF_MAX = 60  # seconds
+
+
+class HealthMonitor:
+    # cached view of the docker connection, fed by the heartbeat and by failed calls.
+    # healthy: last check succeeded. degraded: recent failures, calls still go through.
+    # down: calls fail fast and the heartbeat reconnects with exponential backoff.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = DOWN
+        self.since = time.time()
+        self.checked = None
+        self.error = None
+        self.failures = 0
+        self.backoff = BACKOFF_MIN
+        self.next_attempt = 0
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.since = time.time()
+
+    def mark_success(self):
+        with self.lock:
+            self._set_state(HEALTHY)
+            self.checked = time.time()
+            self.error = None
+            self.failures = 0
+            self.backoff = BACKOFF_MIN
+            self.next_attempt = 0
+
+    def mark_failure(self, error=None):
+        # demote one step per failure, healthy -> degraded -> down
+        with self.lock:
+            now = time.time()
+            self.checked = now
+            self.error = str(error) if error else None
+            self.failures += 1
+            if self.state == DOWN or self.failures >= FAILURE_THRESHOLD:
+                self._mark_down(now)
+            else:
+                self._set_state(DEGRADED)
+
+    def mark_down(self, error=None):
+        with self.lock:
+            self.checked = time.time()
+            self.error = str(error) if error else None
+            self._mark_down(self.checked)
+
+    def _mark_down(self, now: float):
+        self._set_state(DOWN)
+        self.next_attempt = now + self.backoff
+        self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+
+    def is_available(self) -> bool:
+        return self.state != DOWN
+
+    def should_reconnect(self) -> bool:
+        return self.state == DOWN and time.time() >= self.next_attempt
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "state": self.state,
+                "since": self.since,
+                "checked": self.checked,
+                "error": self.error,
+                "next_attempt": self.next_attempt if self.state == DOWN else None,
+            }
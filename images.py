@@ -0,0 +1,162 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+
+from CTFd.models import db
+from .models import ContainerChallengeModel
+from .nodes import CONNECTION_ERRORS
+from .coordination import SharedState
+
+PENDING = "pending"
+PULLING = "pulling"
+READY = "ready"
+FAILED = "failed"
+
+# images pulled at the same time across all nodes
+DEFAULT_PULL_CONCURRENCY = 2
+
+# how often every referenced image is checked against its registry, so moved tags
+# (e.g. a re-pushed :latest) get pulled before the next spawn needs them
+IMAGE_CHECK_INTERVAL = 300  # seconds
+
+
+class ImageManager:
+    # keeps the images referenced by container challenges present and current on every
+    # node. pulls run in the background with bounded parallelism and their status and
+    # digest are tracked per image and node.
+    def __init__(self, manager, concurrency: int = DEFAULT_PULL_CONCURRENCY):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.status = {}  # (image, node name) -> status dict
+        self.inflight = set()  # (image, node name) of queued or running pulls
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="image-pull"
+        )
+        # scheduled pulls run on the leader, spawns pull on whichever worker they run
+        self.shared = SharedState(manager, "images:")
+
+    def configure(self, concurrency: int):
+        # apply a new parallelism limit, pulls already queued finish on the old executor
+        if concurrency == self.concurrency:
+            return
+        executor = self.executor
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="image-pull"
+        )
+        self.concurrency = concurrency
+        executor.shutdown(wait=False)
+
+    def referenced_images(self) -> list:
+        with self.manager.app.app_context():
+            rows = db.session.query(ContainerChallengeModel.image).distinct().all()
+        return sorted({image.strip() for (image,) in rows if image and image.strip()})
+
+    def pull_all(self):
+        # scheduler job, check every referenced image on every available node
+        for image in self.referenced_images():
+            self.pull_async(image)
+
+    def pull_async(self, image: str):
+        # queue a pull of one image on every available node
+        image = (image or "").strip()
+        if not image:
+            return
+
+        for node in list(self.manager.nodes.values()):
+            if not node.is_available():
+                continue
+
+            key = (image, node.name)
+            with self.lock:
+                if key in self.inflight:
+                    continue
+                self.inflight.add(key)
+                self._update(key, PENDING)
+
+            self.executor.submit(self._pull_in_background, image, node)
+
+    def _pull_in_background(self, image: str, node):
+        try:
+            self.pull(image, node)
+        except Exception as e:
+            print(f"[container images] could not pull {image} on {node.name}: {e}")
+        finally:
+            with self.lock:
+                self.inflight.discard((image, node.name))
+
+    def pull(self, image: str, node) -> bool:
+        # make sure the node holds the current version of an image, pulling it when it
+        # is missing or its tag moved in the registry. returns whether it is usable.
+        key = (image, node.name)
+        with self.lock:
+            self._update(key, PULLING)
+
+        try:
+            try:
+                local = node.client.images.get(image)
+            except docker.errors.ImageNotFound:
+                local = None
+
+            try:
+                remote_digest = node.client.images.get_registry_data(image).id
+            except docker.errors.APIError:
+                # not in a registry (e.g. built on the node) or the registry is down,
+                # a local copy is then the best there is
+                remote_digest = None
+
+            repo_digests = (local.attrs.get("RepoDigests") or []) if local else []
+            current = local is not None and (
+                remote_digest is None
+                or any(digest.endswith(remote_digest) for digest in repo_digests)
+            )
+            if not current:
+                local = node.client.images.pull(image)
+        except CONNECTION_ERRORS as e:
+            node.report_failure(e)
+            with self.lock:
+                self._update(key, FAILED, error=str(e))
+            return False
+        except docker.errors.DockerException as e:
+            with self.lock:
+                self._update(key, FAILED, error=str(e))
+            return False
+
+        with self.lock:
+            self._update(key, READY, digest=remote_digest or local.id, image_id=local.id)
+        return True
+
+    def _update(self, key: tuple, status: str, **fields):
+        # callers hold the lock. the last known digest is kept while a re-pull runs.
+        entry = self.status.setdefault(key, {"digest": None, "image_id": None})
+        entry.update(status=status, error=None, updated=time.time())
+        entry.update(fields)
+
+    def shared_state(self) -> list:
+        # [image, node name, status] of every pull this worker tracks
+        with self.lock:
+            return [[image, name, dict(entry)] for (image, name), entry in self.status.items()]
+
+    def publish(self):
+        self.shared.publish(self.shared_state())
+
+    def snapshot(self) -> dict:
+        # image -> node name -> status, covering every referenced image on every node.
+        # the latest status any worker recorded wins.
+        images = self.referenced_images()
+        status = {}
+        for state in self.shared.collect(self.shared_state()):
+            for image, name, entry in state:
+                current = status.get((image, name))
+                if current is None or (entry.get("updated") or 0) > (current.get("updated") or 0):
+                    status[(image, name)] = entry
+
+        return {
+            image: {
+                name: dict(status.get((image, name)) or {"status": PENDING})
+                for name in self.manager.nodes
+            }
+            for image in images
+        }
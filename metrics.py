@@ -0,0 +1,152 @@
+import functools
+import threading
+import time
+
+# latency buckets shared by every timing histogram, docker calls range from a few
+# milliseconds (cached lookups) to tens of seconds (image pulls)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# buckets for how many containers a single reaper run kills
+BATCH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values = {}  # sorted label tuple -> count
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.lock = threading.Lock()
+        self.values = {}  # sorted label tuple -> [bucket counts, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Gauge:
+    # values are read at scrape time from a callback returning {label dict items: value}
+    def __init__(self, name: str, documentation: str, collect):
+        self.name = name
+        self.documentation = documentation
+        self.callback = collect
+
+    def collect(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+CALL_SECONDS = Histogram(
+    "ctfd_containers_call_seconds",
+    "Duration of container manager and view helper calls.",
+)
+CALL_ERRORS = Counter(
+    "ctfd_containers_call_errors_total",
+    "Calls that raised, by call and underlying error type (e.g. the docker sdk error).",
+)
+REAPER_BATCH_SIZE = Histogram(
+    "ctfd_containers_reaper_batch_size",
+    "Expired containers killed per reaper run.",
+    buckets=BATCH_BUCKETS,
+)
+
+IDLE_RECLAIMED = Counter(
+    "ctfd_containers_idle_reclaimed_total",
+    "Containers stopped before they expired because nobody used them.",
+)
+TIME_TO_READY = Histogram(
+    "ctfd_containers_time_to_ready_seconds",
+    "Time from the start of a spawn until the container accepts connections, by start path.",
+)
+READY_TIMEOUTS = Counter(
+    "ctfd_containers_ready_timeouts_total",
+    "Started containers that never became ready, by start path.",
+)
+
+METRICS = [CALL_SECONDS, CALL_ERRORS, REAPER_BATCH_SIZE, IDLE_RECLAIMED, TIME_TO_READY, READY_TIMEOUTS]
+
+
+def timed(call: str):
+    # record the duration of every call, and its error type if it raises. the error
+    # type is the exception the call's ContainerException was raised from, so docker
+    # api errors are counted by their sdk class.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                CALL_ERRORS.inc(call=call, type=type(e.__context__ or e).__name__)
+                raise
+            finally:
+                CALL_SECONDS.observe(time.perf_counter() - start, call=call)
+        return wrapper
+    return decorator
+
+
+def render(gauges=()) -> str:
+    # prometheus text exposition of every metric plus the given scrape-time gauges
+    lines = []
+    for metric in list(METRICS) + list(gauges):
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
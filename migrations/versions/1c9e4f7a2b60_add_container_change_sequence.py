@@ -0,0 +1,62 @@
+"""Add a change sequence and tombstones for container_info
+
+Revision ID: 1c9e4f7a2b60
+Revises: 6f1a0d4e7b35
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "1c9e4f7a2b60"
+down_revision = "6f1a0d4e7b35"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # rows from before the upgrade all belong to the first version
+    columns = {column["name"] for column in inspector.get_columns("container_info")}
+    if "version" not in columns:
+        op.add_column("container_info", sa.Column("version", sa.BigInteger(), nullable=True))
+        op.create_index("ix_container_info_version", "container_info", ["version"])
+        op.execute("UPDATE container_info SET version = 1")
+
+    # create_all already builds the tables on fresh installs
+    tables = inspector.get_table_names()
+    if "container_tombstones" not in tables:
+        op.create_table(
+            "container_tombstones",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("container_id", sa.String(length=512), nullable=True),
+            sa.Column("challenge_id", sa.Integer(), nullable=True),
+            sa.Column("team_id", sa.Integer(), nullable=True),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("node", sa.String(length=128), nullable=True),
+            sa.Column("version", sa.BigInteger(), nullable=True),
+            sa.Column("removed", sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_container_tombstones_version", "container_tombstones", ["version"])
+
+    if "container_sequence" not in tables:
+        op.create_table(
+            "container_sequence",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("value", sa.BigInteger(), nullable=True),
+            sa.Column("pruned", sa.BigInteger(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if not bind.execute(sa.text("SELECT COUNT(*) FROM container_sequence")).scalar():
+        op.execute("INSERT INTO container_sequence (id, value, pruned) VALUES (1, 1, 0)")
+
+
+def downgrade(op=None):
+    op.drop_table("container_sequence")
+    op.drop_index("ix_container_tombstones_version", table_name="container_tombstones")
+    op.drop_table("container_tombstones")
+    op.drop_index("ix_container_info_version", table_name="container_info")
+    op.drop_column("container_info", "version")
@@ -0,0 +1,25 @@
+"""Record when each container was last active
+
+Revision ID: 3e7b9c1d5f28
+Revises: 8d6f2b4a1c73
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "3e7b9c1d5f28"
+down_revision = "8d6f2b4a1c73"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    # existing rows keep a null value and count as active since their creation
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("container_info")}
+    if "last_active" not in columns:
+        op.add_column("container_info", sa.Column("last_active", sa.Integer(), nullable=True))
+
+
+def downgrade(op=None):
+    op.drop_column("container_info", "last_active")
@@ -0,0 +1,26 @@
+"""Add index on container_info.expires
+
+Revision ID: 4f1c2a9d7e10
+Revises:
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "4f1c2a9d7e10"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    # the reaper filters on expires, existing deployments created the table without an index
+    bind = op.get_bind()
+    indexes = {index["name"] for index in sa.inspect(bind).get_indexes("container_info")}
+    if "ix_container_info_expires" not in indexes:
+        op.create_index("ix_container_info_expires", "container_info", ["expires"])
+
+
+def downgrade(op=None):
+    op.drop_index("ix_container_info_expires", table_name="container_info")
@@ -0,0 +1,26 @@
+"""Add maintained solve counter to container challenges
+
+Revision ID: 5a0d3c8e9f12
+Revises: e2d91f6a3b07
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "5a0d3c8e9f12"
+down_revision = "e2d91f6a3b07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    # existing challenges start with a null counter, which is rebuilt from the
+    # solves table the next time their value is calculated
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("container_challenges")}
+    if "solve_count" not in columns:
+        op.add_column("container_challenges", sa.Column("solve_count", sa.Integer(), nullable=True))
+
+
+def downgrade(op=None):
+    op.drop_column("container_challenges", "solve_count")
@@ -0,0 +1,41 @@
+"""Add readiness checks to challenges and containers
+
+Revision ID: 6f1a0d4e7b35
+Revises: b4c2e8f1a6d9
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "6f1a0d4e7b35"
+down_revision = "b4c2e8f1a6d9"
+branch_labels = None
+depends_on = None
+
+CHALLENGE_COLUMNS = (
+    ("ready_check", sa.Text),
+    ("ready_target", sa.Text),
+    ("ready_timeout", sa.Integer),
+)
+
+
+def upgrade(op=None):
+    inspector = sa.inspect(op.get_bind())
+
+    columns = {column["name"] for column in inspector.get_columns("container_challenges")}
+    for name, column_type in CHALLENGE_COLUMNS:
+        if name not in columns:
+            op.add_column("container_challenges", sa.Column(name, column_type(), nullable=True))
+
+    # containers running before the upgrade were already handed out as ready
+    columns = {column["name"] for column in inspector.get_columns("container_info")}
+    if "ready_at" not in columns:
+        op.add_column("container_info", sa.Column("ready_at", sa.Integer(), nullable=True))
+        op.execute("UPDATE container_info SET ready_at = timestamp WHERE ready_at IS NULL")
+
+
+def downgrade(op=None):
+    op.drop_column("container_info", "ready_at")
+    for name, _ in reversed(CHALLENGE_COLUMNS):
+        op.drop_column("container_challenges", name)
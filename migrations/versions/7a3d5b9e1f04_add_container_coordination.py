@@ -0,0 +1,34 @@
+"""Add the container_coordination table shared by the workers
+
+Revision ID: 7a3d5b9e1f04
+Revises: 1c9e4f7a2b60
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7a3d5b9e1f04"
+down_revision = "1c9e4f7a2b60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    # create_all already builds the table on fresh installs
+    if "container_coordination" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "container_coordination",
+            sa.Column("key", sa.String(length=255), nullable=False),
+            sa.Column("owner", sa.String(length=255), nullable=True),
+            sa.Column("value", sa.Text(), nullable=True),
+            sa.Column("counter", sa.BigInteger(), nullable=True),
+            sa.Column("expires", sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint("key"),
+        )
+        op.create_index("ix_container_coordination_expires", "container_coordination", ["expires"])
+
+
+def downgrade(op=None):
+    op.drop_index("ix_container_coordination_expires", table_name="container_coordination")
+    op.drop_table("container_coordination")
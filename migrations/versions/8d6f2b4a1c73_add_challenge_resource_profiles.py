@@ -0,0 +1,38 @@
+"""Add per-challenge resource profiles
+
+Revision ID: 8d6f2b4a1c73
+Revises: 5a0d3c8e9f12
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "8d6f2b4a1c73"
+down_revision = "5a0d3c8e9f12"
+branch_labels = None
+depends_on = None
+
+PROFILE_COLUMNS = (
+    ("mem_limit", sa.Integer),
+    ("cpu_limit", sa.Float),
+    ("pids_limit", sa.Integer),
+    ("tmpfs", sa.Text),
+    ("network_mode", sa.Text),
+    ("max_instances", sa.Integer),
+    ("run_kwargs", sa.Text),
+)
+
+
+def upgrade(op=None):
+    # existing challenges keep the global limits, their run kwargs are compiled on
+    # first use until they are saved again
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("container_challenges")}
+    for name, column_type in PROFILE_COLUMNS:
+        if name not in columns:
+            op.add_column("container_challenges", sa.Column(name, column_type(), nullable=True))
+
+
+def downgrade(op=None):
+    for name, _ in reversed(PROFILE_COLUMNS):
+        op.drop_column("container_challenges", name)
@@ -0,0 +1,45 @@
+"""Add warm pool size and container_pool table
+
+Revision ID: 9b3e5d0c2f41
+Revises: 4f1c2a9d7e10
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "9b3e5d0c2f41"
+down_revision = "4f1c2a9d7e10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    columns = {column["name"] for column in inspector.get_columns("container_challenges")}
+    if "warm_pool_size" not in columns:
+        op.add_column(
+            "container_challenges",
+            sa.Column("warm_pool_size", sa.Integer(), nullable=True, server_default="0"),
+        )
+
+    # create_all already builds the table on fresh installs
+    if "container_pool" not in inspector.get_table_names():
+        op.create_table(
+            "container_pool",
+            sa.Column("container_id", sa.String(length=512), nullable=False),
+            sa.Column("challenge_id", sa.Integer(), nullable=True),
+            sa.Column("port", sa.Integer(), nullable=True),
+            sa.Column("timestamp", sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(["challenge_id"], ["challenges.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("container_id"),
+        )
+        op.create_index("ix_container_pool_challenge_id", "container_pool", ["challenge_id"])
+
+
+def downgrade(op=None):
+    op.drop_index("ix_container_pool_challenge_id", table_name="container_pool")
+    op.drop_table("container_pool")
+    op.drop_column("container_challenges", "warm_pool_size")
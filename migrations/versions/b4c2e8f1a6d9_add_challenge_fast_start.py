@@ -0,0 +1,28 @@
+"""Add the checkpoint fast start flag to container challenges
+
+Revision ID: b4c2e8f1a6d9
+Revises: 3e7b9c1d5f28
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b4c2e8f1a6d9"
+down_revision = "3e7b9c1d5f28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    # existing challenges keep starting cold
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("container_challenges")}
+    if "fast_start" not in columns:
+        op.add_column(
+            "container_challenges",
+            sa.Column("fast_start", sa.Boolean(), nullable=True, server_default=sa.false()),
+        )
+
+
+def downgrade(op=None):
+    op.drop_column("container_challenges", "fast_start")
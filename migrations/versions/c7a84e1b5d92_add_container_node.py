@@ -0,0 +1,28 @@
+"""Record the docker node of each container
+
+Revision ID: c7a84e1b5d92
+Revises: 9b3e5d0c2f41
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "c7a84e1b5d92"
+down_revision = "9b3e5d0c2f41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade(op=None):
+    # existing rows keep a null node, which maps to the default node
+    inspector = sa.inspect(op.get_bind())
+    for table in ("container_info", "container_pool"):
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        if "node" not in columns:
+            op.add_column(table, sa.Column("node", sa.String(length=128), nullable=True))
+
+
+def downgrade(op=None):
+    op.drop_column("container_pool", "node")
+    op.drop_column("container_info", "node")
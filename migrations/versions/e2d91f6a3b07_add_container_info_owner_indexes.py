@@ -0,0 +1,116 @@
+"""Add owner indexes and unique constraints on container_info
+
+Revision ID: e2d91f6a3b07
+Revises: c7a84e1b5d92
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+import json
+
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "e2d91f6a3b07"
+down_revision = "c7a84e1b5d92"
+branch_labels = None
+depends_on = None
+
+
+# setting the containers of dropped rows are recorded in, the container manager
+# kills them once their node is reachable (see ContainerManager.kill_orphans)
+ORPHANS_SETTING = "orphaned_containers"
+
+
+def record_orphans(bind, orphans):
+    container_settings = sa.table(
+        "container_settings", sa.column("key"), sa.column("value")
+    )
+    current = bind.execute(
+        sa.select(container_settings.c.value).where(container_settings.c.key == ORPHANS_SETTING)
+    ).scalar()
+    if current is None:
+        bind.execute(container_settings.insert().values(key=ORPHANS_SETTING, value=json.dumps(orphans)))
+    else:
+        bind.execute(
+            container_settings.update()
+            .where(container_settings.c.key == ORPHANS_SETTING)
+            .values(value=json.dumps((json.loads(current or "[]")) + orphans))
+        )
+
+
+def remove_duplicates(bind):
+    # racing requests could insert several rows for the same owner and challenge,
+    # keep the newest one so the unique indexes can be created. the containers of
+    # the dropped rows are no longer tracked, they are recorded to be killed.
+    container_info = sa.table(
+        "container_info",
+        sa.column("container_id"),
+        sa.column("challenge_id"),
+        sa.column("team_id"),
+        sa.column("user_id"),
+        sa.column("node"),
+        sa.column("timestamp"),
+    )
+    rows = bind.execute(
+        sa.select(
+            container_info.c.container_id,
+            container_info.c.challenge_id,
+            container_info.c.team_id,
+            container_info.c.user_id,
+            container_info.c.node,
+        ).order_by(container_info.c.timestamp.desc())
+    ).fetchall()
+
+    seen = set()
+    duplicates = []
+    for container_id, challenge_id, team_id, user_id, node in rows:
+        keys = {("user", challenge_id, user_id)}
+        if team_id is not None:
+            keys.add(("team", challenge_id, team_id))
+        if keys & seen:
+            duplicates.append([container_id, node])
+        else:
+            seen |= keys
+
+    if duplicates:
+        record_orphans(bind, duplicates)
+        bind.execute(
+            container_info.delete().where(
+                container_info.c.container_id.in_([container_id for container_id, _ in duplicates])
+            )
+        )
+
+
+def upgrade(op=None):
+    bind = op.get_bind()
+    indexes = {index["name"] for index in sa.inspect(bind).get_indexes("container_info")}
+
+    if "ix_container_info_user_id" not in indexes:
+        op.create_index("ix_container_info_user_id", "container_info", ["user_id"])
+
+    if (
+        "ix_container_info_challenge_team" not in indexes
+        or "ix_container_info_challenge_user" not in indexes
+    ):
+        remove_duplicates(bind)
+
+    if "ix_container_info_challenge_team" not in indexes:
+        op.create_index(
+            "ix_container_info_challenge_team",
+            "container_info",
+            ["challenge_id", "team_id"],
+            unique=True,
+        )
+    if "ix_container_info_challenge_user" not in indexes:
+        op.create_index(
+            "ix_container_info_challenge_user",
+            "container_info",
+            ["challenge_id", "user_id"],
+            unique=True,
+        )
+
+
+def downgrade(op=None):
+    op.drop_index("ix_container_info_challenge_user", table_name="container_info")
+    op.drop_index("ix_container_info_challenge_team", table_name="container_info")
+    op.drop_index("ix_container_info_user_id", table_name="container_info")
@@ -17,6 +17,31 @@ class ContainerChallengeModel(Challenges):
 	ssh_username = db.Column(db.Text, nullable=True)
 	ssh_password = db.Column(db.Text, nullable=True)
 
+	# number of pre-started containers kept ready for instant spawns
+	warm_pool_size = db.Column(db.Integer, default=0)
+
+	# restore instances from a checkpoint of a started template container
+	fast_start = db.Column(db.Boolean, default=False)
+
+	# readiness check run before instances are handed out, see readiness.READY_CHECKS
+	ready_check = db.Column(db.Text, nullable=True)
+	ready_target = db.Column(db.Text, nullable=True)  # http path or command
+	ready_timeout = db.Column(db.Integer, nullable=True)  # seconds
+
+	# resource profile, blank limits fall back to the global settings. run_kwargs
+	# holds the docker run kwargs compiled from it (and volumes) on save.
+	mem_limit = db.Column(db.Integer, nullable=True)  # MB
+	cpu_limit = db.Column(db.Float, nullable=True)  # cpus
+	pids_limit = db.Column(db.Integer, nullable=True)
+	tmpfs = db.Column(db.Text, nullable=True)  # "path[:options]" per line
+	network_mode = db.Column(db.Text, nullable=True)
+	max_instances = db.Column(db.Integer, nullable=True)
+	run_kwargs = db.Column(db.Text, nullable=True)
+
+	# solves by visible accounts, maintained on solve. null means it has to be
+	# rebuilt from the solves table on the next value calculation.
+	solve_count = db.Column(db.Integer, nullable=True)
+
 	# dynamic challenge properties
 	initial = db.Column(db.Integer, default=0)
 	minimum = db.Column(db.Integer, default=0)
@@ -29,6 +54,12 @@ class ContainerChallengeModel(Challenges):
 class ContainerInfoModel(db.Model):
 	__tablename__ = 'container_info'
 	__mapper_args__ = {'polymorphic_identity': 'container_info'}
+	# one container per owner and challenge. null team ids never collide, so the
+	# team index only applies in team mode. the indexes also serve the lookups.
+	__table_args__ = (
+		db.Index('ix_container_info_challenge_team', 'challenge_id', 'team_id', unique=True),
+		db.Index('ix_container_info_challenge_user', 'challenge_id', 'user_id', unique=True),
+	)
 	container_id = db.Column(db.String(512), primary_key=True)
 	challenge_id = db.Column(
 		db.Integer,
@@ -42,17 +73,72 @@ class ContainerInfoModel(db.Model):
 	user_id = db.Column(
 		db.Integer,
 		db.ForeignKey('users.id', ondelete='CASCADE'),
-		nullable=True
+		nullable=True,
+		index=True
 	)
+	node = db.Column(db.String(128), nullable=True)
 	port = db.Column(db.Integer)
 	ssh_username = db.Column(db.Text, nullable=True)
 	ssh_password = db.Column(db.Text, nullable=True)
 	timestamp = db.Column(db.Integer)
-	expires = db.Column(db.Integer)
+	expires = db.Column(db.Integer, index=True)
+	# last time the activity monitor saw traffic or cpu use, or the owner renewed
+	last_active = db.Column(db.Integer, nullable=True)
+	# when the container passed its readiness check, null while starting, 0 if it never did
+	ready_at = db.Column(db.Integer, nullable=True)
+	# change sequence value of the last write a client should see, see changes.py
+	version = db.Column(db.BigInteger, nullable=True, index=True)
 	team = relationship('Teams', foreign_keys=[team_id])
 	user = relationship('Users', foreign_keys=[user_id])
 	challenge = relationship(ContainerChallengeModel, foreign_keys=[challenge_id])
 
+class ContainerPoolModel(db.Model):
+	__tablename__ = 'container_pool'
+	__mapper_args__ = {'polymorphic_identity': 'container_pool'}
+	container_id = db.Column(db.String(512), primary_key=True)
+	challenge_id = db.Column(
+		db.Integer,
+		db.ForeignKey('challenges.id', ondelete='CASCADE'),
+		index=True
+	)
+	node = db.Column(db.String(128), nullable=True)
+	port = db.Column(db.Integer)
+	timestamp = db.Column(db.Integer)
+
+class ContainerTombstoneModel(db.Model):
+	__tablename__ = 'container_tombstones'
+	__mapper_args__ = {'polymorphic_identity': 'container_tombstones'}
+	# a removed container_info row, kept so since-version clients learn it is gone
+	id = db.Column(db.Integer, primary_key=True)
+	container_id = db.Column(db.String(512))
+	challenge_id = db.Column(db.Integer)
+	team_id = db.Column(db.Integer, nullable=True)
+	user_id = db.Column(db.Integer, nullable=True)
+	node = db.Column(db.String(128), nullable=True)
+	version = db.Column(db.BigInteger, index=True)
+	removed = db.Column(db.Integer)
+
+class ContainerSequenceModel(db.Model):
+	__tablename__ = 'container_sequence'
+	__mapper_args__ = {'polymorphic_identity': 'container_sequence'}
+	# single row holding the last change sequence value handed out, and the value up
+	# to which tombstones were pruned
+	id = db.Column(db.Integer, primary_key=True)
+	value = db.Column(db.BigInteger, default=0)
+	pruned = db.Column(db.BigInteger, default=0)
+
+class ContainerCoordinationModel(db.Model):
+	__tablename__ = 'container_coordination'
+	__mapper_args__ = {'polymorphic_identity': 'container_coordination'}
+	# state shared by the workers of the sql coordination backend: leases (leadership,
+	# port and capacity claims) held by an owner until they expire, and counters that
+	# are bumped to broadcast invalidations
+	key = db.Column(db.String(255), primary_key=True)
+	owner = db.Column(db.String(255), nullable=True)
+	value = db.Column(db.Text, nullable=True)
+	counter = db.Column(db.BigInteger, default=0)
+	expires = db.Column(db.Integer, nullable=True, index=True)
+
 class ContainerSettingsModel(db.Model):
 	__tablename__ = 'container_settings'
 	__mapper_args__ = {'polymorphic_identity': 'container_settings'}
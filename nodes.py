@@ -0,0 +1,242 @@
+import threading
+import time
+
+import docker
+import paramiko
+import requests
+from sqlalchemy import or_
+
+from CTFd.models import db
+from .models import ContainerInfoModel, ContainerPoolModel
+from .port_allocator import PortAllocator
+from .health import HealthMonitor, DOWN
+from .events import DockerEventListener
+from .clients import build_client, close_client, DEFAULT_POOL_SIZE
+
+# label attached to every container spawned by the plugin
+PLUGIN_LABEL = "ctfd.containers"
+
+# name of the node configured through docker_base_url/docker_hostname. rows written
+# before multi-node support have no node recorded and belong to it.
+DEFAULT_NODE = "default"
+
+# how long a node's image list is reused. image events drop it earlier while the
+# event stream is connected.
+IMAGE_LIST_TTL = 30  # seconds
+
+# errors raised by the docker sdk when the daemon itself is unreachable
+CONNECTION_ERRORS = (
+    requests.exceptions.RequestException,
+    paramiko.ssh_exception.SSHException,
+)
+
+
+def parse_nodes(settings: dict) -> list:
+    # list of (name, base_url, hostname) from the settings. the primary daemon comes
+    # from docker_base_url, extra daemons from docker_nodes, one per line as
+    # "name base_url hostname"
+    nodes = []
+    if settings.get("docker_base_url"):
+        nodes.append((DEFAULT_NODE, settings["docker_base_url"], settings.get("docker_hostname", "")))
+
+    for line in (settings.get("docker_nodes") or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split()
+        if len(parts) != 3:
+            raise ValueError(f"invalid docker node '{line}', expected: name base_url hostname")
+        nodes.append(tuple(parts))
+
+    names = [name for name, _, _ in nodes]
+    if len(names) != len(set(names)):
+        raise ValueError("docker node names must be unique")
+
+    return nodes
+
+
+def _sparse_status(container) -> dict:
+    # status and first published host port of a container returned by a sparse list
+    port = None
+    for mapping in container.attrs.get("Ports") or []:
+        if mapping.get("PublicPort"):
+            port = mapping["PublicPort"]
+            break
+    return {"status": container.status, "port": port}
+
+
+class DockerNode:
+    # one docker daemon along with everything tied to it: the client, its cached
+    # health, the host ports it publishes and its event stream. the client is built
+    # lazily on first use and reused (with its connection pool) until it fails.
+    def __init__(self, name: str, base_url: str, hostname: str, app, on_failure=None, on_exit=None, pool_size: int = DEFAULT_POOL_SIZE):
+        self.name = name
+        self.base_url = base_url
+        self.hostname = hostname
+        self.pool_size = pool_size
+        self.app = app
+        self.on_failure = on_failure
+        self.on_exit = on_exit  # called with the id of a container that stopped serving
+        self.client = None
+        self.connect_lock = threading.Lock()
+        self.info = {}
+        self.health = HealthMonitor()
+        self.port_allocator = PortAllocator()
+        self.event_listener = DockerEventListener(self, PLUGIN_LABEL)
+        self.images = None  # cached image summaries
+        self.images_loaded = 0
+        self.images_generation = 0  # bumped on every invalidation
+
+    def is_available(self) -> bool:
+        return self.client is not None and self.health.is_available()
+
+    def owns(self, model):
+        # filter matching the rows of a model that live on this node
+        if self.name == DEFAULT_NODE:
+            return or_(model.node == self.name, model.node.is_(None))
+        return model.node == self.name
+
+    def connect(self):
+        # (re)build the docker client, raises the sdk error if the daemon is unreachable
+        with self.connect_lock:
+            self._connect()
+
+    def ensure_connected(self):
+        # build the client on first use, honouring the reconnect backoff
+        if self.client is not None or not self.health.should_reconnect():
+            return
+
+        with self.connect_lock:
+            if self.client is not None:
+                return  # another thread connected while we waited
+            try:
+                self._connect()
+            except (docker.errors.DockerException,) + CONNECTION_ERRORS:
+                pass
+
+    def _connect(self):
+        # the old client is closed first so its pooled connections and ssh session
+        # are released instead of piling up across reconnects
+        self.event_listener.stop()
+        close_client(self.client)
+        self.client = None
+
+        client = None
+        try:
+            client = build_client(self.base_url, self.pool_size)
+            client.ping()
+            self.info = client.info()
+        except (docker.errors.DockerException,) + CONNECTION_ERRORS as e:
+            close_client(client)
+            self.health.mark_down(e)
+            raise
+
+        self.client = client
+        self.health.mark_success()
+        self.invalidate_images()
+
+        # seed the port allocator from the database and the daemon
+        self.reconcile_ports()
+        self.event_listener.start()
+
+    def disconnect(self):
+        self.event_listener.stop()
+        close_client(self.client)
+        self.client = None
+        self.health.mark_down()
+
+    def heartbeat(self):
+        # refresh the cached health state, reconnecting with backoff when down
+        if self.client is None or self.health.state == DOWN:
+            if self.health.should_reconnect():
+                try:
+                    self.connect()
+                except (docker.errors.DockerException,) + CONNECTION_ERRORS:
+                    pass
+            return
+
+        try:
+            self.client.ping()
+            self.health.mark_success()
+        except (docker.errors.DockerException,) + CONNECTION_ERRORS as e:
+            self.health.mark_failure(e)
+            return
+
+        # restart the event stream if it dropped while the daemon stayed reachable
+        self.event_listener.start()
+
+    def report_failure(self, error):
+        # demote the cached state after a failed real call
+        self.health.mark_failure(error)
+        if self.on_failure is not None:
+            self.on_failure(self)
+
+    def reconcile_ports(self):
+        # rebuild the port bitmap from the ports recorded in the database and the
+        # ports the daemon is actually publishing, so leases leaked by crashes or
+        # containers started outside of ctfd never get handed out
+        if self.client is None:
+            return
+
+        with self.app.app_context():
+            owners = {}
+            for model in (ContainerInfoModel, ContainerPoolModel):
+                owners.update(
+                    db.session.query(model.container_id, model.port)
+                    .filter(self.owns(model))
+                    .all()
+                )
+
+        used_ports = []
+        try:
+            for container in self.client.containers.list(sparse=True):
+                for mapping in container.attrs.get("Ports") or []:
+                    if mapping.get("PublicPort"):
+                        used_ports.append(int(mapping["PublicPort"]))
+        except (docker.errors.DockerException,) + CONNECTION_ERRORS:
+            return  # keep the current view until the daemon is reachable again
+
+        self.port_allocator.reconcile(owners, used_ports)
+
+    def get_containers_status(self, container_ids=None) -> dict:
+        # look up every plugin container with a single list call, returns a dict of
+        # container id -> {"status", "port"}. ids passed in that are not labelled
+        # (e.g. spawned by an older version) are resolved with one extra list call.
+        # while the event stream is connected the answer comes from its cache.
+        cached = self.event_listener.cache.snapshot()
+        if cached is not None and all(cid in cached for cid in container_ids or ()):
+            return cached
+
+        containers = self.client.containers.list(
+            all=True, sparse=True, filters={"label": PLUGIN_LABEL}
+        )
+        statuses = {container.id: _sparse_status(container) for container in containers}
+
+        missing = [cid for cid in container_ids or () if cid not in statuses]
+        if missing:
+            containers = self.client.containers.list(
+                all=True, sparse=True, filters={"id": missing}
+            )
+            for container in containers:
+                statuses[container.id] = _sparse_status(container)
+
+        return statuses
+
+    def invalidate_images(self):
+        self.images_generation += 1
+        self.images = None
+
+    def list_images(self) -> list:
+        # image summaries of the daemon (tags, digests, size, created), reused for
+        # IMAGE_LIST_TTL or until an image event invalidates them. raises sdk errors.
+        images = self.images
+        if images is not None and time.monotonic() - self.images_loaded < IMAGE_LIST_TTL:
+            return images
+
+        # a list that raced with an image event is returned but not cached
+        generation = self.images_generation
+        loaded = time.monotonic()
+        images = self.client.api.images()
+        if generation == self.images_generation:
+            self.images, self.images_loaded = images, loaded
+        return images
@@ -0,0 +1,62 @@
+# strategies for picking the docker node a new container is placed on.
+#   spread: fewest instances of the same challenge, so one broken node doesn't take
+#           out a whole challenge
+#   least_loaded: fewest instances overall
+#   resources: most free memory and cpu after the limits of the running instances and
+#              of the container being placed
+STRATEGIES = ("spread", "least_loaded", "resources")
+DEFAULT_STRATEGY = "spread"
+
+
+def free_fraction(node, running: int, used: tuple = (0, 0), need: tuple = (0, 0)) -> float:
+    # share of the node's memory/cpu left once every running instance uses its limit
+    # and the new one is added. used and need are (memory MB, cpus) pairs. without
+    # limits (or daemon info) it degrades to an instance count comparison.
+    mem_total = (node.info.get("MemTotal") or 0) / (1024 * 1024)  # MB
+    cpu_total = node.info.get("NCPU") or 0
+    used_mem, used_cpu = used
+    need_mem, need_cpu = need
+
+    fractions = []
+    if (used_mem or need_mem) and mem_total:
+        fractions.append(1 - (used_mem + need_mem) / mem_total)
+    if (used_cpu or need_cpu) and cpu_total:
+        fractions.append(1 - (used_cpu + need_cpu) / cpu_total)
+
+    if not fractions:
+        return -running
+    return min(fractions)
+
+
+def fits(node, used: tuple, need: tuple, overcommit: float = 1.0) -> bool:
+    # whether a container needing `need` still fits next to the `used` limits, both
+    # (memory MB, cpus). resources the daemon didn't report aren't constrained.
+    mem_total = (node.info.get("MemTotal") or 0) / (1024 * 1024)  # MB
+    cpu_total = node.info.get("NCPU") or 0
+
+    if need[0] and mem_total and used[0] + need[0] > mem_total * overcommit:
+        return False
+    if need[1] and cpu_total and used[1] + need[1] > cpu_total * overcommit:
+        return False
+    return True
+
+
+def choose_node(nodes: list, strategy: str, running: dict, challenge_running: dict, used: dict = None, need: tuple = (0, 0)):
+    # pick one of the given (available) nodes. running and challenge_running map node
+    # names to their live instance count overall and for the challenge being placed,
+    # used maps them to the (memory MB, cpus) reserved by their live instances.
+    if not nodes:
+        return None
+
+    used = used or {}
+
+    def load(node):
+        return running.get(node.name, 0)
+
+    if strategy == "least_loaded":
+        return min(nodes, key=load)
+
+    if strategy == "resources":
+        return max(nodes, key=lambda node: free_fraction(node, load(node), used.get(node.name, (0, 0)), need))
+
+    return min(nodes, key=lambda node: (challenge_running.get(node.name, 0), load(node)))
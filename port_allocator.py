@@ -0,0 +1,119 @@
+import random
+import threading
+from collections import deque
+
+DEFAULT_PORT_RANGE = (1024, 65535)
+
+
+class PortAllocator:
+    # tracks which host ports are leased to containers so spawns never have to probe.
+    # the bitmap holds one byte per port in the range, the free deque is a shuffled
+    # queue of candidate ports. entries in the deque may be stale (leased by a
+    # reconciliation after they were queued), those are skipped lazily on lease.
+    def __init__(self, start: int = DEFAULT_PORT_RANGE[0], end: int = DEFAULT_PORT_RANGE[1]):
+        self.lock = threading.Lock()
+        self.configure(start, end)
+
+    def configure(self, start: int, end: int):
+        # (re)build the allocator for a new port range, dropping all leases
+        if not (0 < start <= end <= 65535):
+            raise ValueError(f"invalid port range {start}-{end}")
+
+        with self.lock:
+            self.start = start
+            self.end = end
+            self.leased = bytearray(end - start + 1)
+            self.owners = {}  # container id -> port
+            self.pending = set()  # leased ports not yet bound to a container
+            self.free = self._shuffled_free()
+
+    def _shuffled_free(self) -> deque:
+        ports = [self.start + i for i, used in enumerate(self.leased) if not used]
+        random.shuffle(ports)
+        return deque(ports)
+
+    def _in_range(self, port: int) -> bool:
+        return self.start <= port <= self.end
+
+    def lease(self):
+        # take a free port, returns None when the range is exhausted
+        with self.lock:
+            while self.free:
+                port = self.free.popleft()
+                if not self.leased[port - self.start]:
+                    self.leased[port - self.start] = 1
+                    self.pending.add(port)
+                    return port
+            return None
+
+    def mark_used(self, port: int):
+        # flag a port as taken by something we don't own (e.g. a foreign container)
+        with self.lock:
+            if self._in_range(port):
+                self.leased[port - self.start] = 1
+                self.pending.discard(port)
+
+    def bind(self, container_id: str, port: int):
+        # attach a leased port to the container that is now publishing it
+        with self.lock:
+            self.pending.discard(port)
+            if self._in_range(port):
+                self.leased[port - self.start] = 1
+            self.owners[container_id] = port
+
+    def release(self, port: int):
+        # return a port to the free queue
+        with self.lock:
+            self._release(port)
+
+    def release_container(self, container_id: str):
+        # return the port owned by a container, if any
+        with self.lock:
+            port = self.owners.pop(container_id, None)
+            if port is not None:
+                self._release(port)
+
+    def port_of(self, container_id: str):
+        # host port bound to a container, None if it owns none
+        with self.lock:
+            return self.owners.get(container_id)
+
+    def _release(self, port: int):
+        self.pending.discard(port)
+        if self._in_range(port) and self.leased[port - self.start]:
+            self.leased[port - self.start] = 0
+            self.free.append(port)
+
+    def reconcile(self, owners: dict, used_ports=()):
+        # rebuild the bitmap from the authoritative view of the world.
+        # owners maps container ids to their published port, used_ports are
+        # ports published by containers we don't manage. pending leases are
+        # kept since their containers may not exist yet.
+        with self.lock:
+            self.leased = bytearray(self.end - self.start + 1)
+            self.owners = {}
+
+            for container_id, port in owners.items():
+                if port is None:
+                    continue
+                self.owners[container_id] = port
+                if self._in_range(port):
+                    self.leased[port - self.start] = 1
+
+            for port in list(used_ports) + list(self.pending):
+                if self._in_range(port):
+                    self.leased[port - self.start] = 1
+
+            self.free = self._shuffled_free()
+
+    def stats(self) -> dict:
+        with self.lock:
+            size = self.end - self.start + 1
+            leased = sum(self.leased)
+            return {
+                "start": self.start,
+                "end": self.end,
+                "size": size,
+                "leased": leased,
+                "free": size - leased,
+            }
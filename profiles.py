@@ -0,0 +1,103 @@
+import json
+
+# per-challenge resource profile columns, blank values fall back to the global limits
+PROFILE_FIELDS = ("mem_limit", "cpu_limit", "pids_limit", "tmpfs", "network_mode", "max_instances")
+
+# network modes that would leave the published challenge port unreachable
+UNSUPPORTED_NETWORK_MODES = ("host", "none")
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _positive(data: dict, field: str, cast, label: str):
+    value = data.get(field)
+    if _blank(value):
+        return None
+    try:
+        value = cast(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"{label} must be a number")
+    if value <= 0:
+        raise ValueError(f"{label} must be positive")
+    return value
+
+
+def normalize_profile(data: dict) -> dict:
+    # typed profile values from submitted form data, raises ValueError when invalid
+    profile = {
+        "mem_limit": _positive(data, "mem_limit", int, "memory limit"),
+        "cpu_limit": _positive(data, "cpu_limit", float, "cpu limit"),
+        "pids_limit": _positive(data, "pids_limit", int, "pids limit"),
+        "max_instances": _positive(data, "max_instances", int, "max instances"),
+        "tmpfs": None,
+        "network_mode": None,
+    }
+
+    if not _blank(data.get("tmpfs")):
+        profile["tmpfs"] = "\n".join(
+            line.strip() for line in str(data["tmpfs"]).splitlines() if line.strip()
+        )
+        parse_tmpfs(profile["tmpfs"])
+
+    if not _blank(data.get("network_mode")):
+        network_mode = str(data["network_mode"]).strip()
+        if network_mode in UNSUPPORTED_NETWORK_MODES or network_mode.startswith("container:") or " " in network_mode:
+            raise ValueError(f"network mode '{network_mode}' can't publish the challenge port")
+        profile["network_mode"] = network_mode
+
+    return profile
+
+
+def parse_tmpfs(tmpfs: str) -> dict:
+    # "path[:options]" per line, e.g. /tmp:size=64m,noexec
+    mounts = {}
+    for line in (tmpfs or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        path, _, options = line.partition(":")
+        if not path.startswith("/"):
+            raise ValueError(f"tmpfs mount '{line}' must start with an absolute path")
+        mounts[path] = options
+    return mounts
+
+
+def compile_run_kwargs(profile: dict, volumes: str = "") -> dict:
+    # docker run kwargs of a challenge, computed once when it is saved. limits left
+    # blank are filled in from the global settings at spawn time.
+    kwargs = {}
+    if profile.get("mem_limit"):
+        kwargs["mem_limit"] = f"{profile['mem_limit']}m"
+    if profile.get("cpu_limit"):
+        kwargs["cpu_quota"] = int(profile["cpu_limit"] * 100000)
+        kwargs["cpu_period"] = 100000
+    if profile.get("pids_limit"):
+        kwargs["pids_limit"] = profile["pids_limit"]
+    if profile.get("tmpfs"):
+        kwargs["tmpfs"] = parse_tmpfs(profile["tmpfs"])
+    if profile.get("network_mode"):
+        kwargs["network"] = profile["network_mode"]
+
+    if not _blank(volumes):
+        try:
+            kwargs["volumes"] = json.loads(volumes)
+        except json.decoder.JSONDecodeError:
+            raise ValueError("volumes json string is invalid")
+
+    return kwargs
+
+
+def load_run_kwargs(challenge) -> dict:
+    # the precompiled run kwargs of a challenge, compiling them for challenges saved
+    # before profiles existed. raises ValueError for an invalid stored configuration.
+    if challenge.run_kwargs:
+        return json.loads(challenge.run_kwargs)
+    profile = {field: getattr(challenge, field, None) for field in PROFILE_FIELDS}
+    return compile_run_kwargs(profile, challenge.volumes)
+
+
+def default_run_kwargs(mem_limit: int, cpu_limit: float) -> dict:
+    # run kwargs of the global limits, applied where a challenge sets none
+    return compile_run_kwargs({"mem_limit": mem_limit, "cpu_limit": cpu_limit})
@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+
+from CTFd.models import db
+
+# how often an open stream re-reads its state without being notified. changes made
+# by other worker processes show up within this interval.
+STREAM_RESYNC_INTERVAL = 15  # seconds
+
+# how long one stream stays open before the browser reconnects, which bounds how long
+# a worker is tied to a client that went away without closing the connection
+STREAM_TIMEOUT = 300  # seconds
+
+# reconnect delay sent to the browser
+STREAM_RETRY = 2000  # milliseconds
+
+
+def owner_of(team_id, user_id) -> tuple:
+    # the account a container belongs to, the team in team mode
+    return ("team", team_id) if team_id is not None else ("user", user_id)
+
+
+def format_event(event: str, payload) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def diff_states(previous: dict, current: dict, now: float) -> list:
+    # (event, payload) pairs that turn previous into current, both map a key to the
+    # state of one container. a different creation time means it was replaced.
+    events = []
+    for key, old in previous.items():
+        state = current.get(key)
+        if state is None or state["created"] != old["created"]:
+            expired = old["expires"] and old["expires"] <= now
+            events.append(("expired" if expired else "killed", old))
+
+    for key, state in current.items():
+        old = previous.get(key)
+        if old is None or old["created"] != state["created"]:
+            events.append(("created", state))
+        elif old["status"] != state["status"] and state["status"] == "running":
+            events.append(("ready", state))
+        elif old["expires"] != state["expires"]:
+            events.append(("renewed", state))
+        elif old != state:
+            events.append(("updated", state))
+    return events
+
+
+class Subscription:
+    def __init__(self, owner):
+        self.owner = owner  # None for admins, who see every container
+        self.event = threading.Event()
+
+
+class StateNotifier:
+    # wakes the push streams whose containers may have changed. a stream re-reads
+    # its state from the database when woken and sends only the differences, so a
+    # notification carries no state and a missed one only delays an update.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def subscribe(self, owner=None) -> Subscription:
+        subscription = Subscription(owner)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def notify(self, owner=None):
+        # wake the streams of an account and the admin streams, every stream when
+        # the owner isn't known (e.g. after a bulk delete)
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            if owner is None or subscription.owner is None or subscription.owner == owner:
+                subscription.event.set()
+
+    def stream(self, owner, load_state):
+        # server-sent events for the containers load_state() returns as {key: state},
+        # a snapshot first and then created/ready/renewed/expired/killed changes
+        subscription = self.subscribe(owner)
+        try:
+            yield f"retry: {STREAM_RETRY}\n\n"
+
+            state = self._load(load_state)
+            yield format_event("snapshot", list(state.values()))
+
+            deadline = time.time() + STREAM_TIMEOUT
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                subscription.event.wait(min(remaining, STREAM_RESYNC_INTERVAL))
+                subscription.event.clear()
+
+                current = self._load(load_state)
+                events = diff_states(state, current, time.time())
+                for event, payload in events:
+                    yield format_event(event, payload)
+                if not events:
+                    # keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                state = current
+        finally:
+            self.unsubscribe(subscription)
+
+    @staticmethod
+    def _load(load_state) -> dict:
+        # read in a fresh transaction and give the connection back while waiting
+        db.session.rollback()
+        try:
+            return load_state()
+        finally:
+            db.session.close()
@@ -0,0 +1,300 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+import requests
+from sqlalchemy.exc import SQLAlchemyError
+
+from CTFd.models import db
+from .models import ContainerInfoModel
+from .metrics import TIME_TO_READY, READY_TIMEOUTS
+from .changes import next_version
+from .push import owner_of
+
+# readiness checks a challenge can use before its instances are handed out.
+#   tcp: the published port accepts connections
+#   http: a GET of ready_target (a path) answers with a non-error status
+#   command: ready_target exits with 0 when run inside the container
+#   none: ready as soon as docker started it
+# the probes connect from the ctfd host to docker_hostname, which isn't always
+# reachable from there, so challenges opt into them and the default is none.
+READY_CHECKS = ("tcp", "http", "command", "none")
+DEFAULT_READY_CHECK = "none"
+
+# challenge columns configuring the check
+READY_FIELDS = ("ready_check", "ready_target", "ready_timeout")
+
+# how long a started container may take to pass its readiness check by default
+READY_TIMEOUT = 120  # seconds
+MAX_READY_TIMEOUT = 3600  # seconds
+
+# pause between two probes while waiting for a container
+READY_POLL_INTERVAL = 0.25  # seconds
+
+# timeout of a single probe
+PROBE_TIMEOUT = 2  # seconds
+
+# containers watched concurrently in the background
+READY_WORKERS = 32
+
+# ready_at of a container that never passed its check
+READY_FAILED = 0
+
+# a watch holds a claim on its container while it probes, so that the leader picks
+# up the containers whose watch died with its worker (and only those)
+READY_CLAIM_TTL = 30  # seconds
+READY_CLAIM_RENEW = 10  # seconds, also how often a watch checks its row still exists
+
+# how often the leader looks for starting containers nobody watches
+READY_RESUME_INTERVAL = 30  # seconds
+
+
+def port_open(host: str, port, timeout: float = 1.0) -> bool:
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            return True
+    except (OSError, ValueError, TypeError):
+        return False
+
+
+def wait_for_port(host: str, port, timeout: float = READY_TIMEOUT) -> bool:
+    # block until something accepts connections on host:port, False on timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        if port_open(host, port):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(READY_POLL_INTERVAL)
+
+
+def ready_check_of(challenge) -> str:
+    # challenges saved before readiness checks existed use the default
+    return challenge.ready_check or DEFAULT_READY_CHECK
+
+
+def normalize_ready_check(data: dict) -> dict:
+    # typed readiness check fields from submitted form data, raises ValueError
+    check = str(data.get("ready_check") or DEFAULT_READY_CHECK).strip()
+    if check not in READY_CHECKS:
+        raise ValueError(f"readiness check must be one of {', '.join(READY_CHECKS)}")
+
+    target = str(data.get("ready_target") or "").strip() or None
+    if check == "http":
+        target = target or "/"
+        if not target.startswith("/"):
+            raise ValueError("readiness check path must start with /")
+    elif check == "command":
+        if not target:
+            raise ValueError("readiness check command is required")
+    else:
+        target = None
+
+    timeout = data.get("ready_timeout")
+    if timeout is None or (isinstance(timeout, str) and not timeout.strip()):
+        timeout = None
+    else:
+        try:
+            timeout = int(timeout)
+        except (ValueError, TypeError):
+            raise ValueError("readiness timeout must be a number")
+        if not 0 < timeout <= MAX_READY_TIMEOUT:
+            raise ValueError(f"readiness timeout must be between 1 and {MAX_READY_TIMEOUT} seconds")
+
+    return {"ready_check": check, "ready_target": target, "ready_timeout": timeout}
+
+
+def probe(check: str, target, host: str, port, node, container_id: str) -> bool:
+    # run one readiness probe against a container
+    if check == "http":
+        try:
+            response = requests.get(
+                f"http://{host}:{port}{target or '/'}", timeout=PROBE_TIMEOUT, allow_redirects=False
+            )
+        except requests.exceptions.RequestException:
+            return False
+        return response.status_code < 400
+
+    if check == "command":
+        try:
+            exit_code, _ = node.client.containers.get(container_id).exec_run(target)
+        except (docker.errors.DockerException, requests.exceptions.RequestException):
+            return False
+        return exit_code == 0
+
+    return port_open(host, port, timeout=PROBE_TIMEOUT)
+
+
+class ReadinessTracker:
+    # waits in the background for new containers to pass their challenge's readiness
+    # check and then marks their row ready, until then the api reports them as
+    # starting. time to ready is recorded per start path (cold, restore or pool).
+    def __init__(self, manager):
+        self.manager = manager
+        self.app = manager.app
+        self.notifier = manager.notifier  # wakes the push streams of the container's owner
+        self.lock = threading.Lock()
+        self.paths = {}  # container id -> start path, until the container is watched
+        self.watching = set()  # container ids probed by this worker
+        self.executor = ThreadPoolExecutor(max_workers=READY_WORKERS, thread_name_prefix="container-ready")
+
+    def record_path(self, container_id: str, path: str):
+        with self.lock:
+            self.paths[container_id] = path
+
+    def forget(self, container_id: str):
+        with self.lock:
+            self.paths.pop(container_id, None)
+
+    def handed_out(self, container_id: str, started: float):
+        # a container without a readiness check counts as ready once it is handed out
+        with self.lock:
+            path = self.paths.pop(container_id, "pool")
+        TIME_TO_READY.observe(time.perf_counter() - started, path=path)
+
+    def cancel(self, container_id: str):
+        # the container was killed, stop probing it
+        with self.lock:
+            self.paths.pop(container_id, None)
+            self.watching.discard(container_id)
+
+    def watch(self, container_id: str, challenge, node, host: str, port, started: float, owner=None):
+        # started is the time.perf_counter() reading the spawn began at
+        with self.lock:
+            path = self.paths.pop(container_id, "pool")
+        self._claim(container_id)
+        self._submit(container_id, challenge, node, host, port, time.time() + self._timeout(challenge), started, path, owner)
+
+    def resume(self):
+        # leader job, watches the starting containers whose watch is gone, e.g. because
+        # their worker restarted. the watch still ends at the original deadline.
+        with self.app.app_context():
+            rows = (
+                db.session.query(
+                    ContainerInfoModel.container_id,
+                    ContainerInfoModel.challenge_id,
+                    ContainerInfoModel.team_id,
+                    ContainerInfoModel.user_id,
+                    ContainerInfoModel.node,
+                    ContainerInfoModel.port,
+                    ContainerInfoModel.timestamp,
+                )
+                .filter(ContainerInfoModel.ready_at.is_(None), ContainerInfoModel.port.isnot(None))
+                .all()
+            )
+
+        for container_id, challenge_id, team_id, user_id, node_name, port, created in rows:
+            with self.lock:
+                if container_id in self.watching:
+                    continue
+            challenge = self.manager.challenge_cache.get(challenge_id)
+            node = self.manager.get_node(node_name)
+            if challenge is None or node is None or not self._claim(container_id, takeover=True):
+                continue
+            self._submit(
+                container_id,
+                challenge,
+                node,
+                self.manager.get_hostname(node_name),
+                port,
+                (created or 0) + self._timeout(challenge),
+                None,
+                "resumed",
+                owner_of(team_id, user_id),
+            )
+
+    @staticmethod
+    def _timeout(challenge) -> int:
+        return challenge.ready_timeout or READY_TIMEOUT
+
+    def _claim(self, container_id: str, takeover: bool = False) -> bool:
+        # take or renew the watch claim. a backend that can't be reached doesn't stop
+        # a watch that is running, but no watch is resumed without it.
+        try:
+            return self.manager.coordinator.claim(
+                f"ready:{container_id}", self.manager.instance_id, ttl=READY_CLAIM_TTL
+            )
+        except Exception as e:
+            print(f"[container readiness] could not claim {container_id}: {e}")
+            return not takeover
+
+    def _release(self, container_id: str):
+        try:
+            self.manager.coordinator.release(f"ready:{container_id}", self.manager.instance_id)
+        except Exception:
+            pass  # the claim expires on its own
+
+    def _submit(self, container_id, challenge, node, host, port, deadline, started, path, owner):
+        with self.lock:
+            self.watching.add(container_id)
+        self.executor.submit(
+            self._watch,
+            container_id,
+            ready_check_of(challenge),
+            challenge.ready_target,
+            deadline,
+            node,
+            host,
+            port,
+            started,
+            path,
+            owner,
+        )
+
+    def _still_watched(self, container_id: str) -> bool:
+        # false once the container was killed here, its row is gone (killed on another
+        # worker) or another worker took the watch over
+        with self.lock:
+            if container_id not in self.watching:
+                return False
+        try:
+            with self.app.app_context():
+                exists = db.session.query(ContainerInfoModel.container_id).filter_by(
+                    container_id=container_id
+                ).first()
+        except SQLAlchemyError as e:
+            # keep probing and holding the claim, the row is checked again next time
+            print(f"[container readiness] could not look up {container_id}: {e}")
+            return self._claim(container_id)
+        return exists is not None and self._claim(container_id)
+
+    def _watch(self, container_id, check, target, deadline, node, host, port, started, path, owner):
+        # deadline is a time.time() reading
+        try:
+            renew = time.monotonic() + READY_CLAIM_RENEW
+            while True:
+                with self.lock:
+                    if container_id not in self.watching:
+                        return
+                ready = probe(check, target, host, port, node, container_id)
+                if ready or time.time() >= deadline:
+                    break
+                if time.monotonic() >= renew:
+                    if not self._still_watched(container_id):
+                        return
+                    renew = time.monotonic() + READY_CLAIM_RENEW
+                time.sleep(READY_POLL_INTERVAL)
+
+            # resumed watches don't know when their spawn started
+            if ready and started is not None:
+                TIME_TO_READY.observe(time.perf_counter() - started, path=path)
+            elif not ready:
+                READY_TIMEOUTS.inc(path=path)
+
+            try:
+                with self.app.app_context():
+                    ContainerInfoModel.query.filter_by(container_id=container_id, ready_at=None).update(
+                        {"ready_at": int(time.time()) if ready else READY_FAILED, "version": next_version()},
+                        synchronize_session=False,
+                    )
+                    db.session.commit()
+            except Exception as e:
+                print(f"[container readiness] could not record readiness of {container_id}: {e}")
+                return
+            self.notifier.notify(owner)
+        finally:
+            with self.lock:
+                self.watching.discard(container_id)
+            self._release(container_id)
@@ -0,0 +1,108 @@
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from CTFd.models import db, Solves, Users, Teams
+from CTFd.utils.modes import get_model
+
+from .models import ContainerChallengeModel
+
+# key in session.info collecting the accounts whose visibility changed in a flush
+STALE_ACCOUNTS = "container_stale_accounts"
+
+container_challenges = ContainerChallengeModel.__table__
+
+# how often the leader rebuilds every counter from the solves table, catching solves
+# removed by bulk deletes (e.g. a ctf reset) that fire no mapper events
+SOLVE_COUNT_REBUILD_INTERVAL = 600  # seconds
+
+
+def count_solves(challenge_ids=None) -> dict:
+    # count the solves of visible accounts per challenge with one grouped query
+    Model = get_model()
+    query = (
+        db.session.query(Solves.challenge_id, db.func.count())
+        .join(Model, Solves.account_id == Model.id)
+        .filter(Model.hidden == False, Model.banned == False)
+    )
+    if challenge_ids is not None:
+        query = query.filter(Solves.challenge_id.in_(challenge_ids))
+    return dict(query.group_by(Solves.challenge_id).all())
+
+
+def increment(challenge_id: int):
+    # bump the maintained counter in sql, so concurrent solves don't lose updates.
+    # a counter that was never built stays null and is rebuilt on the next read.
+    db.session.execute(
+        container_challenges.update()
+        .where(container_challenges.c.id == challenge_id)
+        .values(solve_count=container_challenges.c.solve_count + 1)
+    )
+
+
+def store(challenge_id: int, solve_count: int):
+    # save a rebuilt counter, unless a concurrent rebuild got there first
+    db.session.execute(
+        container_challenges.update()
+        .where(container_challenges.c.id == challenge_id)
+        .where(container_challenges.c.solve_count.is_(None))
+        .values(solve_count=solve_count)
+    )
+
+
+def invalidate(session, account_ids):
+    # drop the counters of every challenge solved by the given accounts, so they are
+    # rebuilt from the solves table on the next read
+    solved = select(Solves.challenge_id).where(Solves.account_id.in_(account_ids))
+    session.execute(
+        container_challenges.update()
+        .where(container_challenges.c.id.in_(solved))
+        .values(solve_count=None)
+    )
+
+
+def on_visibility_change(target, value, oldvalue, initiator):
+    # hiding or banning an account removes its solves from the count, unhiding
+    # brings them back. the counters are dropped after the change is flushed.
+    if value == oldvalue or target.id is None:
+        return
+    session = db.session()
+    session.info.setdefault(STALE_ACCOUNTS, set()).add(target.id)
+
+
+def on_solve_delete(mapper, connection, target):
+    # a solve removed by an admin no longer counts
+    connection.execute(
+        container_challenges.update()
+        .where(container_challenges.c.id == target.challenge_id)
+        .values(solve_count=None)
+    )
+
+
+def on_account_delete(mapper, connection, target):
+    # ctfd bulk-deletes an account's solves before the account itself, which fires no
+    # solve event and leaves nothing to look the challenges up by. drop every counter.
+    connection.execute(container_challenges.update().values(solve_count=None))
+
+
+def after_flush(session, flush_context):
+    account_ids = session.info.pop(STALE_ACCOUNTS, None)
+    if account_ids:
+        invalidate(session, list(account_ids))
+
+
+def register_listeners():
+    # keep the maintained solve counters in line with account visibility changes
+    for model in (Users, Teams):
+        for attribute in (model.hidden, model.banned):
+            if not event.contains(attribute, "set", on_visibility_change):
+                event.listen(attribute, "set", on_visibility_change)
+
+    for model in (Users, Teams):
+        if not event.contains(model, "after_delete", on_account_delete):
+            event.listen(model, "after_delete", on_account_delete)
+
+    if not event.contains(Solves, "after_delete", on_solve_delete):
+        event.listen(Solves, "after_delete", on_solve_delete)
+
+    if not event.contains(Session, "after_flush", after_flush):
+        event.listen(Session, "after_flush", after_flush)
@@ -0,0 +1,196 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .admission import ADMISSION_TIMEOUT
+
+QUEUED = "queued"
+WAITING = "waiting"  # held back by admission control until there is capacity
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# number of spawns handled concurrently by the background workers
+SPAWN_WORKERS = 8
+
+# how long finished jobs stay around for their owner to pick up the result
+JOB_TTL = 600  # seconds
+
+# how long the published state of an unfinished job lasts without changing, a job
+# may wait for admission until it times out
+PENDING_JOB_TTL = JOB_TTL + ADMISSION_TIMEOUT  # seconds
+
+# how often a job running on another worker is re-read while its events are streamed
+REMOTE_POLL_INTERVAL = 1  # seconds
+
+
+class SpawnJob:
+    def __init__(self, key, owner):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.owner = owner
+        self.status = QUEUED
+        self.result = None
+        self.position = None  # place in the admission queue while waiting
+        self.ticket = None
+        self.created = time.time()
+        self.updated = self.created
+        self.remote = False  # a copy of a job running on another worker
+        self.publish_lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, owner, state: dict) -> "SpawnJob":
+        job = cls(None, owner)
+        job.apply(state)
+        job.remote = True
+        return job
+
+    def apply(self, state: dict):
+        self.id = state["job_id"]
+        self.status = state["status"]
+        self.result = state["result"]
+        self.position = state["position"]
+        self.created = state["created"]
+        self.updated = state["updated"]
+
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "position": self.position,
+            "created": self.created,
+            "updated": self.updated,
+        }
+
+
+class SpawnQueue:
+    # runs container spawns off the request thread. identical requests (same key)
+    # that arrive while a job is still pending are folded into that job. spawns for a
+    # challenge wait for the admission controller before a worker picks them up.
+    # job states are published on the board so any worker can answer for them.
+    def __init__(self, app, workers: int = SPAWN_WORKERS, admission=None, board=None):
+        self.app = app
+        self.admission = admission
+        self.board = board
+        self.jobs = {}  # job id -> job
+        self.pending = {}  # key -> job id of the unfinished job for that key
+        self.changed = threading.Condition()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="container-spawn"
+        )
+
+    def submit(self, key, owner, func, *args, challenge_id=None, owner_filter=None) -> SpawnJob:
+        # func is called with the admitted node as node= when a challenge is given.
+        # owner_filter matches the requester's container_info rows for admission.
+        with self.changed:
+            self._prune()
+
+            job_id = self.pending.get(key)
+            if job_id is not None:
+                return self.jobs[job_id]
+
+            job = SpawnJob(key, owner)
+            if self.admission is not None and challenge_id is not None:
+                job.status = WAITING
+            self.jobs[job.id] = job
+            self.pending[key] = job.id
+
+        self._publish(job)
+        if job.status == WAITING:
+            ticket = self.admission.submit(
+                challenge_id,
+                lambda ticket, error: self._admitted(job, func, args, ticket, error),
+                lambda position: self._moved(job, position),
+                owner_filter,
+            )
+            self._moved(job, ticket.position)
+        else:
+            self.executor.submit(self._run, job, func, args, {})
+        return job
+
+    def _admitted(self, job: SpawnJob, func, args, ticket, error):
+        if error is not None:
+            self._update(job, FAILED, {"error": error})
+            return
+        job.ticket = ticket
+        self.executor.submit(self._run, job, func, args, {"node": ticket.node})
+
+    def _moved(self, job: SpawnJob, position: int):
+        with self.changed:
+            if job.status != WAITING:
+                return
+            job.position = position
+            job.updated = time.time()
+            self.changed.notify_all()
+        self._publish(job)
+
+    def _run(self, job: SpawnJob, func, args, kwargs):
+        self._update(job, RUNNING)
+        try:
+            with self.app.app_context():
+                result = func(*args, **kwargs)
+            status = FAILED if "error" in result else DONE
+        except Exception as e:
+            result = {"error": f"could not create container: {e}"}
+            status = FAILED
+        finally:
+            if job.ticket is not None:
+                self.admission.release(job.ticket)
+        self._update(job, status, result)
+
+    def _update(self, job: SpawnJob, status: str, result=None):
+        with self.changed:
+            job.status = status
+            job.result = result
+            job.position = None
+            job.updated = time.time()
+            if job.is_finished():
+                self.pending.pop(job.key, None)
+            self.changed.notify_all()
+        self._publish(job)
+
+    def _publish(self, job: SpawnJob):
+        if self.board is None:
+            return
+        # one publish per job at a time, so an older state never overwrites a newer one
+        with job.publish_lock:
+            with self.changed:
+                state = {"owner": job.owner, "job": job.to_dict()}
+                ttl = JOB_TTL if job.is_finished() else PENDING_JOB_TTL
+            self.board.publish(job.id, state, ttl)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id, job in list(self.jobs.items()):
+            if job.is_finished() and job.updated < cutoff:
+                del self.jobs[job_id]
+
+    def get(self, job_id: str, owner=None):
+        # a job by id, only visible to the account that requested it. jobs of other
+        # workers are read from the board.
+        job = self.jobs.get(job_id)
+        if job is None and self.board is not None:
+            state = self.board.get(job_id)
+            if state is not None:
+                job = SpawnJob.from_dict(state["owner"], state["job"])
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def wait(self, job: SpawnJob, since: float, timeout: float) -> bool:
+        # block until the job changes after `since`, returns False on timeout
+        if job.remote:
+            # changes on another worker are only seen by reading the board again
+            time.sleep(min(timeout, REMOTE_POLL_INTERVAL))
+            state = self.board.get(job.id)
+            if state is not None:
+                job.apply(state["job"])
+            return job.updated > since
+
+        with self.changed:
+            return self.changed.wait_for(lambda: job.updated > since, timeout=timeout)
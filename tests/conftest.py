@@ -0,0 +1,107 @@
+# run the tests from a CTFd checkout with the plugin installed under CTFd/plugins/,
+# like benchmarks/load_test.py:
+#
+#   cd CTFd/plugins/containers && python -m pytest
+#
+# every test gets a bare flask app bound to CTFd's db on a fresh in-memory sqlite
+# database, docker is replaced by benchmarks/fake_docker.py where one is needed.
+import importlib
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy.pool import StaticPool
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_NAME = os.path.basename(PLUGIN_DIR)
+CTFD_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(PLUGIN_DIR)))
+sys.path.insert(0, CTFD_ROOT)
+sys.path.insert(0, os.path.join(PLUGIN_DIR, "benchmarks"))
+
+
+def load(module: str):
+    # a module of the plugin, imported the way CTFd imports it
+    return importlib.import_module(f"CTFd.plugins.{PLUGIN_NAME}.{module}")
+
+
+@pytest.fixture
+def plugin():
+    return load
+
+
+@pytest.fixture
+def app():
+    from CTFd.models import db
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+        # one connection shared by every thread, or each would see its own database
+        SQLALCHEMY_ENGINE_OPTIONS={"poolclass": StaticPool, "connect_args": {"check_same_thread": False}},
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+    )
+    db.init_app(app)
+
+    load("models")  # registers the plugin's tables
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def make_challenge(app):
+    # insert a container challenge, returns its id
+    from CTFd.models import db
+
+    models = load("models")
+
+    def make(**fields):
+        fields = {
+            "name": "web", "category": "web", "description": "", "image": "ctf/web:latest",
+            "port": 80, "ctype": "http", "initial": 500, "minimum": 100, "decay": 50,
+            "state": "visible", "type": "container", **fields,
+        }
+        challenge = models.ContainerChallengeModel(**fields)
+        db.session.add(challenge)
+        db.session.commit()
+        return challenge.id
+
+    return make
+
+
+@pytest.fixture
+def make_user(app):
+    # insert a user, returns its id
+    from CTFd.models import db, Users
+
+    def make(name: str):
+        result = db.session.execute(Users.__table__.insert().values(
+            name=name, email=f"{name}@test.local", password="", type="user",
+            verified=True, hidden=False, banned=False,
+        ))
+        db.session.commit()
+        return result.inserted_primary_key[0]
+
+    return make
+
+
+@pytest.fixture
+def make_container(app):
+    # insert a container_info row, returns it
+    from CTFd.models import db
+
+    models = load("models")
+
+    def make(container_id: str, challenge_id: int, user_id: int = None, team_id: int = None, **fields):
+        row = models.ContainerInfoModel(
+            container_id=container_id, challenge_id=challenge_id, user_id=user_id, team_id=team_id,
+            **{"node": "default", "port": 30000, "timestamp": 0, "expires": 0, **fields},
+        )
+        db.session.add(row)
+        db.session.commit()
+        return row
+
+    return make
@@ -0,0 +1,187 @@
+import json
+import uuid
+
+import pytest
+
+NEED = (256, 0.5)  # memory MB and cpus of every fake spawn
+
+
+class FakeNode:
+    def is_available(self) -> bool:
+        return True
+
+
+class FakeManager:
+    # the parts of ContainerManager admission uses, one node with room for a fixed
+    # amount of memory
+    def __init__(self, plugin, app, memory: int):
+        self.app = app
+        self.instance_id = uuid.uuid4().hex
+        self.coordinator = plugin("coordination").LocalCoordination()
+        self.challenge_cache = plugin("challenge_cache").ChallengeCache()
+        self.nodes = {"default": FakeNode()}
+        self.memory = memory
+        self.models = plugin("models")
+
+    def find_node(self, challenge_id, reserved: dict = None) -> tuple:
+        running = self.models.ContainerInfoModel.query.filter(self.models.ContainerInfoModel.port.isnot(None)).count()
+        committed = running * NEED[0] + (reserved or {}).get("default", (0, 0))[0]
+        if committed + NEED[0] > self.memory:
+            return None, NEED
+        return "default", NEED
+
+
+@pytest.fixture
+def admission(plugin):
+    return plugin("admission")
+
+
+@pytest.fixture
+def controller(plugin, app, admission):
+    def build(memory: int = 1024):
+        controller = admission.AdmissionController(FakeManager(plugin, app, memory))
+        controller.dispatch_async = lambda: None  # the tests dispatch synchronously
+        return controller
+
+    return build
+
+
+class Spawns:
+    # records the start and moved callbacks of submitted tickets
+    def __init__(self, controller):
+        self.controller = controller
+        self.started = {}  # ticket id -> error
+        self.positions = {}  # ticket id -> last position reported
+
+    def submit(self, challenge_id, owner=None):
+        def start(ticket, error):
+            self.started[ticket.id] = error
+
+        def moved(position):
+            self.positions[ticket.id] = position
+
+        ticket = self.controller.submit(challenge_id, start, moved, owner)
+        return ticket  # moved is only called once dispatching, after this is bound
+
+
+def test_admits_and_publishes_a_reservation(controller, make_challenge, admission):
+    controller = controller()
+    spawns = Spawns(controller)
+    ticket = spawns.submit(make_challenge())
+    controller.dispatch()
+
+    assert spawns.started == {ticket.id: None}
+    assert ticket.node == "default" and ticket.need == NEED
+    assert ticket in controller.admitted and not controller.waiting
+
+    reservations = controller.manager.coordinator.scan(admission.RESERVATION_PREFIX)
+    assert json.loads(reservations[admission.RESERVATION_PREFIX + ticket.id]) == [
+        "default", NEED[0], NEED[1], ticket.challenge_id
+    ]
+
+    controller.release(ticket)
+    assert controller.manager.coordinator.scan(admission.RESERVATION_PREFIX) == {}
+    assert not controller.admitted
+
+
+def test_waits_for_capacity_in_order(controller, make_challenge):
+    controller = controller(memory=NEED[0])
+    spawns = Spawns(controller)
+    challenge_id = make_challenge()
+    first = spawns.submit(challenge_id)
+    second = spawns.submit(challenge_id)
+    controller.dispatch()
+
+    assert spawns.started == {first.id: None}
+    assert list(controller.waiting) == [second]
+    assert spawns.positions == {second.id: 1}
+
+    # nothing frees up until the admitted spawn is released
+    controller.dispatch()
+    assert second.id not in spawns.started
+
+    controller.release(first)
+    controller.dispatch()
+    assert spawns.started[second.id] is None
+
+
+def test_counts_reservations_of_other_workers(controller, make_challenge, admission):
+    controller = controller(memory=NEED[0])
+    spawns = Spawns(controller)
+    challenge_id = make_challenge()
+    controller.manager.coordinator.claim(
+        admission.RESERVATION_PREFIX + "elsewhere", "other-worker",
+        json.dumps(["default", NEED[0], NEED[1], str(challenge_id)]), ttl=admission.RESERVATION_TTL,
+    )
+
+    ticket = spawns.submit(challenge_id)
+    controller.dispatch()
+    assert ticket.id not in spawns.started
+
+    controller.manager.coordinator.release(admission.RESERVATION_PREFIX + "elsewhere", "other-worker")
+    controller.dispatch()
+    assert spawns.started[ticket.id] is None
+
+
+def test_instance_cap_only_holds_back_its_challenge(controller, make_challenge, make_user, make_container):
+    controller = controller()
+    spawns = Spawns(controller)
+    capped = make_challenge(name="capped", max_instances=1)
+    other = make_challenge(name="other")
+    make_container("running", capped, make_user("player"))
+
+    blocked = spawns.submit(capped)
+    admitted = spawns.submit(other)
+    controller.dispatch()
+
+    assert spawns.started == {admitted.id: None}
+    assert list(controller.waiting) == [blocked]
+
+
+def test_gives_up_after_the_timeout(controller, make_challenge, admission):
+    controller = controller(memory=0)
+    spawns = Spawns(controller)
+    ticket = spawns.submit(make_challenge())
+    ticket.created -= admission.ADMISSION_TIMEOUT + 1
+    controller.dispatch()
+
+    assert spawns.started[ticket.id]
+    assert not controller.waiting and not controller.admitted
+
+
+def test_unknown_challenge_is_left_to_the_spawn(controller):
+    controller = controller(memory=0)
+    spawns = Spawns(controller)
+    ticket = spawns.submit(12345)
+    controller.dispatch()
+
+    # the spawn reports the missing challenge itself
+    assert spawns.started == {ticket.id: None}
+
+
+def test_owner_with_an_instance_skips_the_cap(controller, make_challenge, make_user, make_container):
+    controller = controller(memory=0)
+    spawns = Spawns(controller)
+    challenge_id = make_challenge(max_instances=1)
+    player = make_user("player")
+    make_container("running", challenge_id, player)
+
+    # gets the existing instance back, needing neither capacity nor a slot
+    ticket = spawns.submit(challenge_id, owner={"user_id": player})
+    controller.dispatch()
+
+    assert spawns.started == {ticket.id: None}
+    assert not controller.waiting
+
+
+def test_owner_without_an_instance_waits_for_the_cap(controller, make_challenge, make_user, make_container):
+    controller = controller()
+    spawns = Spawns(controller)
+    challenge_id = make_challenge(max_instances=1)
+    make_container("running", challenge_id, make_user("player"))
+
+    ticket = spawns.submit(challenge_id, owner={"user_id": make_user("newcomer")})
+    controller.dispatch()
+
+    assert ticket.id not in spawns.started
+    assert list(controller.waiting) == [ticket]
@@ -0,0 +1,134 @@
+import pytest
+
+
+@pytest.fixture
+def changes(plugin, app):
+    return plugin("changes")
+
+
+@pytest.fixture
+def write(plugin, changes, make_container):
+    # record a container write the way the plugin does, under a new version
+    from CTFd.models import db
+
+    models = plugin("models")
+
+    def write(container_id, challenge_id, user_id, **fields):
+        version = changes.next_version()
+        row = models.ContainerInfoModel.query.filter_by(container_id=container_id).first()
+        if row is None:
+            return make_container(container_id, challenge_id, user_id, version=version, **fields)
+        for key, value in fields.items():
+            setattr(row, key, value)
+        row.version = version
+        db.session.commit()
+        return row
+
+    return write
+
+
+@pytest.fixture
+def owners(make_challenge, make_user):
+    return make_challenge(), [make_user(f"player{i}") for i in range(4)]
+
+
+def ids(page) -> list:
+    return sorted(row.container_id for row in page["containers"])
+
+
+def test_next_version_seeds_and_increments(changes):
+    from CTFd.models import db
+
+    assert changes.next_version() == 1
+    assert changes.next_version() == 2
+    db.session.commit()
+    assert changes.next_version() == 3
+
+
+def test_snapshot_skips_reservations(changes, write, owners):
+    challenge_id, users = owners
+    write("a", challenge_id, users[0])
+    write("b", challenge_id, users[1])
+    write("reserved", challenge_id, users[2], port=None)
+
+    page = changes.container_changes(0, {})
+    assert page["reset"] is True
+    assert page["has_more"] is False
+    assert ids(page) == ["a", "b"]
+    assert page["removed"] == []
+
+
+def test_cursor_returns_updates_and_removals(changes, write, owners):
+    from CTFd.models import db
+
+    challenge_id, users = owners
+    write("a", challenge_id, users[0])
+    write("b", challenge_id, users[1])
+    cursor = changes.container_changes(0, {})["version"]
+
+    assert changes.container_changes(cursor, {})["containers"] == []
+
+    write("a", challenge_id, users[0], expires=100)
+    changes.remove_containers(changes.ContainerInfoModel.container_id == "b")
+    db.session.commit()
+
+    page = changes.container_changes(cursor, {})
+    assert page["reset"] is False
+    assert ids(page) == ["a"]
+    assert page["removed"] == ["b"]
+    assert page["version"] > cursor
+    assert changes.container_changes(page["version"], {})["removed"] == []
+
+
+def test_cursor_honours_filters(changes, write, owners):
+    challenge_id, users = owners
+    write("a", challenge_id, users[0])
+    write("b", challenge_id, users[1], node="other")
+
+    assert ids(changes.container_changes(0, {"user_id": users[0]})) == ["a"]
+    assert ids(changes.container_changes(0, {"node": "other"})) == ["b"]
+    assert ids(changes.container_changes(0, {"node": "default"})) == ["a"]
+
+
+def test_pages_never_split_a_version(changes, write, owners, make_container):
+    from CTFd.models import db
+
+    challenge_id, users = owners
+    write("a", challenge_id, users[0])
+    # one write touching two rows under a single version, a page of one returns both
+    version = changes.next_version()
+    make_container("b", challenge_id, users[1], version=version)
+    make_container("c", challenge_id, users[2], version=version)
+    write("d", challenge_id, users[3])
+    db.session.commit()
+
+    seen = []
+    cursor = 0
+    while True:
+        page = changes.container_changes(cursor, {}, limit=1)
+        seen.append(ids(page))
+        cursor = page["version"]
+        if not page["has_more"]:
+            break
+
+    assert seen == [["a"], ["b", "c"], ["d"]]
+
+
+def test_pruned_cursor_resets(app, changes, write, owners):
+    from CTFd.models import db
+
+    challenge_id, users = owners
+    write("a", challenge_id, users[0])
+    write("b", challenge_id, users[1])
+    cursor = changes.container_changes(0, {})["version"]
+
+    changes.remove_containers(changes.ContainerInfoModel.container_id == "b")
+    # age the tombstone past its ttl
+    changes.ContainerTombstoneModel.query.update({"removed": 0})
+    db.session.commit()
+    changes.prune_tombstones(app)
+
+    page = changes.container_changes(cursor, {})
+    assert page["reset"] is True
+    assert ids(page) == ["a"]
+    assert page["removed"] == []
@@ -0,0 +1,82 @@
+import pytest
+from fake_docker import FakeDaemon, FakeDockerClient
+
+IMAGE = "ctf/web:latest"
+
+
+@pytest.fixture
+def allocator(plugin):
+    return plugin("port_allocator").PortAllocator(20000, 20009)
+
+
+def test_lease_hands_out_every_port_once(allocator):
+    ports = [allocator.lease() for _ in range(10)]
+    assert sorted(ports) == list(range(20000, 20010))
+    assert allocator.lease() is None
+    assert allocator.stats()["free"] == 0
+
+
+def test_release_returns_the_port(allocator):
+    ports = [allocator.lease() for _ in range(10)]
+    allocator.release(ports[3])
+    assert allocator.lease() == ports[3]
+    assert allocator.lease() is None
+
+
+def test_release_container_frees_its_bound_port(allocator):
+    port = allocator.lease()
+    allocator.bind("abc", port)
+    assert allocator.port_of("abc") == port
+    assert port not in allocator.pending
+
+    allocator.release_container("abc")
+    assert allocator.port_of("abc") is None
+    assert allocator.stats()["leased"] == 0
+    allocator.release_container("abc")  # releasing twice is harmless
+    assert allocator.stats()["leased"] == 0
+
+
+def test_invalid_range(plugin):
+    with pytest.raises(ValueError):
+        plugin("port_allocator").PortAllocator(20010, 20000)
+
+
+def test_reconcile_against_published_ports(plugin, app, make_challenge, make_container):
+    # ports recorded in the database and ports published by foreign containers are
+    # never leased after a reconciliation, leases not bound yet survive it
+    nodes = plugin("nodes")
+    daemon = FakeDaemon(images=[IMAGE], seed=1)
+    client = FakeDockerClient(daemon)
+    client.containers.run(IMAGE, ports={"80/tcp": 20001}, detach=True)
+    client.containers.run(IMAGE, ports={"80/tcp": 20002}, detach=True)
+
+    challenge_id = make_challenge()
+    make_container("owned", challenge_id, port=20003)
+
+    node = nodes.DockerNode(nodes.DEFAULT_NODE, "unix://fake/docker.sock", "127.0.0.1", app)
+    node.client = client
+    node.port_allocator.configure(20000, 20009)
+    pending = node.port_allocator.lease()
+    node.reconcile_ports()
+
+    allocator = node.port_allocator
+    assert allocator.port_of("owned") == 20003
+    leased = set()
+    while (port := allocator.lease()) is not None:
+        leased.add(port)
+    assert leased.isdisjoint({20001, 20002, 20003, pending})
+    assert len(leased) == 10 - len({20001, 20002, 20003, pending})
+
+
+def test_reconcile_keeps_leases_when_the_daemon_is_down(plugin, app):
+    nodes = plugin("nodes")
+    daemon = FakeDaemon(failure_rate=1.0, seed=1)
+
+    node = nodes.DockerNode(nodes.DEFAULT_NODE, "unix://fake/docker.sock", "127.0.0.1", app)
+    node.client = FakeDockerClient(daemon)
+    node.port_allocator.configure(20000, 20009)
+    port = node.port_allocator.lease()
+    node.port_allocator.bind("abc", port)
+    node.reconcile_ports()
+
+    assert node.port_allocator.port_of("abc") == port
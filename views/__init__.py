@@ -14,4 +14,5 @@ containers_bp = Blueprint(
 
 from . import routes_user
 from . import routes_admin
+from . import routes_metrics
 from . import helpers
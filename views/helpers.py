@@ -1,35 +1,110 @@
 import time
 import json
+import uuid
 import datetime
 from flask import current_app
+from sqlalchemy.exc import IntegrityError
 from CTFd.models import db
 
 from . import containers_bp
-from ..models import ContainerInfoModel, ContainerChallengeModel
+from ..models import ContainerInfoModel
 from ..container_manager import ContainerException
 from ..utils import settings
+from ..metrics import timed
+from ..activity import idle_reclaim_at, IDLE_WARNING_WINDOW
+from ..readiness import ready_check_of, READY_FAILED
+from ..push import owner_of
+from ..changes import next_version, remove_containers
+
+# container_info rows are reserved with a placeholder id before the container is
+# started, so the unique constraints on (challenge, owner) settle concurrent requests
+PENDING_PREFIX = "pending-"
+
+# placeholders older than this are left over from a crashed spawn and may be replaced
+PENDING_TIMEOUT = 300  # seconds
+
+# function to check whether a container_info row is a reservation for a spawn in progress
+def is_pending(container):
+    return container.container_id.startswith(PENDING_PREFIX)
+
+# function to check whether a reservation was abandoned by its spawn
+def is_stale(container):
+    return is_pending(container) and container.timestamp < time.time() - PENDING_TIMEOUT
+
+# function to get the readiness of an assigned container as reported to clients
+def container_status(container):
+    if container.ready_at is None:
+        return "starting"
+    if container.ready_at == READY_FAILED:
+        return "failed"
+    return "running"
+
+# function to get the state of an owner's containers pushed to their event stream,
+# keyed by challenge. reservations are left out, the spawn job reports on those.
+def owner_container_states(xid, is_team):
+    container_manager = current_app.container_manager
+    filter_args = {'team_id' if is_team else 'user_id': xid}
+    idle_timeout = container_manager.get_idle_timeout()
+
+    states = {}
+    for container in ContainerInfoModel.query.filter_by(**filter_args).all():
+        challenge = container_manager.challenge_cache.get(container.challenge_id)
+        if challenge is None or is_pending(container):
+            continue
+
+        state = {
+            "challenge_id": container.challenge_id,
+            "status": container_status(container),
+            "created": container.timestamp,
+            "expires": container.expires,
+        }
+        if state["status"] == "running":
+            state.update({
+                "hostname": container_manager.get_hostname(container.node),
+                "port": container.port,
+                "ssh_username": challenge.ssh_username,
+                "ssh_password": challenge.ssh_password,
+                "connect": challenge.ctype,
+            })
+
+            # shows up on the next resync once the container is close to being reclaimed
+            reclaim_at = idle_reclaim_at(container, idle_timeout)
+            if reclaim_at is not None and reclaim_at - time.time() <= IDLE_WARNING_WINDOW:
+                state["warning"] = "your instance looks idle and will be stopped soon, use or renew it to keep it"
+        states[str(container.challenge_id)] = state
+    return states
+
+# function to drop the reservation of a spawn that failed
+def release_reservation(reservation_id):
+    remove_containers(ContainerInfoModel.container_id == reservation_id)
+    db.session.commit()
 
 # function to kill a container by its id
+@timed("helpers.kill_container")
 def kill_container(container_id):
     container_manager = current_app.container_manager
     container = ContainerInfoModel.query.filter_by(container_id=container_id).first()
 
     try:
-        container_manager.kill_container(container_id)
+        container_manager.kill_container(container_id, node=container.node if container else None)
     except ContainerException:
         return {"error": "docker is not initialized. please check your settings."}
 
     if container:
-        db.session.delete(container)
+        owner = owner_of(container.team_id, container.user_id)
+        remove_containers(ContainerInfoModel.container_id == container_id)
         db.session.commit()
+        container_manager.admission.dispatch_async()
+        container_manager.notifier.notify(owner)
         return {"success": "container killed"}
     else:
         return {"error": "container not found"}
 
 # function to renew an existing container's expiration time
+@timed("helpers.renew_container")
 def renew_container(chal_id, xid, is_team):
     container_manager = current_app.container_manager
-    challenge = ContainerChallengeModel.query.filter_by(id=chal_id).first()
+    challenge = container_manager.challenge_cache.get(chal_id)
 
     # check if the challenge exists
     if challenge is None:
@@ -41,36 +116,71 @@ def renew_container(chal_id, xid, is_team):
     running_container = ContainerInfoModel.query.filter_by(**filter_args).first()
 
     # check if there is a running container
-    if running_container is None:
+    if running_container is None or is_pending(running_container):
         return {"error": "container not found, try resetting the container."}
 
     try:
-        # update the container's expiration time
+        # update the container's expiration time, renewing also counts as activity
         running_container.expires = int(time.time() + container_manager.expiration_seconds)
+        running_container.last_active = int(time.time())
+        running_container.version = next_version()
         db.session.commit()
     except Exception:
         return {"error": "database error occurred, please try again."}
 
+    container_manager.notifier.notify(owner_of(running_container.team_id, running_container.user_id))
+
     # return the updated container details
     return {
         "success": "container renewed",
         "expires": running_container.expires,
-        "hostname": container_manager.settings.get("docker_hostname", ""),
+        "hostname": container_manager.get_hostname(running_container.node),
         "ssh_username": challenge.ssh_username,
         "ssh_password": challenge.ssh_password,
         "port": running_container.port,
         "connect": challenge.ctype,
     }
 
+# function to claim a container from a challenge's warm pool and assign it to its owner
+@timed("helpers.acquire_pooled_container")
+def acquire_pooled_container(challenge, xid, uid):
+    container_manager = current_app.container_manager
+
+    try:
+        pooled = container_manager.warm_pool.acquire(challenge.id)
+    except ContainerException:
+        return None, None, None
+
+    if pooled is None:
+        return None, None, None
+
+    container_id, port, node = pooled
+    try:
+        container_manager.assign_container(container_id, challenge.id, xid, uid, node=node)
+    except ContainerException:
+        # the claimed container is unusable, don't leave it running unowned
+        try:
+            container_manager.kill_container(container_id, node=node)
+        except ContainerException:
+            pass
+        return None, None, None
+
+    return container_id, port, node
+
 # function to create a new container for a challenge
-def create_container(chal_id, xid, uid, is_team):
+@timed("helpers.create_container")
+def create_container(chal_id, xid, uid, is_team, node=None):
+    started = time.perf_counter()
     container_manager = current_app.container_manager
-    challenge = ContainerChallengeModel.query.filter_by(id=chal_id).first()
+    challenge = container_manager.challenge_cache.get(chal_id)
 
     # check if the challenge exists
     if challenge is None:
         return {"error": "challenge not found"}, 400
 
+    if challenge.profile_error:
+        return {"error": f"challenge is misconfigured: {challenge.profile_error}"}, 500
+
     # get the maximum number of allowed containers
     max_containers_allowed = int(settings["vars"]["MAX_CONTAINERS_ALLOWED"])
     if not is_team:
@@ -88,13 +198,22 @@ def create_container(chal_id, xid, uid, is_team):
     filter_args['team_id' if is_team else 'user_id'] = xid
     running_container = ContainerInfoModel.query.filter_by(**filter_args).first()
 
-    if running_container:
+    if running_container and is_pending(running_container):
+        if not is_stale(running_container):
+            return {"error": "your container is already being created, please wait"}
+
+        # the spawn that reserved this row never finished
+        remove_containers(ContainerInfoModel.container_id == running_container.container_id)
+        db.session.commit()
+    elif running_container:
         try:
-            if container_manager.is_container_running(running_container.container_id):
+            if container_manager.is_container_running(
+                running_container.container_id, node=running_container.node
+            ):
                 # return existing container details
                 return json.dumps({
                     "status": "already_running",
-                    "hostname": container_manager.settings.get("docker_hostname", ""),
+                    "hostname": container_manager.get_hostname(running_container.node),
                     "port": running_container.port,
                     "ssh_username": challenge.ssh_username,
                     "ssh_password": challenge.ssh_password,
@@ -103,50 +222,129 @@ def create_container(chal_id, xid, uid, is_team):
                 })
             else:
                 # remove the container from the database if it's not running
-                db.session.delete(running_container)
+                container_manager.release_port(running_container.container_id, running_container.node)
+                remove_containers(ContainerInfoModel.container_id == running_container.container_id)
                 db.session.commit()
         except ContainerException as err:
             return {"error": str(err)}, 500
 
-    # try to create a new container
+    # a challenge at its instance cap is turned away before anything is reserved
+    if challenge.max_instances:
+        instances = ContainerInfoModel.query.filter_by(challenge_id=challenge.id).count()
+        if instances >= challenge.max_instances:
+            return {"error": "this challenge has reached its instance limit, please try again later"}
+
+    # reserve the row first, a concurrent request for the same owner and challenge
+    # fails here on the unique constraint instead of starting a second container
+    reservation_id = f"{PENDING_PREFIX}{uuid.uuid4().hex}"
+    now = int(time.time())
+    db.session.add(ContainerInfoModel(
+        container_id=reservation_id,
+        challenge_id=challenge.id,
+        team_id=xid if is_team else None,
+        user_id=uid,
+        timestamp=now,
+        expires=now + PENDING_TIMEOUT,
+    ))
     try:
-        created_container = container_manager.create_container(
-            chal_id,
-            xid,
-            uid,
-            challenge.image,
-            challenge.port,
-            challenge.command,
-            challenge.volumes,
-        )
-    except ContainerException as err:
-        return {"error": str(err)}
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return {"error": "your container is already being created, please wait"}
+
+    # the reservation counts towards the challenge's instance cap, so concurrent
+    # requests that all passed the check above can't slip under it together
+    if challenge.max_instances:
+        instances = ContainerInfoModel.query.filter_by(challenge_id=challenge.id).count()
+        if instances > challenge.max_instances:
+            release_reservation(reservation_id)
+            return {"error": "this challenge has reached its instance limit, please try again later"}
+
+    # hand out a pre-started container if the challenge keeps a warm pool
+    container_id, port, admitted_node = None, None, node
+    if challenge.warm_pool_size:
+        container_id, port, node = acquire_pooled_container(challenge, xid, uid)
+
+    if container_id is None:
+        # try to create a new container on the node admission control reserved
+        # capacity on, or the one picked by the scheduler
+        try:
+            node = admitted_node or container_manager.choose_node(challenge.id)
+            created_container = container_manager.create_container(
+                chal_id,
+                xid,
+                uid,
+                challenge.image,
+                challenge.port,
+                challenge.command,
+                challenge.run_kwargs,
+                node=node,
+                fast_start=bool(challenge.fast_start),
+            )
+        except ContainerException as err:
+            release_reservation(reservation_id)
+            return {"error": str(err)}
 
-    # get the port assigned to the new container
-    port = container_manager.get_container_port(created_container.id)
+        # get the port assigned to the new container
+        container_id = created_container.id
+        port = container_manager.get_container_port(container_id, node=node)
 
     if port is None:
+        release_reservation(reservation_id)
+        container_manager.readiness.forget(container_id)
+        # the container runs without a row now, don't leave it behind
+        try:
+            container_manager.kill_container(container_id, node=node)
+        except ContainerException:
+            pass
         return json.dumps({"status": "error", "error": "could not get port"})
 
     expires = int(time.time() + container_manager.expiration_seconds)
+    checked = ready_check_of(challenge) != "none"
 
-    # add the new container to the database
-    new_container = ContainerInfoModel(
-        container_id=created_container.id,
-        challenge_id=challenge.id,
-        team_id=xid if is_team else None,
-        user_id=uid,
-        port=port,
-        timestamp=int(time.time()),
-        expires=expires,
-    )
-    db.session.add(new_container)
+    # swap the reservation for the new container, the row is gone if the container
+    # was stopped (or reaped) while it was being created
+    updated = ContainerInfoModel.query.filter_by(container_id=reservation_id).update({
+        "container_id": container_id,
+        "node": node,
+        "port": port,
+        "timestamp": int(time.time()),
+        "last_active": int(time.time()),
+        "ready_at": None if checked else int(time.time()),
+        "expires": expires,
+        "version": next_version(),
+    }, synchronize_session=False)
     db.session.commit()
 
+    if not updated:
+        container_manager.readiness.forget(container_id)
+        try:
+            container_manager.kill_container(container_id, node=node)
+        except ContainerException:
+            pass
+        return {"error": "container was stopped while it was being created"}
+
+    container_manager.notifier.notify(owner_of(xid if is_team else None, uid))
+
+    # the container is handed out once it passes the challenge's readiness check,
+    # until then view_info reports it as starting
+    if not checked:
+        container_manager.readiness.handed_out(container_id, started)
+    else:
+        container_manager.readiness.watch(
+            container_id,
+            challenge,
+            container_manager.get_node(node),
+            container_manager.get_hostname(node),
+            port,
+            started,
+            owner_of(xid if is_team else None, uid),
+        )
+
     # return new container details
     return json.dumps({
-        "status": "created",
-        "hostname": container_manager.settings.get("docker_hostname", ""),
+        "status": "starting" if checked else "created",
+        "hostname": container_manager.get_hostname(node),
         "port": port,
         "ssh_username": challenge.ssh_username,
         "ssh_password": challenge.ssh_password,
@@ -154,10 +352,21 @@ def create_container(chal_id, xid, uid, is_team):
         "expires": expires,
     })
 
+# function run by the spawn workers, normalises create_container's response to a dict
+@timed("helpers.spawn_container")
+def spawn_container(chal_id, xid, uid, is_team, node=None):
+    result = create_container(chal_id, xid, uid, is_team, node=node)
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result
+
 # function to view information about a container
+@timed("helpers.view_container_info")
 def view_container_info(chal_id, xid, is_team):
     container_manager = current_app.container_manager
-    challenge = ContainerChallengeModel.query.filter_by(id=chal_id).first()
+    challenge = container_manager.challenge_cache.get(chal_id)
 
     # check if the challenge exists
     if challenge is None:
@@ -168,31 +377,54 @@ def view_container_info(chal_id, xid, is_team):
     filter_args['team_id' if is_team else 'user_id'] = xid
     running_container = ContainerInfoModel.query.filter_by(**filter_args).first()
 
-    if running_container:
+    if running_container and is_pending(running_container):
+        # the container is still being created
+        return {"status": "instance not started"}
+    elif running_container and running_container.ready_at is None:
+        # the container runs but hasn't passed its readiness check yet
+        return {"status": "starting", "expires": running_container.expires}
+    elif running_container and running_container.ready_at == READY_FAILED:
+        return {
+            "status": "failed",
+            "message": "your instance did not become ready, please stop it and try again",
+        }
+    elif running_container:
         try:
-            if container_manager.is_container_running(running_container.container_id):
+            if container_manager.is_container_running(
+                running_container.container_id, node=running_container.node
+            ):
                 # return existing container details
-                return json.dumps({
+                info = {
                     "status": "already_running",
-                    "hostname": container_manager.settings.get("docker_hostname", ""),
+                    "hostname": container_manager.get_hostname(running_container.node),
                     "port": running_container.port,
                     "ssh_username": challenge.ssh_username,
                     "ssh_password": challenge.ssh_password,
                     "connect": challenge.ctype,
                     "expires": running_container.expires,
-                })
+                }
+
+                # warn the owner shortly before an unused container is reclaimed
+                reclaim_at = idle_reclaim_at(running_container, container_manager.get_idle_timeout())
+                if reclaim_at is not None and reclaim_at - time.time() <= IDLE_WARNING_WINDOW:
+                    info["idle_reclaim_at"] = reclaim_at
+                    info["warning"] = "your instance looks idle and will be stopped soon, use or renew it to keep it"
+                return json.dumps(info)
             else:
                 # remove the container from the database if it's not running
-                db.session.delete(running_container)
+                container_manager.release_port(running_container.container_id, running_container.node)
+                remove_containers(ContainerInfoModel.container_id == running_container.container_id)
                 db.session.commit()
+                container_manager.notifier.notify(owner_of(xid if is_team else None, xid))
         except ContainerException as err:
             return {"error": str(err)}, 500
     else:
         return {"status": "instance not started"}
 
 # function to get the connection type of a challenge
+@timed("helpers.connect_type")
 def connect_type(chal_id):
-    challenge = ContainerChallengeModel.query.filter_by(id=chal_id).first()
+    challenge = current_app.container_manager.challenge_cache.get(chal_id)
 
     # check if the challenge exists
     if challenge is None:
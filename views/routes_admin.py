@@ -1,102 +1,168 @@
 from flask import (
-	request, render_template, flash, redirect, url_for, current_app, jsonify
+	request, render_template, flash, redirect, url_for, current_app, jsonify,
+	Response, stream_with_context,
 )
 from CTFd.utils.decorators import admins_only
-from CTFd.models import db
+from CTFd.models import db, Teams, Users
 
 from . import containers_bp
-from .helpers import kill_container
+from .helpers import kill_container, is_pending, container_status
 from ..utils import settings_to_dict, is_team_mode
-from ..models import ContainerInfoModel, ContainerSettingsModel
-from ..container_manager import ContainerException
+from ..models import ContainerInfoModel, ContainerSettingsModel, ContainerChallengeModel
+from ..challenges import ContainerChallenge
+from ..container_manager import ContainerException, IMAGES_PER_PAGE
+from ..nodes import DEFAULT_NODE
+from ..placement import STRATEGIES
+from ..changes import container_changes, ChangeFeed, CHANGE_FILTERS, CHANGES_PER_PAGE, MAX_CHANGES_PER_PAGE
+from ..coordination import COORDINATION_BACKENDS
 
-# route to display the containers dashboard
+# helper to fetch the docker status of many containers in one call
+def get_container_statuses(container_manager, containers):
+	try:
+		statuses = container_manager.get_containers_status(
+			[container.container_id for container in containers if not is_pending(container)]
+		)
+	except ContainerException:
+		return {}
+
+	return {container_id: info["status"] for container_id, info in statuses.items()}
+
+# helper to serialize container rows for the dashboard, their challenge, team and
+# user are loaded along with them and their docker status comes from one bulk lookup
+def serialize_containers(container_manager, containers, team_mode):
+	statuses = get_container_statuses(container_manager, containers)
+	return [
+		container_row(container, statuses.get(container.container_id) == "running", team_mode)
+		for container in containers
+	]
+
+# helper to serialize a container row for the dashboard
+def container_row(container, is_running, team_mode):
+	row = {
+		"container_id": container.container_id,
+		"image": container.challenge.image,
+		"challenge": f"{container.challenge.name} [{container.challenge_id}]",
+		"user": f"{container.user.name} [{container.user_id}]",
+		"node": container.node or DEFAULT_NODE,
+		"port": container.port,
+		"created": container.timestamp,
+		"expires": container.expires,
+		"is_running": is_running,
+		"status": "creating" if is_pending(container) else container_status(container),
+	}
+	if team_mode:
+		row["team"] = f"{container.team.name} [{container.team_id}]"
+	return row
+
+# helper to list the owners and challenges that have containers, for the filters
+def get_filter_options(team_mode):
+	owner_model = Teams if team_mode else Users
+	owner_column = ContainerInfoModel.team_id if team_mode else ContainerInfoModel.user_id
+	owners = (
+		db.session.query(owner_model.id, owner_model.name)
+		.join(ContainerInfoModel, owner_column == owner_model.id)
+		.distinct()
+		.all()
+	)
+	challenges = (
+		db.session.query(ContainerChallengeModel.id, ContainerChallengeModel.name)
+		.join(ContainerInfoModel, ContainerInfoModel.challenge_id == ContainerChallengeModel.id)
+		.distinct()
+		.all()
+	)
+	return (
+		[f"{name} [{owner_id}]" for owner_id, name in owners],
+		[f"{name} [{challenge_id}]" for challenge_id, name in challenges],
+	)
+
+# route to display the containers dashboard, the rows arrive over the event stream
 @containers_bp.route("/dashboard", methods=["GET"])
 @admins_only
 def route_containers_dashboard():
 	container_manager = current_app.container_manager
-	running_containers = ContainerInfoModel.query.order_by(
-		ContainerInfoModel.timestamp.desc()
-	).all()
 
 	try:
 		connected = container_manager.is_connected()
 	except ContainerException:
 		connected = False
 
-	# update each container's running status
-	for container in running_containers:
-		try:
-			container.is_running = container_manager.is_container_running(
-				container.container_id
-			)
-		except ContainerException:
-			container.is_running = False
-
 	return render_template(
 		"container_dashboard.html",
-		containers=running_containers,
 		connected=connected,
+		health=container_manager.get_health(),
+		images=container_manager.images.snapshot(),
+		team_mode=bool(is_team_mode()),
 	)
 
-# api route to get running containers data
+# api route to get the running containers that changed since a version, filtered
+# and paginated on the server. without since (or with one too old to catch up from)
+# it returns every row with reset set. version is the cursor for the next call.
+# the dashboard follows the event stream instead, this serves scripts and other
+# external consumers that poll.
 @containers_bp.route("/api/running_containers", methods=["GET"])
 @admins_only
 def route_get_running_containers():
 	container_manager = current_app.container_manager
-	running_containers = ContainerInfoModel.query.order_by(
-		ContainerInfoModel.timestamp.desc()
-	).all()
+	team_mode = is_team_mode()
+
+	filters, error = parse_bulk_kill_filters(request.args)
+	if error:
+		return jsonify(error=error), 400
+	filters = {name: value for name, value in filters.items() if name in CHANGE_FILTERS}
+
+	try:
+		since = int(request.args.get("since") or 0)
+		per_page = int(request.args.get("per_page") or CHANGES_PER_PAGE)
+	except ValueError:
+		return jsonify(error="since and per_page must be integers"), 400
+	per_page = min(max(per_page, 1), MAX_CHANGES_PER_PAGE)
+
+	changes = container_changes(since, filters, per_page)
 
 	try:
 		connected = container_manager.is_connected()
 	except ContainerException:
 		connected = False
 
-	unique_teams = set()
-	unique_challenges = set()
-	team_mode = is_team_mode()
-
-	# collect unique teams and challenges
-	for container in running_containers:
-		try:
-			container.is_running = container_manager.is_container_running(
-				container.container_id
-			)
-		except ContainerException:
-			container.is_running = False
-
-		if team_mode:
-			unique_teams.add(f"{container.team.name} [{container.team_id}]")
-		else:
-			unique_teams.add(f"{container.user.name} [{container.user_id}]")
-		unique_challenges.add(f"{container.challenge.name} [{container.challenge_id}]")
-
-	running_containers_data = []
-	for container in running_containers:
-		container_data = {
-			"container_id": container.container_id,
-			"image": container.challenge.image,
-			"challenge": f"{container.challenge.name} [{container.challenge_id}]",
-			"user": f"{container.user.name} [{container.user_id}]",
-			"port": container.port,
-			"created": container.timestamp,
-			"expires": container.expires,
-			"is_running": container.is_running,
-		}
-		if team_mode:
-			container_data["team"] = f"{container.team.name} [{container.team_id}]"
-		running_containers_data.append(container_data)
-
 	response_data = {
-		"containers": running_containers_data,
+		"containers": serialize_containers(container_manager, changes["containers"], team_mode),
+		"removed": changes["removed"],
+		"version": changes["version"],
+		"reset": changes["reset"],
+		"has_more": changes["has_more"],
 		"connected": connected,
-		"teams": list(unique_teams),
-		"challenges": list(unique_challenges),
+		"health": container_manager.get_health(),
+		"team_mode": bool(team_mode),
 	}
 
+	# the filter options only change with the rows, clients that catch up keep theirs
+	if changes["reset"] and since <= 0:
+		response_data["teams"], response_data["challenges"] = get_filter_options(team_mode)
+
 	return jsonify(response_data)
 
+# api route streaming changes to the running containers as server-sent events, a
+# snapshot of every row first and then created/ready/renewed/expired/killed events.
+# every wake only reloads the rows written since the previous one.
+@containers_bp.route("/api/admin/events", methods=["GET"])
+@admins_only
+def route_admin_container_events():
+	container_manager = current_app.container_manager
+	team_mode = is_team_mode()
+
+	def serialize(containers):
+		return {
+			row["container_id"]: row
+			for row in serialize_containers(container_manager, containers, team_mode)
+		}
+
+	feed = ChangeFeed({}, serialize)
+	return Response(
+		stream_with_context(container_manager.notifier.stream(None, feed.load)),
+		mimetype="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
 # api route to kill a specific container
 @containers_bp.route("/api/kill", methods=["POST"])
 @admins_only
@@ -112,29 +178,117 @@ def route_kill_container():
 	status_code = 200 if 'success' in result else 400
 	return jsonify(result), status_code
 
-# api route to purge all containers
+# helper to validate the filters of a bulk kill, returns (filters, error)
+def parse_bulk_kill_filters(data):
+	filters = {}
+	for field in ("challenge_id", "team_id", "user_id", "older_than"):
+		value = data.get(field)
+		if value in (None, ""):
+			continue
+		try:
+			filters[field] = int(value)
+		except (ValueError, TypeError):
+			return None, f"{field} must be an integer"
+		if filters[field] < 0:
+			return None, f"{field} must not be negative"
+
+	if data.get("node"):
+		filters["node"] = str(data["node"])
+
+	return filters, None
+
+# api route to kill every container matching the given filters in the background
+@containers_bp.route("/api/bulk_kill", methods=["POST"])
+@admins_only
+def route_bulk_kill():
+	if not request.is_json:
+		return jsonify(error="invalid request"), 400
+
+	filters, error = parse_bulk_kill_filters(request.json)
+	if error:
+		return jsonify(error=error), 400
+
+	job = current_app.container_manager.bulk_killer.submit(filters)
+	return jsonify(job.to_dict()), 202
+
+# api route to get the progress of a bulk kill
+@containers_bp.route("/api/bulk_kill/<job_id>", methods=["GET"])
+@admins_only
+def route_bulk_kill_status(job_id):
+	job = current_app.container_manager.bulk_killer.get(job_id)
+	if job is None:
+		return jsonify(error="job not found"), 404
+
+	return jsonify(job.to_dict())
+
+# api route to purge all containers, a bulk kill without filters
 @containers_bp.route("/api/purge", methods=["POST"])
 @admins_only
 def route_purge_containers():
-	containers = ContainerInfoModel.query.all()
-	for container in containers:
-		try:
-			kill_container(container.container_id)
-		except ContainerException:
-			pass
-	return jsonify(success="purged all containers"), 200
+	job = current_app.container_manager.bulk_killer.submit({})
+	return jsonify(job.to_dict()), 202
+
+# api route to get warm pool readiness and hit rates
+@containers_bp.route("/api/pool", methods=["GET"])
+@admins_only
+def route_get_pool_stats():
+	container_manager = current_app.container_manager
+	return jsonify(pools=container_manager.warm_pool.stats())
+
+# api route to get the pull status and digest of every challenge image per node
+@containers_bp.route("/api/images/status", methods=["GET"])
+@admins_only
+def route_get_image_status():
+	container_manager = current_app.container_manager
+	return jsonify(images=container_manager.images.snapshot())
+
+# api route to get the fast start checkpoints held per node and challenge
+@containers_bp.route("/api/checkpoints", methods=["GET"])
+@admins_only
+def route_get_checkpoints():
+	container_manager = current_app.container_manager
+	return jsonify(container_manager.checkpoints.snapshot())
+
+# api route to check every challenge image against its registry right away
+@containers_bp.route("/api/images/pull", methods=["POST"])
+@admins_only
+def route_pull_images():
+	container_manager = current_app.container_manager
+	container_manager.images.pull_all()
+	return jsonify(success="image pulls queued"), 200
+
+# api route to rebuild the solve counters and values of all container challenges
+@containers_bp.route("/api/recalculate", methods=["POST"])
+@admins_only
+def route_recalculate_values():
+	challenges = ContainerChallenge.recalculate_all()
+	return jsonify(
+		success="recalculated challenge values",
+		values={challenge.id: challenge.value for challenge in challenges},
+	), 200
+
+# api route to get challenge metadata cache hit rates
+@containers_bp.route("/api/cache", methods=["GET"])
+@admins_only
+def route_get_cache_stats():
+	container_manager = current_app.container_manager
+	return jsonify(challenges=container_manager.challenge_cache.stats())
 
 # api route to get available docker images
 @containers_bp.route("/api/images", methods=["GET"])
 @admins_only
 def route_get_images():
 	container_manager = current_app.container_manager
+	query = request.args.get("q", "").strip()
+	page = request.args.get("page", 1, type=int)
+	per_page = request.args.get("per_page", IMAGES_PER_PAGE, type=int)
+
 	try:
-		images = container_manager.get_images()
+		images = container_manager.get_images(query, page, per_page)
 	except ContainerException as err:
 		return jsonify(error=str(err)), 500
 
-	return jsonify(images=images)
+	return jsonify(images)
 
 # api route to update container settings
 @containers_bp.route("/api/settings/update", methods=["POST"])
@@ -150,31 +304,50 @@ def route_update_settings():
 		"container_maxcpu",
 	]
 
+	optional_fields = [
+		"container_port_min",
+		"container_port_max",
+		"docker_nodes",
+		"docker_scheduler",
+		"docker_pool_size",
+		"image_pull_concurrency",
+		"capacity_overcommit",
+		"idle_timeout",
+		"checkpoint_dir",
+		"metrics_token",
+		"coordination_backend",
+		"coordination_dir",
+	]
+
 	for field in required_fields:
 		if not request.form.get(field):
 			flash(f"missing required field: {field}", "error")
 			return redirect(url_for(".route_containers_settings"))
 
 	# update or create settings in the database
-	for field in required_fields:
+	for field in required_fields + optional_fields:
 		setting = ContainerSettingsModel.query.filter_by(key=field).first()
 		if not setting:
-			setting = ContainerSettingsModel(key=field, value=request.form.get(field))
+			setting = ContainerSettingsModel(key=field, value=request.form.get(field, ""))
 			db.session.add(setting)
 		else:
-			setting.value = request.form.get(field)
+			setting.value = request.form.get(field, "")
 
 	db.session.commit()
 
 	# re-initialize container manager with new settings
 	container_manager.settings = settings_to_dict(ContainerSettingsModel.query.all())
 
-	if container_manager.settings.get("docker_base_url"):
-		try:
+	try:
+		container_manager.configure_coordination()
+		if container_manager.settings.get("docker_base_url"):
 			container_manager.initialize_connection()
-		except ContainerException as err:
-			flash(str(err), "error")
-			return redirect(url_for(".route_containers_settings"))
+	except ContainerException as err:
+		flash(str(err), "error")
+		return redirect(url_for(".route_containers_settings"))
+	finally:
+		# the other workers reload the saved settings on their next coordination run
+		container_manager.publish_settings()
 
 	return redirect(url_for(".route_containers_dashboard"))
 
@@ -185,5 +358,8 @@ def route_containers_settings():
 	container_manager = current_app.container_manager
     
 	return render_template(
-		"container_settings.html", settings=container_manager.settings
+		"container_settings.html",
+		settings=container_manager.settings,
+		strategies=STRATEGIES,
+		coordination_backends=COORDINATION_BACKENDS,
 	)
@@ -0,0 +1,103 @@
+import hmac
+
+from flask import request, current_app, Response
+from CTFd.models import db
+from CTFd.utils.user import is_admin
+
+from . import containers_bp
+from ..models import ContainerInfoModel, ContainerPoolModel
+from ..nodes import DEFAULT_NODE
+from ..health import HEALTHY, DEGRADED, DOWN
+from ..metrics import Gauge, render
+
+# helper to count rows per (challenge, node), reservations without a port are skipped
+def count_by_challenge_and_node(model):
+	rows = (
+		db.session.query(model.challenge_id, model.node, db.func.count())
+		.filter(model.port.isnot(None))
+		.group_by(model.challenge_id, model.node)
+		.all()
+	)
+	counts = {}
+	for challenge_id, node, count in rows:
+		key = (("challenge", challenge_id), ("node", node or DEFAULT_NODE))
+		counts[key] = counts.get(key, 0) + count
+	return counts
+
+# helper to build the gauges read at scrape time
+def scrape_gauges(container_manager):
+	nodes = list(container_manager.nodes.values())
+	port_stats = {node.name: node.port_allocator.stats() for node in nodes}
+
+	return [
+		Gauge(
+			"ctfd_containers_live",
+			"Containers assigned to users, by challenge and node.",
+			lambda: count_by_challenge_and_node(ContainerInfoModel),
+		),
+		Gauge(
+			"ctfd_containers_pool_ready",
+			"Pre-started warm pool containers, by challenge and node.",
+			lambda: count_by_challenge_and_node(ContainerPoolModel),
+		),
+		Gauge(
+			"ctfd_containers_ports_leased",
+			"Host ports leased from the node's port range.",
+			lambda: {(("node", name),): stats["leased"] for name, stats in port_stats.items()},
+		),
+		Gauge(
+			"ctfd_containers_ports_utilisation",
+			"Share of the node's host port range that is leased.",
+			lambda: {
+				(("node", name),): stats["leased"] / stats["size"] if stats["size"] else 0
+				for name, stats in port_stats.items()
+			},
+		),
+		Gauge(
+			"ctfd_containers_node_health",
+			"Cached health state of each docker node, 1 for the current state.",
+			lambda: {
+				(("node", node.name), ("state", state)): int(node.health.state == state)
+				for node in nodes
+				for state in (HEALTHY, DEGRADED, DOWN)
+			},
+		),
+		Gauge(
+			"ctfd_containers_spawn_jobs_pending",
+			"Spawn jobs queued or running.",
+			lambda: {(): len(container_manager.spawn_queue.pending)},
+		),
+		Gauge(
+			"ctfd_containers_admission_waiting",
+			"Spawn requests waiting for capacity in this worker's admission queue.",
+			lambda: {(): container_manager.admission.snapshot()["waiting"]},
+		),
+		Gauge(
+			"ctfd_containers_admission_oldest_wait_seconds",
+			"How long the oldest waiting spawn request has been queued.",
+			lambda: {(): container_manager.admission.snapshot()["oldest_wait"]},
+		),
+	]
+
+# helper to check the scrape credentials, an admin session or the metrics token
+def metrics_authorized(container_manager):
+	if is_admin():
+		return True
+
+	token = container_manager.settings.get("metrics_token")
+	header = request.headers.get("Authorization", "")
+	if not token or not header.startswith("Bearer "):
+		return False
+	return hmac.compare_digest(header[len("Bearer "):].encode(), token.encode())
+
+# route exposing prometheus metrics for the container lifecycle
+@containers_bp.route("/metrics", methods=["GET"])
+def route_metrics():
+	container_manager = current_app.container_manager
+	if not metrics_authorized(container_manager):
+		return Response("unauthorized\n", status=401, mimetype="text/plain")
+
+	return Response(
+		render(scrape_gauges(container_manager)),
+		mimetype="text/plain; version=0.0.4",
+	)
@@ -1,4 +1,7 @@
-from flask import request, current_app
+import json
+import time
+
+from flask import request, current_app, Response, stream_with_context
 from CTFd.utils.decorators import (
 	authed_only,
 	during_ctf_time_only,
@@ -11,13 +14,18 @@ from . import containers_bp
 from .helpers import (
 	connect_type,
 	view_container_info,
-	create_container,
+	spawn_container,
 	renew_container,
 	kill_container,
+	owner_container_states,
 )
 from ..utils import is_team_mode, settings
 from ..container_manager import ContainerException
 from ..models import ContainerInfoModel
+from ..push import owner_of
+
+# how long a single server-sent events connection for a spawn job stays open
+JOB_STREAM_TIMEOUT = 60  # seconds
 
 # helper function to validate request data and user
 def validate_request(required_fields):
@@ -91,13 +99,107 @@ def route_request_container():
 		return error_response, status_code
 
 	chal_id = request.json.get("chal_id")
-	try:
-		if is_team_mode():
-			return create_container(chal_id, user.team.id, user.id, True)
-		else:
-			return create_container(chal_id, user.id, user.id, False)
-	except ContainerException as err:
-		return {"error": str(err)}, 500
+	is_team = is_team_mode()
+	xid = user.team.id if is_team else user.id
+
+	# spawning happens on the worker pool once admission control finds capacity,
+	# identical requests share one job
+	spawn_queue = current_app.container_manager.spawn_queue
+	job = spawn_queue.submit(
+		(str(chal_id), xid, is_team),
+		xid,
+		spawn_container,
+		chal_id, xid, user.id, is_team,
+		challenge_id=chal_id,
+		owner_filter={"team_id" if is_team else "user_id": xid},
+	)
+
+	return job.to_dict(), 202
+
+# helper function to look up a spawn job owned by the current user or team
+def get_owned_job(job_id):
+	user = get_current_user()
+	if not user or (is_team_mode() and not user.team):
+		return None
+
+	xid = user.team.id if is_team_mode() else user.id
+	return current_app.container_manager.spawn_queue.get(job_id, owner=xid)
+
+@containers_bp.route("/api/request/<job_id>", methods=["GET"])
+@authed_only
+@during_ctf_time_only
+@require_verified_emails
+@ratelimit(
+	method="GET",
+	limit=settings["requests"]["limit"],
+	interval=settings["requests"]["interval"],
+)
+def route_request_status(job_id):
+	job = get_owned_job(job_id)
+	if job is None:
+		return {"error": "job not found"}, 404
+
+	return job.to_dict()
+
+@containers_bp.route("/api/request/<job_id>/events", methods=["GET"])
+@authed_only
+@during_ctf_time_only
+@require_verified_emails
+def route_request_events(job_id):
+	job = get_owned_job(job_id)
+	if job is None:
+		return {"error": "job not found"}, 404
+
+	spawn_queue = current_app.container_manager.spawn_queue
+
+	# stream every status change as a server-sent event until the job finishes
+	def generate():
+		deadline = time.time() + JOB_STREAM_TIMEOUT
+		last_update = 0
+		while True:
+			if job.updated > last_update:
+				last_update = job.updated
+				yield f"data: {json.dumps(job.to_dict())}\n\n"
+			if job.is_finished():
+				return
+			remaining = deadline - time.time()
+			if remaining <= 0:
+				return
+			spawn_queue.wait(job, last_update, remaining)
+
+	return Response(
+		stream_with_context(generate()),
+		mimetype="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+@containers_bp.route("/api/events", methods=["GET"])
+@authed_only
+@during_ctf_time_only
+@require_verified_emails
+def route_container_events():
+	user = get_current_user()
+	if not user:
+		return {"error": "user not found"}, 400
+	if is_team_mode() and not user.team:
+		return {"error": "user not a member of a team"}, 400
+
+	is_team = is_team_mode()
+	xid = user.team.id if is_team else user.id
+
+	# push the owner's container states, a snapshot first and then every change
+	# (created, ready, renewed, expired, killed) instead of clients polling view_info
+	notifier = current_app.container_manager.notifier
+	generate = notifier.stream(
+		owner_of(xid if is_team else None, xid),
+		lambda: owner_container_states(xid, is_team),
+	)
+
+	return Response(
+		stream_with_context(generate),
+		mimetype="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
 
 @containers_bp.route("/api/renew", methods=["POST"])
 @authed_only
@@ -0,0 +1,205 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from CTFd.models import db
+from .models import ContainerChallengeModel, ContainerPoolModel
+from .profiles import load_run_kwargs
+from .coordination import SharedState
+
+# number of pool containers started concurrently in the background
+POOL_WORKERS = 4
+
+
+class WarmPool:
+    # per-challenge pools of pre-started, unassigned containers. the pool itself
+    # lives in the container_pool table so every worker process shares it, rows are
+    # claimed with a conditional delete so two requests never get the same container.
+    def __init__(self, manager):
+        self.manager = manager
+        self.lock = threading.Lock()
+        self.refilling = set()
+        self.hits = {}  # challenge id -> count
+        self.misses = {}  # challenge id -> count
+        self.shared = SharedState(manager, "pool:")
+        self.executor = ThreadPoolExecutor(
+            max_workers=POOL_WORKERS, thread_name_prefix="container-pool"
+        )
+
+    def acquire(self, challenge_id: int):
+        # claim a ready container, returns (container_id, port, node) or None on a miss
+        candidates = (
+            db.session.query(
+                ContainerPoolModel.container_id, ContainerPoolModel.port, ContainerPoolModel.node
+            )
+            .filter_by(challenge_id=challenge_id)
+            .order_by(ContainerPoolModel.timestamp)
+            .all()
+        )
+
+        claimed = None
+        for container_id, port, node in candidates:
+            # dead containers are cleaned up by the event listener, skip them here,
+            # as well as containers on nodes that are currently unreachable
+            docker_node = self.manager.get_node(node)
+            if docker_node is None or not docker_node.is_available():
+                continue
+            if not self.manager.is_container_running(container_id, node=node):
+                continue
+            if self._claim(container_id):
+                claimed = (container_id, port, node)
+                break
+
+        with self.lock:
+            counter = self.hits if claimed else self.misses
+            counter[challenge_id] = counter.get(challenge_id, 0) + 1
+
+        self.refill_async(challenge_id)
+        return claimed
+
+    def _claim(self, container_id: str) -> bool:
+        deleted = ContainerPoolModel.query.filter_by(container_id=container_id).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        return deleted == 1
+
+    def refill_async(self, challenge_id: int):
+        # top up a challenge's pool in the background, one refill per challenge at a time
+        with self.lock:
+            if challenge_id in self.refilling:
+                return
+            self.refilling.add(challenge_id)
+
+        self.executor.submit(self._refill_task, challenge_id)
+
+    def _refill_task(self, challenge_id: int):
+        try:
+            with self.manager.app.app_context():
+                self.refill(challenge_id)
+        except Exception as e:
+            print(f"[container pool] could not refill pool for challenge {challenge_id}: {e}")
+        finally:
+            with self.lock:
+                self.refilling.discard(challenge_id)
+
+    def refill(self, challenge_id: int):
+        # bring the pool to the challenge's configured size, draining any excess
+        challenge = ContainerChallengeModel.query.filter_by(id=challenge_id).first()
+        target = (challenge.warm_pool_size or 0) if challenge else 0
+
+        pooled = (
+            db.session.query(ContainerPoolModel.container_id, ContainerPoolModel.node)
+            .filter_by(challenge_id=challenge_id)
+            .order_by(ContainerPoolModel.timestamp.desc())
+            .all()
+        )
+
+        if len(pooled) > target:
+            self._kill_claimed([(cid, node) for cid, node in pooled[target:] if self._claim(cid)])
+            return
+
+        if len(pooled) < target:
+            try:
+                run_kwargs = load_run_kwargs(challenge)
+            except ValueError as e:
+                print(f"[container pool] challenge {challenge_id} is misconfigured: {e}")
+                return
+
+        for _ in range(target - len(pooled)):
+            node = self.manager.choose_node(challenge.id)
+            container = self.manager.create_pool_container(
+                str(challenge.id),
+                challenge.image,
+                challenge.port,
+                challenge.command,
+                run_kwargs,
+                node=node,
+            )
+            db.session.add(
+                ContainerPoolModel(
+                    container_id=container.id,
+                    challenge_id=challenge.id,
+                    node=node,
+                    port=self.manager.get_container_port(container.id, node=node),
+                    timestamp=int(time.time()),
+                )
+            )
+            db.session.commit()
+
+    def refill_all(self):
+        # periodic job, tops up every configured pool and drains disabled ones
+        with self.manager.app.app_context():
+            challenge_ids = {
+                challenge_id
+                for (challenge_id,) in db.session.query(ContainerChallengeModel.id).filter(
+                    ContainerChallengeModel.warm_pool_size > 0
+                )
+            }
+            challenge_ids.update(
+                challenge_id
+                for (challenge_id,) in db.session.query(ContainerPoolModel.challenge_id).distinct()
+            )
+
+        for challenge_id in challenge_ids:
+            self.refill_async(challenge_id)
+
+    def reset(self, challenge_id: int):
+        # throw away a challenge's pooled containers (e.g. after its image changed)
+        # and start a fresh refill. the kills happen in the background.
+        claimed = [
+            (container_id, node)
+            for container_id, node in db.session.query(
+                ContainerPoolModel.container_id, ContainerPoolModel.node
+            )
+            .filter_by(challenge_id=challenge_id)
+            .all()
+            if self._claim(container_id)
+        ]
+        if claimed:
+            self.executor.submit(self._kill_claimed, claimed)
+        self.refill_async(challenge_id)
+
+    def _kill_claimed(self, containers: list):
+        # containers is a list of (container id, node name) pairs
+        try:
+            self.manager.kill_containers(containers)
+        except Exception as e:
+            print(f"[container pool] could not kill pooled containers: {e}")
+
+    def shared_state(self) -> dict:
+        # this worker's hit and miss counters, keyed by challenge id as a string
+        with self.lock:
+            return {
+                "hits": {str(challenge_id): count for challenge_id, count in self.hits.items()},
+                "misses": {str(challenge_id): count for challenge_id, count in self.misses.items()},
+            }
+
+    def publish(self):
+        self.shared.publish(self.shared_state())
+
+    def stats(self) -> dict:
+        # per-challenge ready count and hit/miss rates, summed over every worker
+        ready = dict(
+            db.session.query(ContainerPoolModel.challenge_id, db.func.count())
+            .group_by(ContainerPoolModel.challenge_id)
+            .all()
+        )
+
+        hits, misses = {}, {}
+        for state in self.shared.collect(self.shared_state()):
+            for totals, counts in ((hits, state.get("hits") or {}), (misses, state.get("misses") or {})):
+                for challenge_id, count in counts.items():
+                    totals[int(challenge_id)] = totals.get(int(challenge_id), 0) + count
+
+        stats = {}
+        for challenge_id in set(ready) | set(hits) | set(misses):
+            hit_count = hits.get(challenge_id, 0)
+            miss_count = misses.get(challenge_id, 0)
+            stats[challenge_id] = {
+                "ready": ready.get(challenge_id, 0),
+                "hits": hit_count,
+                "misses": miss_count,
+                "hit_rate": hit_count / (hit_count + miss_count) if hit_count + miss_count else None,
+            }
+        return stats